@@ -2,8 +2,6 @@
 NR-06 Operational Playground - Sistema Operacional para Equipamentos de Proteção Individual
 Casos de uso práticos baseados na Norma Regulamentadora 06
 """
-from agno.agent import Agent
-from agno.models.openai import OpenAIChat
 from agno.playground import Playground
 from agno.storage.sqlite import SqliteStorage
 from agno.knowledge.pdf import PDFKnowledgeBase
@@ -13,6 +11,10 @@ from agno.memory.v2.db.sqlite import SqliteMemoryDb
 from agno.memory.v2.memory import Memory
 from dotenv import load_dotenv
 
+from core.models import create_model
+from core.runtime import SafeBotAgent
+from core.telemetry import instrument_app
+
 load_dotenv()
 
 agent_storage: str = "tmp/agents.db"
@@ -31,7 +33,7 @@ vector_db = LanceDb(
 def create_agent_memory(agent_name: str, memory_description: str):
     """Cria memória específica para cada agente especializado"""
     return Memory(
-        model=OpenAIChat(id="gpt-4o-mini"),
+        model=create_model("gpt-4o-mini"),
         db=SqliteMemoryDb(
             table_name=f"{agent_name}_memories", 
             db_file="tmp/agent_memories.db"
@@ -62,9 +64,9 @@ pdf_knowledge_base = PDFKnowledgeBase(
 # =============================================================================
 
 # 1. AGENTE SELEÇÃO DE EPIs
-epi_selector = Agent(
+epi_selector = SafeBotAgent(
     name="🎯 Seletor de EPIs",
-    model=OpenAIChat(id="gpt-4o-mini"),
+    model=create_model("gpt-4o-mini"),
     knowledge=pdf_knowledge_base,
     search_knowledge=True,
     memory=create_agent_memory("epi_selector", "Memória de seleções de EPIs e padrões de risco"),
@@ -87,9 +89,9 @@ epi_selector = Agent(
 )
 
 # 2. AGENTE AUDITORIA DE CONFORMIDADE  
-audit_agent = Agent(
+audit_agent = SafeBotAgent(
     name="📋 Auditor NR-06",
-    model=OpenAIChat(id="gpt-4o-mini"),
+    model=create_model("gpt-4o-mini"),
     knowledge=pdf_knowledge_base,
     search_knowledge=True,
     memory=create_agent_memory("audit_agent", "Memória de auditorias, não conformidades e padrões por setor"),
@@ -112,9 +114,9 @@ audit_agent = Agent(
 )
 
 # 3. AGENTE TREINAMENTOS
-training_agent = Agent(
+training_agent = SafeBotAgent(
     name="🎓 Designer de Treinamentos",
-    model=OpenAIChat(id="gpt-4o-mini"),
+    model=create_model("gpt-4o-mini"),
     knowledge=pdf_knowledge_base,
     search_knowledge=True,
     memory=create_agent_memory("training_agent", "Memória de programas de treinamento e efetividade por cargo"),
@@ -137,9 +139,9 @@ training_agent = Agent(
 )
 
 # 4. AGENTE INVESTIGAÇÃO DE ACIDENTES
-incident_agent = Agent(
+incident_agent = SafeBotAgent(
     name="🔍 Investigador de Acidentes",
-    model=OpenAIChat(id="gpt-4o-mini"),
+    model=create_model("gpt-4o-mini"),
     knowledge=pdf_knowledge_base,
     search_knowledge=True,
     memory=create_agent_memory("incident_agent", "Memória de acidentes investigados e padrões de causas"),
@@ -162,9 +164,9 @@ incident_agent = Agent(
 )
 
 # 5. AGENTE CONSULTOR LEGAL
-legal_agent = Agent(
+legal_agent = SafeBotAgent(
     name="⚖️ Consultor Legal NR-06",
-    model=OpenAIChat(id="gpt-4o-mini"),
+    model=create_model("gpt-4o-mini"),
     knowledge=pdf_knowledge_base,
     search_knowledge=True,
     memory=create_agent_memory("legal_agent", "Memória de consultas legais e interpretações jurídicas"),
@@ -187,9 +189,9 @@ legal_agent = Agent(
 )
 
 # 6. AGENTE GERADOR DE PROCEDIMENTOS
-procedure_agent = Agent(
+procedure_agent = SafeBotAgent(
     name="📝 Gerador de POPs",
-    model=OpenAIChat(id="gpt-4o-mini"),
+    model=create_model("gpt-4o-mini"),
     knowledge=pdf_knowledge_base,
     search_knowledge=True,
     memory=create_agent_memory("procedure_agent", "Memória de procedimentos criados e melhores práticas"),
@@ -228,6 +230,8 @@ ALL_AGENTS = [
 
 playground_app = Playground(agents=ALL_AGENTS)
 app = playground_app.get_app()
+# /metrics no formato do Prometheus e medição das requisições
+instrument_app(app, "playground")
 
 def load_knowledge_base():
     """Carrega a base de conhecimento da NR-06 (executar uma vez)"""
@@ -1,7 +1,6 @@
 import os
 from typing import Optional, List
 from agno.agent import Agent
-from agno.models.openai import OpenAIChat
 from agno.knowledge.pdf import PDFKnowledgeBase
 from agno.vectordb.lancedb import LanceDb
 from agno.storage.sqlite import SqliteStorage
@@ -9,6 +8,11 @@ from agno.memory.v2.db.sqlite import SqliteMemoryDb
 from agno.memory.v2.memory import Memory
 from dotenv import load_dotenv
 
+from core.cascade import cascade_model
+from core.memory import RankedMemory
+from core.models import create_model
+from core.runtime import SafeBotAgent
+
 load_dotenv()
 
 class SafeBotFactory:
@@ -52,12 +56,12 @@ class SafeBotFactory:
         return self._knowledge_base
     
     def create_memory(self, agent_name: str, user_id: str, memory_db_file: str = None) -> Memory:
-        """Cria memória específica para um agente"""
+        """Cria memória específica para um agente (extração em background, leitura ranqueada)"""
         if memory_db_file is None:
             memory_db_file = f"{self.tmp_dir}/agent_memories.db"
             
-        return Memory(
-            model=OpenAIChat(id="gpt-4o-mini"),
+        return RankedMemory(
+            model=create_model("gpt-4o-mini"),
             db=SqliteMemoryDb(
                 table_name=f"{agent_name}_memory", 
                 db_file=memory_db_file
@@ -84,6 +88,8 @@ class SafeBotFactory:
         enable_knowledge: bool = True,
         memory_db_file: str = None,
         storage_db_file: str = None,
+        session_id: Optional[str] = None,
+        cascade_target: Optional[str] = None,
     ) -> Agent:
         """
         Cria um agente base com configurações padrão do SafeBot
@@ -98,11 +104,13 @@ class SafeBotFactory:
             enable_knowledge: Se deve habilitar knowledge base
             memory_db_file: Arquivo de banco para memória (opcional)
             storage_db_file: Arquivo de banco para storage (opcional)
+            session_id: Sessão a retomar do storage (opcional; padrão: nova sessão)
+            cascade_target: Tipo do agente para a cascata de modelos (SAFEBOT_CASCADE)
         """
         
         agent_config = {
             "name": name,
-            "model": OpenAIChat(id="gpt-4o-mini"),
+            "model": cascade_model(cascade_target, "gpt-4o-mini") if cascade_target else create_model("gpt-4o-mini"),
             "user_id": user_id,
             "instructions": instructions,
             "storage": self.create_storage(table_name, storage_db_file),
@@ -112,6 +120,9 @@ class SafeBotFactory:
             "markdown": True,
         }
         
+        if session_id:
+            agent_config["session_id"] = session_id
+        
         # Adicionar conhecimento se habilitado
         if enable_knowledge:
             agent_config["knowledge"] = self.knowledge_base
@@ -128,7 +139,7 @@ class SafeBotFactory:
         if tools:
             agent_config["tools"] = tools
         
-        return Agent(**agent_config)
+        return SafeBotAgent(**agent_config)
     
     def create_telegram_agent(
         self,
@@ -136,6 +147,7 @@ class SafeBotFactory:
         telegram_tools: List,
         custom_instructions: Optional[List[str]] = None,
         memory_db_file: str = None,
+        session_id: Optional[str] = None,
     ) -> Agent:
         """Cria agente otimizado para Telegram"""
         
@@ -209,6 +221,8 @@ class SafeBotFactory:
             tools=telegram_tools,
             memory_db_file=memory_db_file or f"{self.tmp_dir}/telegram_memory.db",
             storage_db_file=f"{self.tmp_dir}/telegram_sessions.db",
+            session_id=session_id,
+            cascade_target="telegram",
         )
     
     def create_web_agent(
@@ -296,6 +310,7 @@ class SafeBotFactory:
             user_id=f"{agent_type}_web_user",
             instructions=instructions,
             table_name=f"{agent_type}_web",
+            cascade_target=f"web.{agent_type}",
         )
     
     def load_knowledge_base(self, recreate: bool = False):
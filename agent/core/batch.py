@@ -0,0 +1,387 @@
+"""
+SafeBot Batch - Processamento em lote de auditorias, checklists e POPs
+Lê entradas de um CSV ou JSONL e executa cada uma em um agente web
+(create_web_agent) ou em um team, com concorrência limitada, novas tentativas
+e retomada: o próprio JSONL de saída é o checkpoint, e itens já concluídos
+não são refeitos. Opcionalmente envia o lote pela Batch API da OpenAI (custo
+menor, resultado em até 24h), com os trechos da NR-06 buscados localmente.
+"""
+import os
+import csv
+import json
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from core.deadline import Deadline, deadline_scope
+from core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+metrics.describe("safebot_batch_items_total", "Itens processados em lote por alvo e status")
+
+AGENT_TYPES = ("epi_selector", "auditor", "trainer", "investigator", "legal", "procedure", "general")
+TEAM_BUILDERS = {
+    "quick": "create_quick_consultation_team",
+    "comprehensive": "create_comprehensive_safety_team",
+    "research": "create_collaborative_research_team",
+}
+PROMPT_FIELDS = ("prompt", "input", "pergunta")
+BATCH_USER = "batch"
+TERMINAL_BATCH_STATUS = ("completed", "failed", "expired", "cancelled")
+
+
+@dataclass
+class BatchItem:
+    id: str
+    prompt: Optional[str]
+    record: Dict[str, Any]
+    error: Optional[str] = None  # Entrada inválida (ex.: campo do template ausente)
+
+
+@dataclass
+class BatchReport:
+    """Resultado consolidado de um lote"""
+
+    target: str
+    output_path: str
+    total: int = 0
+    skipped: int = 0
+    ok: int = 0
+    failed: int = 0
+    seconds: float = 0.0
+    submitted_batch: Optional[str] = None
+    errors: List[str] = field(default_factory=list)
+
+    def print_summary(self):
+        """Mostra o resumo do lote no terminal"""
+        print("📦 SAFEBOT - PROCESSAMENTO EM LOTE")
+        print("=" * 60)
+        print(f"🎯 Alvo: {self.target}")
+        print(f"📥 Itens: {self.total} ({self.skipped} já concluídos em execuções anteriores)")
+        if self.submitted_batch:
+            print(f"🕓 Lote enviado à Batch API: {self.submitted_batch} (rode o mesmo comando para coletar)")
+        print(f"✅ Concluídos: {self.ok}")
+        print(f"❌ Com erro: {self.failed}")
+        print(f"⏱️ Duração: {self.seconds:.1f}s")
+        print(f"📄 Resultados: {self.output_path}")
+        for error in self.errors[:10]:
+            print(f"  • {error}")
+
+
+def parse_target(target: str) -> Tuple[str, str]:
+    """'agent:<tipo>' ou 'team:<quick|comprehensive|research>' (sem prefixo: agente)"""
+    kind, _, name = target.partition(":") if ":" in target else ("agent", "", target)
+    if kind == "agent" and name in AGENT_TYPES:
+        return kind, name
+    if kind == "team" and name in TEAM_BUILDERS:
+        return kind, name
+    raise ValueError(
+        f"Alvo inválido: {target} (agentes: {', '.join(AGENT_TYPES)}; teams: {', '.join('team:' + t for t in TEAM_BUILDERS)})"
+    )
+
+
+def load_items(path: str, template: Optional[str] = None) -> List[BatchItem]:
+    """Entradas do CSV (cabeçalho) ou JSONL; o prompt vem do template ou das colunas prompt/input/pergunta"""
+    with open(path, encoding="utf-8", newline="") as f:
+        if path.endswith(".csv"):
+            records: List[Dict[str, Any]] = list(csv.DictReader(f))
+        else:
+            records = [json.loads(line) for line in f if line.strip()]
+
+    items = []
+    for number, record in enumerate(records, 1):
+        item_id = str(record.get("id") or number)
+        try:
+            if template:
+                prompt = template.format(**record)
+            else:
+                prompt = next(str(record[name]) for name in PROMPT_FIELDS if record.get(name))
+            items.append(BatchItem(item_id, prompt.strip(), record))
+        except (KeyError, StopIteration) as e:
+            items.append(BatchItem(item_id, None, record, error=f"entrada sem campo {e or 'de prompt'}"))
+    return items
+
+
+def completed_ids(output_path: str) -> Set[str]:
+    """Ids já concluídos no JSONL de saída (vale a última linha de cada id)"""
+    status: Dict[str, str] = {}
+    if os.path.exists(output_path):
+        with open(output_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    result = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # Linha truncada por uma interrupção
+                status[str(result.get("id"))] = result.get("status")
+    return {item_id for item_id, value in status.items() if value == "ok"}
+
+
+class ResultWriter:
+    """Grava um resultado por linha, com flush imediato (checkpoint)"""
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def write(self, result: Dict[str, Any]):
+        with self._lock:
+            self._file.write(json.dumps(result, ensure_ascii=False) + "\n")
+            self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def create_runner(target: str) -> Callable[[str, str], str]:
+    """Executor de um prompt no alvo (uma instância por thread: o agno guarda estado da execução)"""
+    kind, name = parse_target(target)
+    if kind == "agent":
+        from core.agent import create_web_agent
+
+        agent = create_web_agent(name)
+        agent.enable_user_memories = False  # Lotes não alimentam a memória do usuário web
+
+        def run_agent(prompt: str, session_id: str) -> str:
+            return agent.run(prompt, session_id=session_id, user_id=BATCH_USER).content
+
+        return run_agent
+
+    from core.teams import SafeBotTeamsFactory
+
+    team = getattr(SafeBotTeamsFactory(), TEAM_BUILDERS[name])()
+
+    def run_team(prompt: str, session_id: str) -> str:
+        return team.run(prompt, session_id=session_id, user_id=BATCH_USER).content
+
+    return run_team
+
+
+class BatchRunner:
+    """Executa as entradas com concorrência limitada, novas tentativas e retomada"""
+
+    def __init__(
+        self,
+        target: str,
+        concurrency: Optional[int] = None,
+        retries: Optional[int] = None,
+        item_timeout: Optional[float] = None,
+        runner_factory: Callable[[str], Callable[[str, str], str]] = create_runner,
+    ):
+        parse_target(target)
+        self.target = target
+        self.concurrency = concurrency or int(os.getenv("SAFEBOT_BATCH_CONCURRENCY", "4"))
+        self.retries = retries if retries is not None else int(os.getenv("SAFEBOT_BATCH_RETRIES", "2"))
+        self.item_timeout = item_timeout or float(os.getenv("SAFEBOT_BATCH_ITEM_TIMEOUT_SECONDS", "300"))
+        self.runner_factory = runner_factory
+        self.job = f"batch-{int(time.time())}"
+        self._local = threading.local()
+
+    def _runner(self) -> Callable[[str, str], str]:
+        if getattr(self._local, "runner", None) is None:
+            self._local.runner = self.runner_factory(self.target)
+        return self._local.runner
+
+    def process(self, item: BatchItem) -> Dict[str, Any]:
+        started = time.monotonic()
+        result: Dict[str, Any] = {"id": item.id, "target": self.target, "input": item.prompt}
+        if item.error:
+            return dict(result, status="error", error=item.error, attempts=0, seconds=0.0)
+
+        error = None
+        for attempt in range(1, self.retries + 2):
+            try:
+                with deadline_scope(Deadline(self.item_timeout, source="batch")):
+                    output = self._runner()(item.prompt, f"{self.job}-{item.id}-{attempt}")
+                if not output or not str(output).strip():
+                    raise ValueError("resposta vazia")
+                return dict(result, status="ok", output=output, attempts=attempt, seconds=round(time.monotonic() - started, 2))
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                logger.warning(f"Lote {self.target}: item {item.id} falhou (tentativa {attempt}): {error}")
+                self._local.runner = None  # Instância possivelmente inconsistente após o erro
+                if attempt <= self.retries:
+                    time.sleep(min(2 ** attempt, 30))
+        return dict(result, status="error", error=error, attempts=self.retries + 1, seconds=round(time.monotonic() - started, 2))
+
+    def run(self, items: Iterable[BatchItem], output_path: str) -> BatchReport:
+        started = time.monotonic()
+        items = list(items)
+        done = completed_ids(output_path)
+        pending = [item for item in items if item.id not in done]
+        report = BatchReport(self.target, output_path, total=len(items), skipped=len(items) - len(pending))
+
+        writer = ResultWriter(output_path)
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="safebot-batch") as executor:
+                futures = [executor.submit(self.process, item) for item in pending]
+                for number, future in enumerate(as_completed(futures), 1):
+                    result = future.result()
+                    writer.write(result)
+                    metrics.inc("safebot_batch_items_total", target=self.target, status=result["status"])
+                    if result["status"] == "ok":
+                        report.ok += 1
+                    else:
+                        report.failed += 1
+                        report.errors.append(f"{result['id']}: {result['error']}")
+                    print(f"{'✅' if result['status'] == 'ok' else '❌'} [{number}/{len(pending)}] {result['id']}")
+        finally:
+            writer.close()
+        report.seconds = time.monotonic() - started
+        return report
+
+
+# ============================================================================
+# BATCH API DA OPENAI
+# ============================================================================
+
+class OpenAIBatchSubmitter:
+    """
+    Envia as entradas como um lote da Batch API da OpenAI e coleta os resultados
+
+    A Batch API não executa ferramentas: cada requisição leva o system prompt
+    estático do agente e os trechos da NR-06 buscados localmente. O id do lote
+    fica em <saida>.batch.json; repetir o comando coleta em vez de reenviar.
+    Só agentes (teams dependem de várias chamadas encadeadas).
+    """
+
+    def __init__(self, target: str, num_documents: int = 3, client: Any = None):
+        kind, name = parse_target(target)
+        if kind != "agent":
+            raise ValueError("A Batch API só atende agentes (teams usam várias chamadas encadeadas)")
+        from core.agent import create_web_agent, safebot_factory
+
+        self.target = target
+        self.agent = create_web_agent(name)
+        self.model_id = os.getenv("SAFEBOT_BATCH_MODEL", self.agent.model.id)
+        if self.model_id.startswith("claude"):
+            raise ValueError(f"Batch API da OpenAI não atende o modelo {self.model_id} (SAFEBOT_BATCH_MODEL)")
+        self.knowledge = safebot_factory.knowledge_base
+        self.num_documents = num_documents
+        if client is None:
+            from openai import OpenAI
+
+            from core.models import http_client
+
+            client = OpenAI(http_client=http_client("openai"))
+        self.client = client
+
+    def _references(self, prompt: str) -> str:
+        try:
+            documents = self.knowledge.search(query=prompt, num_documents=self.num_documents) or []
+        except Exception as e:
+            logger.warning(f"Busca na base falhou para o lote: {e}")
+            return ""
+        return "\n\n".join(doc.content for doc in documents if getattr(doc, "content", None))
+
+    def request(self, item: BatchItem, system_prompt: str) -> Dict[str, Any]:
+        references = self._references(item.prompt)
+        user = f"{item.prompt}\n\nTrechos da NR-06 para fundamentar a resposta:\n{references}" if references else item.prompt
+        return {
+            "custom_id": item.id,
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {
+                "model": self.model_id,
+                "messages": [{"role": "system", "content": system_prompt}, {"role": "user", "content": user}],
+            },
+        }
+
+    def submit(self, items: List[BatchItem], state_path: str) -> str:
+        system_message = self.agent.get_system_message(session_id=BATCH_USER)
+        system_prompt = system_message.content if system_message is not None else ""
+        lines = [json.dumps(self.request(item, system_prompt), ensure_ascii=False) for item in items]
+        uploaded = self.client.files.create(file=("safebot_batch.jsonl", "\n".join(lines).encode("utf-8")), purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=uploaded.id, endpoint="/v1/chat/completions", completion_window="24h"
+        )
+        with open(state_path, "w", encoding="utf-8") as f:
+            json.dump({"batch_id": batch.id, "target": self.target, "model": self.model_id, "ids": [i.id for i in items]}, f)
+        return batch.id
+
+    def collect(self, batch_id: str, items: Dict[str, BatchItem], writer: ResultWriter, report: BatchReport) -> Optional[str]:
+        """Grava os resultados se o lote terminou; devolve o status atual"""
+        batch = self.client.batches.retrieve(batch_id)
+        if batch.status not in TERMINAL_BATCH_STATUS:
+            return batch.status
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            for line in self.client.files.content(file_id).text.splitlines():
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                item = items.get(entry["custom_id"])
+                result: Dict[str, Any] = {"id": entry["custom_id"], "target": self.target, "input": item.prompt if item else None, "batch_id": batch_id}
+                response = entry.get("response") or {}
+                if response.get("status_code") == 200:
+                    result.update(status="ok", output=response["body"]["choices"][0]["message"]["content"])
+                    report.ok += 1
+                else:
+                    result.update(status="error", error=json.dumps(entry.get("error") or response.get("body"), ensure_ascii=False))
+                    report.failed += 1
+                    report.errors.append(f"{result['id']}: {result['error']}")
+                writer.write(result)
+                metrics.inc("safebot_batch_items_total", target=self.target, status=result["status"])
+        return batch.status
+
+    def run(self, items: List[BatchItem], output_path: str, wait: bool = False, poll_seconds: float = 30.0) -> BatchReport:
+        started = time.monotonic()
+        state_path = f"{output_path}.batch.json"
+        done = completed_ids(output_path)
+        pending = [item for item in items if item.id not in done and item.prompt]
+        report = BatchReport(self.target, output_path, total=len(items), skipped=len(items) - len(pending))
+
+        writer = ResultWriter(output_path)
+        try:
+            for item in items:
+                if item.error and item.id not in done:
+                    writer.write({"id": item.id, "target": self.target, "input": None, "status": "error", "error": item.error})
+                    report.failed += 1
+            if os.path.exists(state_path):
+                with open(state_path, encoding="utf-8") as f:
+                    batch_id = json.load(f)["batch_id"]
+            elif pending:
+                batch_id = self.submit(pending, state_path)
+                print(f"🚀 Lote enviado à Batch API: {batch_id} ({len(pending)} itens)")
+            else:
+                batch_id = None
+
+            while batch_id:
+                status = self.collect(batch_id, {item.id: item for item in items}, writer, report)
+                if status in TERMINAL_BATCH_STATUS:
+                    os.remove(state_path)
+                    print(f"📬 Lote {batch_id}: {status}")
+                    break
+                if not wait:
+                    report.submitted_batch = f"{batch_id} ({status})"
+                    break
+                time.sleep(poll_seconds)
+        finally:
+            writer.close()
+        report.seconds = time.monotonic() - started
+        return report
+
+
+def run_batch(
+    input_path: str,
+    target: str = "agent:general",
+    output_path: Optional[str] = None,
+    template: Optional[str] = None,
+    concurrency: Optional[int] = None,
+    retries: Optional[int] = None,
+    provider_batch: bool = False,
+    wait: bool = False,
+) -> BatchReport:
+    """Função de conveniência: processa um arquivo de entradas e grava os resultados em JSONL"""
+    output_path = output_path or f"{os.path.splitext(input_path)[0]}.results.jsonl"
+    items = load_items(input_path, template)
+    if provider_batch:
+        return OpenAIBatchSubmitter(target).run(items, output_path, wait=wait)
+    return BatchRunner(target, concurrency=concurrency, retries=retries).run(items, output_path)
@@ -0,0 +1,273 @@
+"""
+SafeBot Cascade - Resposta com o modelo mais barato primeiro
+O modelo barato responde; uma verificação heurística (resposta evasiva ou pouco
+apoiada no que a busca e os especialistas retornaram) decide se a resposta é
+fraca. Só então o modelo maior responde, reaproveitando as ferramentas já
+executadas (busca na base, delegações) em vez de refazê-las.
+
+Configuração por tipo de agente ou team em SAFEBOT_CASCADE, por exemplo:
+    telegram=gpt-4o-mini>gpt-4o,quick=gpt-4o-mini>gpt-4o,comprehensive=gpt-4o>claude-3-5-sonnet-20241022
+"""
+import os
+import re
+import time
+import logging
+from typing import Any, AsyncIterator, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from agno.models.base import Model
+from agno.models.message import Message
+from agno.models.response import ModelResponse, ModelResponseEvent
+
+from core.metrics import metrics
+from core.models import create_model
+from core.resilience import hedge_delay
+from core.router import features
+
+logger = logging.getLogger(__name__)
+
+metrics.describe("safebot_cascade_total", "Respostas em cascata por alvo e resultado (accepted/escalated)")
+metrics.describe("safebot_cascade_seconds", "Duração das respostas por modelo na cascata")
+metrics.describe("safebot_cascade_cost_saved_usd_total", "Custo economizado pelas respostas aceitas do modelo barato")
+metrics.describe("safebot_cascade_cost_wasted_usd_total", "Custo das tentativas do modelo barato descartadas")
+metrics.describe("safebot_cascade_latency_saved_seconds_total", "Latência economizada pelas respostas aceitas do modelo barato")
+
+# Preço (US$ por 1M tokens de entrada, de saída)
+MODEL_PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1": (2.00, 8.00),
+    "claude-3-5-haiku-20241022": (0.80, 4.00),
+    "claude-3-5-sonnet-20241022": (3.00, 15.00),
+}
+
+# Respostas evasivas (autoverificação sem nova chamada ao modelo): só quando a
+# resposta abre com a recusa, opcionalmente após "desculpe,"/"infelizmente," etc.
+# ("infelizmente a NR-06 não permite..." é uma resposta, não uma recusa)
+HEDGES = re.compile(
+    r"\W*(?:(?:desculpe|lamento|sinto muito|infelizmente)\b[^.!?\n]{0,40}?)?(?:eu\s+|ainda\s+)?"
+    r"(?:n[aã]o (?:sei|tenho (?:certeza|informa[cç][oõ]es)|encontrei|consegui|foi poss[ií]vel|h[aá] informa[cç][oõ]es)"
+    r"|sem informa[cç][oõ]es suficientes|i (?:don't|do not) know|no documents found)",
+    re.IGNORECASE,
+)
+EMPTY_RESULTS = ("No documents found", "No response from the member agent.")
+
+ASSISTANT_CONTENT = ModelResponseEvent.assistant_response.value
+
+
+class Verdict(NamedTuple):
+    weak: bool
+    reason: str
+    coverage: Optional[float]
+
+
+def model_cost(model_id: str, input_tokens: int, output_tokens: int) -> Optional[float]:
+    price = MODEL_PRICES.get(model_id)
+    if price is None:
+        return None
+    return (input_tokens * price[0] + output_tokens * price[1]) / 1_000_000
+
+
+def parse_cascade_config(raw: Optional[str] = None) -> Dict[str, Tuple[str, str]]:
+    """'alvo=barato>maior,...' -> {alvo: (barato, maior)}"""
+    raw = os.getenv("SAFEBOT_CASCADE", "") if raw is None else raw
+    config = {}
+    for item in raw.split(","):
+        if "=" not in item or ">" not in item:
+            continue
+        target, models = item.split("=", 1)
+        cheap, strong = models.split(">", 1)
+        config[target.strip()] = (cheap.strip(), strong.strip())
+    return config
+
+
+def judge_answer(messages: List[Message], start: int, min_coverage: float) -> Verdict:
+    """
+    Decide se a resposta do modelo barato é fraca
+
+    Fraca quando está vazia, é evasiva, quando a busca/delegação não retornou
+    nada ou quando os termos da pergunta quase não aparecem no material obtido.
+    """
+    if len(messages) > start and messages[-1].role == "tool":
+        # Execução encerrada pela ferramenta (ex.: encaminhamento no modo route)
+        return Verdict(False, "ferramenta final", None)
+    answer = messages[-1].get_content_string() if len(messages) > start and messages[-1].role == "assistant" else ""
+    if not answer.strip():
+        return Verdict(True, "vazia", None)
+    if HEDGES.match(answer):
+        return Verdict(True, "evasiva", None)
+
+    evidence = [m.get_content_string() for m in messages[start:] if m.role == "tool"]
+    if not evidence:
+        return Verdict(False, "sem ferramentas", None)
+    if all(text.strip() in EMPTY_RESULTS or not text.strip() for text in evidence):
+        return Verdict(True, "busca vazia", 0.0)
+
+    question = next((m.get_content_string() for m in reversed(messages[:start]) if m.role == "user"), "")
+    terms = set(features(question))
+    if not terms:
+        return Verdict(False, "ok", None)
+    found = set(features(" ".join(evidence)))
+    coverage = len(terms & found) / len(terms)
+    if coverage < min_coverage:
+        return Verdict(True, "cobertura baixa", round(coverage, 3))
+    return Verdict(False, "ok", round(coverage, 3))
+
+
+def _usage(messages: List[Message]) -> Tuple[int, int]:
+    assistant = [m for m in messages if m.role == "assistant" and m.metrics is not None]
+    return sum(m.metrics.input_tokens for m in assistant), sum(m.metrics.output_tokens for m in assistant)
+
+
+def _drop_final_answer(messages: List[Message], start: int):
+    """Remove a resposta final do modelo barato, mantendo chamadas e resultados de ferramentas"""
+    if len(messages) > start and messages[-1].role == "assistant" and not messages[-1].tool_calls:
+        messages.pop()
+
+
+class ModelCascade:
+    """Liga um modelo barato a um maior para um alvo (tipo de agente ou team)"""
+
+    def __init__(self, target: str, cheap: Model, strong: Model, min_coverage: Optional[float] = None):
+        self.target = target
+        self.cheap = cheap
+        self.strong = strong
+        self.min_coverage = min_coverage if min_coverage is not None else float(os.getenv("SAFEBOT_CASCADE_MIN_COVERAGE", "0.5"))
+
+    def install(self) -> Model:
+        """Envolve os métodos de resposta do modelo barato e o devolve para o agente/team"""
+        cheap = self.cheap
+        if getattr(cheap, "_safebot_cascade", None) is not None:
+            return cheap
+        response, response_stream = cheap.response, cheap.response_stream
+        aresponse, aresponse_stream = cheap.aresponse, cheap.aresponse_stream
+
+        def cascading_response(messages: List[Message], *args, **kwargs) -> ModelResponse:
+            start, started = len(messages), time.monotonic()
+            attempt = response(messages, *args, **kwargs)
+            if not self._escalate(messages, start, started):
+                return attempt
+            started = time.monotonic()
+            result = self.strong.response(messages, *args, **kwargs)
+            self._strong_done(started)
+            return _merge_tools(attempt, result)
+
+        def cascading_response_stream(messages: List[Message], *args, stream_model_response: bool = True, **kwargs) -> Iterator[Any]:
+            # A tentativa barata é acumulada para ser verificada antes de chegar ao usuário
+            start, started = len(messages), time.monotonic()
+            buffered = list(response_stream(messages, *args, stream_model_response=False, **kwargs))
+            if not self._escalate(messages, start, started):
+                yield from buffered
+                return
+            yield from (event for event in buffered if not _is_content(event))
+            started = time.monotonic()
+            yield from self.strong.response_stream(messages, *args, stream_model_response=stream_model_response, **kwargs)
+            self._strong_done(started)
+
+        async def cascading_aresponse(messages: List[Message], *args, **kwargs) -> ModelResponse:
+            start, started = len(messages), time.monotonic()
+            attempt = await aresponse(messages, *args, **kwargs)
+            if not self._escalate(messages, start, started):
+                return attempt
+            started = time.monotonic()
+            result = await self.strong.aresponse(messages, *args, **kwargs)
+            self._strong_done(started)
+            return _merge_tools(attempt, result)
+
+        async def cascading_aresponse_stream(messages: List[Message], *args, stream_model_response: bool = True, **kwargs) -> AsyncIterator[Any]:
+            start, started = len(messages), time.monotonic()
+            buffered = [event async for event in aresponse_stream(messages, *args, stream_model_response=False, **kwargs)]
+            if not self._escalate(messages, start, started):
+                for event in buffered:
+                    yield event
+                return
+            for event in buffered:
+                if not _is_content(event):
+                    yield event
+            started = time.monotonic()
+            async for event in self.strong.aresponse_stream(messages, *args, stream_model_response=stream_model_response, **kwargs):
+                yield event
+            self._strong_done(started)
+
+        cheap.response = cascading_response
+        cheap.response_stream = cascading_response_stream
+        cheap.aresponse = cascading_aresponse
+        cheap.aresponse_stream = cascading_aresponse_stream
+        cheap._safebot_cascade = self
+        return cheap
+
+    def _escalate(self, messages: List[Message], start: int, started: float) -> bool:
+        """Avalia a tentativa barata, registra métricas e prepara a escalada se necessário"""
+        elapsed = time.monotonic() - started
+        metrics.observe("safebot_cascade_seconds", elapsed, model=self.cheap.id)
+        verdict = judge_answer(messages, start, self.min_coverage)
+        input_tokens, output_tokens = _usage(messages[start:])
+        cheap_cost = model_cost(self.cheap.id, input_tokens, output_tokens)
+
+        if not verdict.weak:
+            metrics.inc("safebot_cascade_total", target=self.target, outcome="accepted")
+            strong_cost = model_cost(self.strong.id, input_tokens, output_tokens)
+            if cheap_cost is not None and strong_cost is not None:
+                metrics.inc("safebot_cascade_cost_saved_usd_total", strong_cost - cheap_cost, target=self.target)
+            strong_latency = metrics.get_histogram("safebot_cascade_seconds", model=self.strong.id)
+            if strong_latency is not None and strong_latency.mean > elapsed:
+                metrics.inc("safebot_cascade_latency_saved_seconds_total", strong_latency.mean - elapsed, target=self.target)
+            return False
+
+        metrics.inc("safebot_cascade_total", target=self.target, outcome="escalated")
+        if cheap_cost is not None:
+            metrics.inc("safebot_cascade_cost_wasted_usd_total", cheap_cost, target=self.target)
+        logger.info(f"Cascata {self.target}: {self.cheap.id} -> {self.strong.id} ({verdict.reason}, cobertura={verdict.coverage})")
+        _drop_final_answer(messages, start)
+        return True
+
+    def _strong_done(self, started: float):
+        metrics.observe("safebot_cascade_seconds", time.monotonic() - started, model=self.strong.id)
+
+
+def _merge_tools(attempt: ModelResponse, result: ModelResponse) -> ModelResponse:
+    """Ferramentas executadas na tentativa barata continuam no resultado da escalada"""
+    if attempt.tool_executions:
+        result.tool_executions = attempt.tool_executions + (result.tool_executions or [])
+    return result
+
+
+def _is_content(event: Any) -> bool:
+    return isinstance(event, ModelResponse) and event.event == ASSISTANT_CONTENT and bool(event.content)
+
+
+def cascade_model(target: str, default_id: str) -> Model:
+    """
+    Modelo para o alvo: o padrão, ou o barato com escalada se o alvo estiver em SAFEBOT_CASCADE
+
+    Alvos com ponto herdam a configuração do prefixo ("web.auditor" usa "web" se
+    não houver entrada própria). O hedging do alvo vem de SAFEBOT_HEDGE.
+    """
+    config = parse_cascade_config()
+    hedge_after = hedge_delay(target)
+    parts = target.split(".")
+    for size in range(len(parts), 0, -1):
+        key = ".".join(parts[:size])
+        if key in config:
+            cheap_id, strong_id = config[key]
+            return ModelCascade(key, create_model(cheap_id, hedge_after), create_model(strong_id, hedge_after)).install()
+    return create_model(default_id, hedge_after)
+
+
+def cascade_stats() -> Dict[str, Dict[str, Any]]:
+    """Taxa de escalada, custo e latência economizados por alvo"""
+    stats = {}
+    for target in parse_cascade_config():
+        accepted = metrics.get_counter("safebot_cascade_total", target=target, outcome="accepted")
+        escalated = metrics.get_counter("safebot_cascade_total", target=target, outcome="escalated")
+        total = accepted + escalated
+        stats[target] = {
+            "answers": int(total),
+            "escalation_rate": round(escalated / total, 4) if total else None,
+            "cost_saved_usd": round(
+                metrics.get_counter("safebot_cascade_cost_saved_usd_total", target=target)
+                - metrics.get_counter("safebot_cascade_cost_wasted_usd_total", target=target), 6
+            ),
+            "latency_saved_seconds": round(metrics.get_counter("safebot_cascade_latency_saved_seconds_total", target=target), 3),
+        }
+    return stats
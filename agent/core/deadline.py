@@ -0,0 +1,218 @@
+"""
+SafeBot Deadline - Prazo e cancelamento de ponta a ponta
+Cada requisição (web, Telegram) recebe um prazo que acompanha a execução por
+contextvars: líder do team, membros, busca na base, ferramentas e extração de
+memória consultam o mesmo objeto e param quando o prazo acaba, o cliente
+desconecta ou o usuário desiste.
+"""
+import os
+import time
+import asyncio
+import inspect
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from agno.exceptions import StopAgentRun
+
+from core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+metrics.describe("safebot_cancelled_runs_total", "Execuções interrompidas por origem e motivo (deadline/disconnect/superseded/user)")
+
+
+class DeadlineExceeded(Exception):
+    """A execução passou do prazo ou foi cancelada"""
+
+    def __init__(self, reason: str):
+        super().__init__(f"execução interrompida ({reason})")
+        self.reason = reason
+
+
+class Deadline:
+    """Prazo de uma requisição, com cancelamento explícito"""
+
+    def __init__(self, seconds: float, source: str = "app", cancelled: Optional[threading.Event] = None):
+        self.source = source
+        self.expires_at = time.monotonic() + seconds
+        # Evento compartilhável: quem já tem um (ex.: execução do coalescer) cancela por ele
+        self._cancelled = cancelled or threading.Event()
+        self._reason: Optional[str] = None
+        self._recorded = False
+        self._lock = threading.Lock()
+
+    def remaining(self) -> float:
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    def bound(self, timeout: float) -> float:
+        """Limita um timeout local ao tempo restante da requisição"""
+        return min(timeout, self.remaining())
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    @property
+    def done(self) -> bool:
+        return self.cancelled or time.monotonic() >= self.expires_at
+
+    @property
+    def reason(self) -> Optional[str]:
+        if self._reason is not None:
+            return self._reason
+        if self.cancelled:
+            return "superseded"
+        return "deadline" if time.monotonic() >= self.expires_at else None
+
+    def cancel(self, reason: str = "user"):
+        with self._lock:
+            if self._reason is None and not self.cancelled:
+                self._reason = reason
+        self._cancelled.set()
+
+    def record(self) -> str:
+        """Conta a interrupção uma única vez por requisição e devolve o motivo"""
+        reason = self.reason or "deadline"
+        with self._lock:
+            if self._recorded:
+                return reason
+            self._recorded = True
+        metrics.inc("safebot_cancelled_runs_total", source=self.source, reason=reason)
+        logger.info(f"Execução interrompida ({self.source}: {reason})")
+        return reason
+
+    def check(self):
+        """Levanta DeadlineExceeded se o prazo acabou ou a execução foi cancelada"""
+        if self.done:
+            raise DeadlineExceeded(self.record())
+
+
+_current: "contextvars.ContextVar[Optional[Deadline]]" = contextvars.ContextVar("safebot_deadline", default=None)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current.get()
+
+
+@contextmanager
+def deadline_scope(deadline: Optional[Deadline]) -> Iterator[Optional[Deadline]]:
+    """Torna o prazo visível para tudo que rodar neste contexto (e nas threads que o copiarem)"""
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+
+def check_deadline():
+    deadline = _current.get()
+    if deadline is not None:
+        deadline.check()
+
+
+def run_abandoned() -> bool:
+    """Se a resposta da execução atual não vai ser entregue (prazo encerrado, substituída ou cancelada)"""
+    deadline = _current.get()
+    return deadline is not None and deadline.done
+
+
+def bounded(timeout: float) -> float:
+    """Timeout local limitado ao prazo da requisição atual, se houver"""
+    deadline = _current.get()
+    return deadline.bound(timeout) if deadline is not None else timeout
+
+
+def run_in_context(func: Callable[..., Any]) -> Callable[..., Any]:
+    """Função que roda com os contextvars atuais (para submeter a thread pools)"""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(func, *args, **kwargs)
+
+
+def _stop_if_done():
+    deadline = _current.get()
+    if deadline is not None and deadline.done:
+        reason = deadline.record()
+        raise StopAgentRun(
+            f"Execução interrompida ({reason})",
+            agent_message="⏱️ Execução interrompida antes de concluir.",
+        )
+
+
+def deadline_tool_hook(function_name: str, function_call: Callable, arguments: Dict[str, Any]):
+    """Hook de ferramentas do agno: encerra a execução em vez de chamar a ferramenta após o prazo"""
+    _stop_if_done()
+    return function_call(**arguments)
+
+
+async def adeadline_tool_hook(function_name: str, function_call: Callable, arguments: Dict[str, Any]):
+    """Versão assíncrona do hook (o agno não aguarda o resultado de hooks síncronos em arun)"""
+    _stop_if_done()
+    result = function_call(**arguments)
+    return await result if inspect.isawaitable(result) else result
+
+
+def with_deadline_hook(function_calls: List[Any], asynchronous: bool = False) -> List[Any]:
+    """
+    Põe o hook do prazo na frente das ferramentas de cada chamada, na versão do
+    modo de execução (o agno ignora hooks assíncronos no run e não aguarda os
+    síncronos no arun). Cada chamada recebe uma cópia da função: a do
+    agente/team é compartilhada entre execuções simultâneas.
+    """
+    hook = adeadline_tool_hook if asynchronous else deadline_tool_hook
+    for call in function_calls:
+        hooks = [h for h in call.function.tool_hooks or [] if h not in (deadline_tool_hook, adeadline_tool_hook)]
+        call.function = call.function.model_copy(update={"tool_hooks": [hook] + hooks})
+    return function_calls
+
+
+def request_deadline_seconds(source: str) -> float:
+    """Prazo padrão por origem (SAFEBOT_WEB_DEADLINE_SECONDS, SAFEBOT_TELEGRAM_DEADLINE_SECONDS)"""
+    defaults = {"web": "115", "telegram": "120"}
+    return float(os.getenv(f"SAFEBOT_{source.upper()}_DEADLINE_SECONDS", defaults.get(source, "120")))
+
+
+class DeadlineMiddleware:
+    """
+    Middleware ASGI: prazo por requisição HTTP (abaixo do proxy_read_timeout do
+    nginx) e cancelamento quando o cliente desconecta
+    """
+
+    def __init__(self, app, seconds: Optional[float] = None):
+        self.app = app
+        self.seconds = seconds if seconds is not None else request_deadline_seconds("web")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        deadline = Deadline(self.seconds, source="web")
+        response_started = False
+
+        async def watched_receive():
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                deadline.cancel("disconnect")
+            return message
+
+        async def tracked_send(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        with deadline_scope(deadline):
+            try:
+                await asyncio.wait_for(self.app(scope, watched_receive, tracked_send), timeout=self.seconds)
+            except asyncio.TimeoutError:
+                deadline.record()
+                if not response_started:
+                    await send({"type": "http.response.start", "status": 504, "headers": [(b"content-type", b"application/json")]})
+                    await send({"type": "http.response.body", "body": b'{"detail": "Tempo limite da requisicao excedido"}'})
+            except asyncio.CancelledError:
+                if deadline.cancelled:
+                    deadline.record()
+                raise
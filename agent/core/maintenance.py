@@ -0,0 +1,675 @@
+"""
+SafeBot Maintenance - Retenção, arquivamento e compactação dos bancos de sessão
+Aplica políticas de retenção por tipo de agente sobre os arquivos SQLite
+(telegram_sessions.db, telegram_memory.db, agents.db...) e as tabelas Postgres
+de produção, arquivando dados antigos em arquivos .jsonl.gz antes de removê-los.
+"""
+import os
+import gzip
+import json
+import time
+import sqlite3
+import fnmatch
+import logging
+import threading
+import statistics
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Optional, List, Dict, Any
+from dotenv import load_dotenv
+
+from core.memory import consolidate_user_memories
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Quantidade de execuções usadas para medir a latência de leitura de sessão
+LATENCY_SAMPLES = 20
+
+# Colunas JSON das tabelas de sessão do agno
+JSON_COLUMNS = ("memory", "session_data", "extra_data", "agent_data", "team_data")
+
+
+@dataclass
+class RetentionPolicy:
+    """Política de retenção para um grupo de tabelas de um tipo de agente"""
+
+    name: str
+    db_file: Optional[str] = None
+    table_patterns: List[str] = field(default_factory=lambda: ["*"])
+    # Sessões sem atualização há mais de N dias são arquivadas e removidas (None = nunca)
+    max_idle_days: Optional[int] = None
+    # Mantém apenas as últimas N execuções (runs) de cada sessão ativa (None = todas)
+    keep_runs: Optional[int] = None
+    # Bancos de memória não têm sessões: consolidação de memórias + VACUUM/ANALYZE
+    compact_only: bool = False
+
+
+@dataclass
+class TableReport:
+    """Resultado da manutenção de uma tabela"""
+
+    policy: str
+    db: str
+    table: str
+    sessions_dropped: int = 0
+    runs_archived: int = 0
+    memories_consolidated: int = 0
+    latency_before_ms: Optional[float] = None
+    latency_after_ms: Optional[float] = None
+
+
+@dataclass
+class MaintenanceReport:
+    """Resultado consolidado de uma execução de manutenção"""
+
+    started_at: datetime = field(default_factory=datetime.now)
+    tables: List[TableReport] = field(default_factory=list)
+    bytes_before: Dict[str, int] = field(default_factory=dict)
+    bytes_after: Dict[str, int] = field(default_factory=dict)
+    archives: List[str] = field(default_factory=list)
+    errors: List[str] = field(default_factory=list)
+
+    @property
+    def bytes_reclaimed(self) -> int:
+        return sum(
+            self.bytes_before[db] - self.bytes_after.get(db, self.bytes_before[db])
+            for db in self.bytes_before
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "started_at": self.started_at.isoformat(),
+            "bytes_reclaimed": self.bytes_reclaimed,
+            "bytes_before": self.bytes_before,
+            "bytes_after": self.bytes_after,
+            "archives": self.archives,
+            "errors": self.errors,
+            "tables": [table.__dict__ for table in self.tables],
+        }
+
+    def print_summary(self):
+        """Mostra o resumo da manutenção no terminal"""
+        print("🧹 SAFEBOT - RELATÓRIO DE MANUTENÇÃO")
+        print("=" * 60)
+        for table in self.tables:
+            if table.policy == "memory":
+                line = f"• [memory] {table.table}: {table.memories_consolidated} memórias consolidadas"
+            else:
+                line = (
+                    f"• [{table.policy}] {table.table}: "
+                    f"{table.sessions_dropped} sessões removidas, "
+                    f"{table.runs_archived} runs arquivadas"
+                )
+            if table.latency_before_ms is not None and table.latency_after_ms is not None:
+                line += (
+                    f" | latência {table.latency_before_ms:.2f}ms → "
+                    f"{table.latency_after_ms:.2f}ms"
+                )
+            print(line)
+
+        print("\n💾 ESPAÇO EM DISCO:")
+        for db, before in self.bytes_before.items():
+            after = self.bytes_after.get(db, before)
+            print(f"• {db}: {_format_bytes(before)} → {_format_bytes(after)}")
+        print(f"\n✅ Total recuperado: {_format_bytes(self.bytes_reclaimed)}")
+
+        if self.archives:
+            print("\n📦 ARQUIVOS GERADOS:")
+            for archive in self.archives:
+                print(f"• {archive}")
+
+        if self.errors:
+            print("\n⚠️ ERROS:")
+            for error in self.errors:
+                print(f"• {error}")
+
+
+def _format_bytes(size: int) -> str:
+    """Formata tamanho em bytes para leitura humana"""
+    value = float(size)
+    for unit in ["B", "KB", "MB", "GB"]:
+        if abs(value) < 1024 or unit == "GB":
+            return f"{value:.1f} {unit}"
+        value /= 1024
+    return f"{value:.1f} GB"
+
+
+def _env_days(name: str, default: Optional[int]) -> Optional[int]:
+    """Lê dias de retenção do ambiente (0 desabilita a política)"""
+    value = os.getenv(name)
+    if value is None:
+        return default
+    days = int(value)
+    return days if days > 0 else None
+
+
+def default_policies(tmp_dir: str = "tmp") -> List[RetentionPolicy]:
+    """Políticas padrão por tipo de agente (ajustáveis via variáveis de ambiente)"""
+    keep_runs = _env_days("SAFEBOT_RETENTION_KEEP_RUNS", 50)
+    return [
+        RetentionPolicy(
+            name="telegram",
+            db_file=f"{tmp_dir}/telegram_sessions.db",
+            table_patterns=["user_*_sessions"],
+            max_idle_days=_env_days("SAFEBOT_RETENTION_TELEGRAM_DAYS", 30),
+            keep_runs=keep_runs,
+        ),
+        RetentionPolicy(
+            name="teams",
+            db_file=f"{tmp_dir}/agents.db",
+            table_patterns=["safebot_*"],
+            max_idle_days=_env_days("SAFEBOT_RETENTION_TEAMS_DAYS", 14),
+            keep_runs=keep_runs,
+        ),
+        RetentionPolicy(
+            name="web",
+            db_file=f"{tmp_dir}/agents.db",
+            table_patterns=["*"],
+            max_idle_days=_env_days("SAFEBOT_RETENTION_WEB_DAYS", 90),
+            keep_runs=keep_runs,
+        ),
+        RetentionPolicy(
+            name="memory",
+            db_file=f"{tmp_dir}/telegram_memory.db",
+            compact_only=True,
+        ),
+        RetentionPolicy(
+            name="memory",
+            db_file=f"{tmp_dir}/agent_memories.db",
+            compact_only=True,
+        ),
+        RetentionPolicy(
+            name="memory",
+            db_file=f"{tmp_dir}/team_memories.db",
+            compact_only=True,
+        ),
+    ]
+
+
+def production_policies() -> List[RetentionPolicy]:
+    """Políticas para as tabelas Postgres de produção (production_config.py)"""
+    return [
+        RetentionPolicy(
+            name="production",
+            table_patterns=[
+                "epi_selector",
+                "audit_agent",
+                "training_agent",
+                "incident_agent",
+                "legal_agent",
+                "procedure_agent",
+            ],
+            max_idle_days=_env_days("SAFEBOT_RETENTION_WEB_DAYS", 90),
+            keep_runs=_env_days("SAFEBOT_RETENTION_KEEP_RUNS", 50),
+        ),
+        RetentionPolicy(
+            name="memory",
+            table_patterns=["*_memories"],
+            compact_only=True,
+        ),
+    ]
+
+
+class SessionMaintenance:
+    """Executa as políticas de retenção sobre SQLite e Postgres"""
+
+    def __init__(
+        self,
+        policies: Optional[List[RetentionPolicy]] = None,
+        tmp_dir: str = "tmp",
+        archive_dir: Optional[str] = None,
+        database_url: Optional[str] = None,
+        dry_run: bool = False,
+    ):
+        self.tmp_dir = tmp_dir
+        self.policies = policies if policies is not None else default_policies(tmp_dir)
+        self.archive_dir = Path(archive_dir or f"{tmp_dir}/archive")
+        self.database_url = database_url
+        self.dry_run = dry_run
+
+    def run(self) -> MaintenanceReport:
+        """Aplica todas as políticas e retorna o relatório"""
+        report = MaintenanceReport()
+
+        # Tabelas já tratadas por uma política mais específica não são reprocessadas
+        handled: Dict[str, set] = {}
+
+        for policy in self.policies:
+            if policy.db_file is None:
+                continue
+            if not os.path.exists(policy.db_file):
+                continue
+            try:
+                self._run_sqlite_policy(policy, report, handled.setdefault(policy.db_file, set()))
+            except Exception as e:
+                logger.error(f"Erro na manutenção de {policy.db_file}: {e}")
+                report.errors.append(f"{policy.db_file}: {e}")
+
+        # Compactação final de cada arquivo SQLite tocado
+        for db_file in handled:
+            try:
+                self._compact_sqlite(db_file, report)
+            except Exception as e:
+                logger.error(f"Erro ao compactar {db_file}: {e}")
+                report.errors.append(f"{db_file}: {e}")
+
+        if self.database_url:
+            try:
+                self._run_postgres(report)
+            except Exception as e:
+                logger.error(f"Erro na manutenção do Postgres: {e}")
+                report.errors.append(f"postgres: {e}")
+
+        return report
+
+    # ========================================================================
+    # SQLITE
+    # ========================================================================
+
+    def _run_sqlite_policy(self, policy: RetentionPolicy, report: MaintenanceReport, handled: set):
+        """Aplica uma política a um arquivo SQLite"""
+        if policy.db_file not in report.bytes_before:
+            report.bytes_before[policy.db_file] = _sqlite_size(policy.db_file)
+
+        if policy.compact_only:
+            self._consolidate_sqlite_memories(policy, report)
+            return
+
+        conn = sqlite3.connect(policy.db_file)
+        try:
+            for table in self._matching_sqlite_tables(conn, policy.table_patterns):
+                if table in handled:
+                    continue
+                handled.add(table)
+                report.tables.append(self._maintain_table(conn, policy, table, report))
+        finally:
+            conn.close()
+
+    def _consolidate_sqlite_memories(self, policy: RetentionPolicy, report: MaintenanceReport):
+        """Remove memórias duplicadas/excedentes das tabelas SqliteMemoryDb"""
+        from agno.memory.v2.db.sqlite import SqliteMemoryDb
+
+        conn = sqlite3.connect(policy.db_file)
+        try:
+            tables = _memory_tables(conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'"), conn)
+        finally:
+            conn.close()
+
+        for table in tables:
+            table_report = TableReport(policy=policy.name, db=policy.db_file, table=table)
+            if not self.dry_run:
+                db = SqliteMemoryDb(table_name=table, db_file=policy.db_file)
+                table_report.memories_consolidated = consolidate_user_memories(db)
+            report.tables.append(table_report)
+
+    def _matching_sqlite_tables(self, conn: sqlite3.Connection, patterns: List[str]) -> List[str]:
+        """Tabelas de sessão do agno que casam com os padrões da política"""
+        rows = conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall()
+        tables = []
+        for (name,) in rows:
+            if not any(fnmatch.fnmatch(name, pattern) for pattern in patterns):
+                continue
+            columns = {row[1] for row in conn.execute(f'PRAGMA table_info("{name}")')}
+            if {"session_id", "memory", "updated_at"} <= columns:
+                tables.append(name)
+        return tables
+
+    def _maintain_table(
+        self,
+        conn: sqlite3.Connection,
+        policy: RetentionPolicy,
+        table: str,
+        report: MaintenanceReport,
+    ) -> TableReport:
+        """Arquiva sessões ociosas e runs antigas de uma tabela"""
+        table_report = TableReport(policy=policy.name, db=policy.db_file, table=table)
+        table_report.latency_before_ms = _measure_sqlite_latency(conn, table)
+
+        archived: List[Dict[str, Any]] = []
+        conn.row_factory = sqlite3.Row
+
+        # 1. Sessões ociosas: arquivar sessão completa e remover
+        if policy.max_idle_days is not None:
+            cutoff = int(time.time()) - policy.max_idle_days * 86400
+            idle_rows = conn.execute(
+                f'SELECT * FROM "{table}" WHERE COALESCE(updated_at, created_at) < ?',
+                (cutoff,),
+            ).fetchall()
+            for row in idle_rows:
+                archived.append({"kind": "session", **dict(row)})
+            table_report.sessions_dropped = len(idle_rows)
+            if idle_rows and not self.dry_run:
+                conn.execute(
+                    f'DELETE FROM "{table}" WHERE COALESCE(updated_at, created_at) < ?',
+                    (cutoff,),
+                )
+
+        # 2. Sessões ativas: manter apenas as últimas N runs no histórico
+        if policy.keep_runs is not None:
+            for row in conn.execute(f'SELECT session_id, memory FROM "{table}"').fetchall():
+                memory = _load_json(row["memory"])
+                runs = memory.get("runs") if isinstance(memory, dict) else None
+                if not runs or len(runs) <= policy.keep_runs:
+                    continue
+                old_runs = runs[: -policy.keep_runs]
+                memory["runs"] = runs[-policy.keep_runs :]
+                for run in old_runs:
+                    archived.append({"kind": "run", "session_id": row["session_id"], "run": run})
+                table_report.runs_archived += len(old_runs)
+                if not self.dry_run:
+                    conn.execute(
+                        f'UPDATE "{table}" SET memory = ? WHERE session_id = ?',
+                        (json.dumps(memory, ensure_ascii=False), row["session_id"]),
+                    )
+
+        conn.row_factory = None
+        if archived and not self.dry_run:
+            report.archives.append(self._write_archive(Path(policy.db_file).stem, table, archived))
+            conn.commit()
+
+        return table_report
+
+    def _compact_sqlite(self, db_file: str, report: MaintenanceReport):
+        """VACUUM + ANALYZE e mede a latência após compactação"""
+        if not self.dry_run:
+            conn = sqlite3.connect(db_file, isolation_level=None)
+            try:
+                conn.execute("VACUUM")
+                conn.execute("ANALYZE")
+            finally:
+                conn.close()
+
+        report.bytes_after[db_file] = _sqlite_size(db_file)
+
+        conn = sqlite3.connect(db_file)
+        try:
+            for table_report in report.tables:
+                if table_report.db == db_file and table_report.policy != "memory":
+                    table_report.latency_after_ms = _measure_sqlite_latency(conn, table_report.table)
+        finally:
+            conn.close()
+
+    # ========================================================================
+    # POSTGRES
+    # ========================================================================
+
+    def _run_postgres(self, report: MaintenanceReport, schema: str = "ai"):
+        """Aplica as políticas de produção às tabelas Postgres do agno"""
+        from sqlalchemy import create_engine, text
+
+        engine = create_engine(self.database_url)
+        db_key = f"postgres:{schema}"
+
+        with engine.connect() as conn:
+            tables = [
+                row[0]
+                for row in conn.execute(
+                    text("SELECT table_name FROM information_schema.tables WHERE table_schema = :schema"),
+                    {"schema": schema},
+                )
+            ]
+
+        report.bytes_before[db_key] = self._postgres_size(engine, schema, tables)
+        maintained = []
+
+        for policy in production_policies():
+            for table in tables:
+                if table in maintained:
+                    continue
+                if not any(fnmatch.fnmatch(table, pattern) for pattern in policy.table_patterns):
+                    continue
+                maintained.append(table)
+                if policy.compact_only:
+                    if not self.dry_run:
+                        from agno.memory.v2.db.postgres import PostgresMemoryDb
+
+                        db = PostgresMemoryDb(table_name=table, schema=schema, db_url=self.database_url)
+                        report.tables.append(
+                            TableReport(
+                                policy=policy.name,
+                                db=db_key,
+                                table=table,
+                                memories_consolidated=consolidate_user_memories(db),
+                            )
+                        )
+                    continue
+                report.tables.append(self._maintain_postgres_table(engine, schema, policy, table, report))
+
+        # VACUUM não pode rodar dentro de transação
+        if not self.dry_run:
+            with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                for table in maintained:
+                    conn.execute(text(f'VACUUM ANALYZE "{schema}"."{table}"'))
+
+        report.bytes_after[db_key] = self._postgres_size(engine, schema, tables)
+        for table_report in report.tables:
+            if table_report.db == db_key and table_report.policy != "memory":
+                table_report.latency_after_ms = _measure_postgres_latency(
+                    engine, f'"{schema}"."{table_report.table}"'
+                )
+
+    def _maintain_postgres_table(
+        self,
+        engine,
+        schema: str,
+        policy: RetentionPolicy,
+        table: str,
+        report: MaintenanceReport,
+    ) -> TableReport:
+        """Arquiva e remove sessões ociosas e runs antigas de uma tabela Postgres"""
+        from sqlalchemy import text
+
+        qualified = f'"{schema}"."{table}"'
+        table_report = TableReport(policy=policy.name, db=f"postgres:{schema}", table=table)
+        table_report.latency_before_ms = _measure_postgres_latency(engine, qualified)
+        archived: List[Dict[str, Any]] = []
+
+        with engine.begin() as conn:
+            if policy.max_idle_days is not None:
+                cutoff = int(time.time()) - policy.max_idle_days * 86400
+                rows = conn.execute(
+                    text(f"SELECT * FROM {qualified} WHERE COALESCE(updated_at, created_at) < :cutoff"),
+                    {"cutoff": cutoff},
+                ).mappings().all()
+                archived.extend({"kind": "session", **dict(row)} for row in rows)
+                table_report.sessions_dropped = len(rows)
+                if rows and not self.dry_run:
+                    conn.execute(
+                        text(f"DELETE FROM {qualified} WHERE COALESCE(updated_at, created_at) < :cutoff"),
+                        {"cutoff": cutoff},
+                    )
+
+            if policy.keep_runs is not None:
+                rows = conn.execute(
+                    text(
+                        f"SELECT session_id, memory FROM {qualified} "
+                        "WHERE jsonb_array_length(COALESCE(memory->'runs', '[]'::jsonb)) > :keep"
+                    ),
+                    {"keep": policy.keep_runs},
+                ).mappings().all()
+                for row in rows:
+                    memory = _load_json(row["memory"])
+                    runs = memory.get("runs", [])
+                    old_runs = runs[: -policy.keep_runs]
+                    memory["runs"] = runs[-policy.keep_runs :]
+                    archived.extend(
+                        {"kind": "run", "session_id": row["session_id"], "run": run} for run in old_runs
+                    )
+                    table_report.runs_archived += len(old_runs)
+                    if not self.dry_run:
+                        conn.execute(
+                            text(f"UPDATE {qualified} SET memory = CAST(:memory AS jsonb) WHERE session_id = :sid"),
+                            {"memory": json.dumps(memory, ensure_ascii=False), "sid": row["session_id"]},
+                        )
+
+            if archived and not self.dry_run:
+                report.archives.append(self._write_archive("postgres", table, archived))
+
+        return table_report
+
+    @staticmethod
+    def _postgres_size(engine, schema: str, tables: List[str]) -> int:
+        from sqlalchemy import text
+
+        total = 0
+        with engine.connect() as conn:
+            for table in tables:
+                total += conn.execute(
+                    text("SELECT pg_total_relation_size(CAST(:name AS regclass))"),
+                    {"name": f'"{schema}"."{table}"'},
+                ).scalar() or 0
+        return total
+
+    # ========================================================================
+    # ARQUIVAMENTO
+    # ========================================================================
+
+    def _write_archive(self, db_name: str, table: str, records: List[Dict[str, Any]]) -> str:
+        """Grava registros removidos em um arquivo .jsonl.gz"""
+        target_dir = self.archive_dir / db_name
+        target_dir.mkdir(parents=True, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        path = target_dir / f"{table}-{stamp}.jsonl.gz"
+
+        with gzip.open(path, "at", encoding="utf-8") as f:
+            for record in records:
+                record = {
+                    key: _load_json(value) if key in JSON_COLUMNS else value
+                    for key, value in record.items()
+                }
+                f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+
+        logger.info(f"{len(records)} registros de {table} arquivados em {path}")
+        return str(path)
+
+
+def _memory_tables(rows, conn: sqlite3.Connection) -> List[str]:
+    """Tabelas no formato do SqliteMemoryDb (id, user_id, memory)"""
+    tables = []
+    for (name,) in rows.fetchall():
+        columns = {row[1] for row in conn.execute(f'PRAGMA table_info("{name}")')}
+        if {"id", "user_id", "memory"} <= columns and "session_id" not in columns:
+            tables.append(name)
+    return tables
+
+
+def _load_json(value: Any) -> Any:
+    """Decodifica colunas JSON que o SQLite devolve como texto"""
+    if isinstance(value, (str, bytes)):
+        try:
+            return json.loads(value)
+        except ValueError:
+            return value
+    return value if value is not None else {}
+
+
+def _sqlite_size(db_file: str) -> int:
+    """Tamanho do banco SQLite incluindo arquivos WAL/SHM"""
+    total = 0
+    for suffix in ("", "-wal", "-shm"):
+        path = f"{db_file}{suffix}"
+        if os.path.exists(path):
+            total += os.path.getsize(path)
+    return total
+
+
+def _measure_sqlite_latency(conn: sqlite3.Connection, table: str) -> Optional[float]:
+    """Mediana (ms) da leitura de sessão usada pelo agno: SELECT por session_id"""
+    row = conn.execute(
+        f'SELECT session_id FROM "{table}" ORDER BY COALESCE(updated_at, created_at) DESC LIMIT 1'
+    ).fetchone()
+    if row is None:
+        return None
+
+    samples = []
+    for _ in range(LATENCY_SAMPLES):
+        start = time.perf_counter()
+        conn.execute(f'SELECT * FROM "{table}" WHERE session_id = ?', (row[0],)).fetchall()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def _measure_postgres_latency(engine, qualified_table: str) -> Optional[float]:
+    """Mediana (ms) da leitura de sessão no Postgres"""
+    from sqlalchemy import text
+
+    with engine.connect() as conn:
+        session_id = conn.execute(
+            text(f"SELECT session_id FROM {qualified_table} ORDER BY COALESCE(updated_at, created_at) DESC LIMIT 1")
+        ).scalar()
+        if session_id is None:
+            return None
+
+        samples = []
+        for _ in range(LATENCY_SAMPLES):
+            start = time.perf_counter()
+            conn.execute(
+                text(f"SELECT * FROM {qualified_table} WHERE session_id = :sid"), {"sid": session_id}
+            ).fetchall()
+            samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+# ============================================================================
+# AGENDADOR EM PROCESSO
+# ============================================================================
+
+class MaintenanceScheduler:
+    """Executa a manutenção periodicamente em uma thread daemon"""
+
+    def __init__(self, maintenance: SessionMaintenance, interval_hours: float):
+        self.maintenance = maintenance
+        self.interval_seconds = interval_hours * 3600
+        self.last_report: Optional[MaintenanceReport] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, name="safebot-maintenance", daemon=True)
+        self._thread.start()
+        logger.info(f"Manutenção agendada a cada {self.interval_seconds / 3600:.1f}h")
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval_seconds):
+            try:
+                self.last_report = self.maintenance.run()
+                logger.info(
+                    f"Manutenção concluída: {_format_bytes(self.last_report.bytes_reclaimed)} recuperados"
+                )
+            except Exception as e:
+                logger.error(f"Erro na manutenção agendada: {e}")
+
+
+_scheduler: Optional[MaintenanceScheduler] = None
+
+
+def start_scheduler_from_env(tmp_dir: str = "tmp") -> Optional[MaintenanceScheduler]:
+    """Inicia o agendador se SAFEBOT_MAINTENANCE_INTERVAL_HOURS estiver configurado"""
+    global _scheduler
+    interval = float(os.getenv("SAFEBOT_MAINTENANCE_INTERVAL_HOURS", "0"))
+    if interval <= 0:
+        return None
+    if _scheduler is None:
+        _scheduler = MaintenanceScheduler(
+            SessionMaintenance(tmp_dir=tmp_dir, database_url=os.getenv("SAFEBOT_MAINTENANCE_DATABASE_URL")),
+            interval_hours=interval,
+        )
+        _scheduler.start()
+    return _scheduler
+
+
+def run_maintenance(
+    tmp_dir: str = "tmp",
+    database_url: Optional[str] = None,
+    dry_run: bool = False,
+) -> MaintenanceReport:
+    """Função de conveniência para executar a manutenção uma vez"""
+    return SessionMaintenance(tmp_dir=tmp_dir, database_url=database_url, dry_run=dry_run).run()
@@ -0,0 +1,142 @@
+"""
+SafeBot Memo - Reaproveitamento de respostas dos especialistas
+A mesma sub-tarefa delegada pelo líder ("quais EPIs para trabalho em altura?")
+se repete entre usuários e execuções de teams. A resposta de cada especialista
+fica guardada pela sub-tarefa normalizada, pelo membro e pela versão da base de
+conhecimento, com TTL; sub-tarefas pessoais (dados do usuário, da empresa dele)
+nunca são reaproveitadas.
+"""
+import os
+import re
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional, Sequence, Tuple
+
+from core.memory import tokenize
+from core.metrics import metrics
+from core.state import SessionStateStore, create_state_store
+
+metrics.describe("safebot_member_memo_total", "Consultas ao cache de respostas dos especialistas por resultado")
+
+# Sub-tarefas que falam do próprio usuário não são compartilhadas
+PERSONAL_MARKERS = re.compile(
+    r"\b(eu|me|mim|comigo|meu|minha|meus|minhas|nosso|nossa|nossos|nossas|usu[aá]rio|cliente)\b",
+    re.IGNORECASE,
+)
+
+
+def normalize_task(task: str, expected_output: Optional[str] = None) -> str:
+    """Sub-tarefa em forma canônica (sem acentos, pontuação e stopwords)"""
+    return " ".join(tokenize(task) + (["->"] + tokenize(expected_output) if expected_output else []))
+
+
+def is_personal(task: str) -> bool:
+    return bool(PERSONAL_MARKERS.search(task))
+
+
+def files_version(paths: Iterable[str]) -> str:
+    """Versão de um conjunto de arquivos (nome, tamanho e data de modificação)"""
+    digest = hashlib.sha1()
+    for path in sorted(paths):
+        try:
+            stat = Path(path).stat()
+            digest.update(f"{path}:{stat.st_size}:{int(stat.st_mtime)}".encode())
+        except OSError:
+            digest.update(f"{path}:missing".encode())
+    return digest.hexdigest()[:12]
+
+
+class SubAnswerCache:
+    """Cache LRU com TTL em processo, opcionalmente compartilhado por um SessionStateStore"""
+
+    def __init__(
+        self,
+        version: str = "",
+        ttl_seconds: Optional[float] = None,
+        max_entries: int = 2000,
+        store: Optional[SessionStateStore] = None,
+        skip_members: Sequence[str] = (),
+    ):
+        self.version = version
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(os.getenv("SAFEBOT_MEMO_TTL_SECONDS", "86400"))
+        self.max_entries = max_entries
+        self.store = store  # Compartilha entre réplicas (ex.: Redis)
+        self.skip_members = set(skip_members)
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def key(self, member_name: str, task: str, expected_output: Optional[str] = None) -> Optional[str]:
+        """Chave da sub-tarefa ou None quando ela não pode ser reaproveitada"""
+        if member_name in self.skip_members or is_personal(task):
+            return None
+        normalized = normalize_task(task, expected_output)
+        if not normalized:
+            return None
+        raw = f"{self.version}|{member_name}|{normalized}"
+        return "memo:" + hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    metrics.inc("safebot_member_memo_total", result="hit")
+                    return entry[1]
+                del self._entries[key]
+
+        shared = self.store.get(key) if self.store is not None else None
+        if shared and shared.get("expires_at", 0) > now:
+            self._remember(key, shared["expires_at"], shared["output"])
+            metrics.inc("safebot_member_memo_total", result="hit")
+            return shared["output"]
+        metrics.inc("safebot_member_memo_total", result="miss")
+        return None
+
+    def set(self, key: str, output: str):
+        expires_at = time.time() + self.ttl_seconds
+        self._remember(key, expires_at, output)
+        if self.store is not None:
+            self.store.set(key, {"output": output, "expires_at": expires_at})
+
+    def _remember(self, key: str, expires_at: float, output: str):
+        with self._lock:
+            self._entries[key] = (expires_at, output)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"entries": len(self._entries), "ttl_seconds": self.ttl_seconds, "version": self.version}
+
+
+def create_sub_answer_cache(version: str = "") -> Optional[SubAnswerCache]:
+    """
+    Cria o cache de respostas dos especialistas a partir do ambiente
+
+    SAFEBOT_MEMO_ENABLED=false desativa; SAFEBOT_MEMO_URL (ex.: redis://redis:6379/2)
+    compartilha o cache entre réplicas; SAFEBOT_MEMO_SKIP_MEMBERS lista os membros
+    cujas respostas não são reaproveitadas.
+    """
+    if os.getenv("SAFEBOT_MEMO_ENABLED", "true").lower() != "true":
+        return None
+    url = os.getenv("SAFEBOT_MEMO_URL", "")
+    ttl = float(os.getenv("SAFEBOT_MEMO_TTL_SECONDS", "86400"))
+    # O backend também expira as respostas (sem isso ficariam no Redis/SQLite para sempre)
+    store = create_state_store(url, cache_seconds=0, ttl_seconds=ttl, name="memo") if url else None
+    skip = [name.strip() for name in os.getenv("SAFEBOT_MEMO_SKIP_MEMBERS", "Web Researcher").split(",") if name.strip()]
+    return SubAnswerCache(
+        version=version,
+        ttl_seconds=ttl,
+        max_entries=int(os.getenv("SAFEBOT_MEMO_MAX_ENTRIES", "2000")),
+        store=store,
+        skip_members=skip,
+    )
@@ -0,0 +1,529 @@
+"""
+SafeBot Memory - Extração em background e recuperação ranqueada de memórias
+A classificação de memórias (chamada extra ao gpt-4o-mini) deixa de rodar antes
+da resposta ao usuário: os turnos são enfileirados e processados em lote por uma
+thread em background, com prazo máximo por lote. Na leitura, apenas as memórias
+mais relevantes para a pergunta atual são injetadas no prompt.
+"""
+import os
+import re
+import math
+import time
+import atexit
+import hashlib
+import logging
+import threading
+import unicodedata
+from contextlib import contextmanager
+from contextvars import ContextVar
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Optional, List, Dict, Tuple, Any, Iterator
+from agno.memory.v2.memory import Memory
+from agno.memory.v2.schema import UserMemory
+from agno.memory.v2.db.base import MemoryDb
+from agno.models.message import Message
+
+from core.deadline import Deadline, DeadlineExceeded, current_deadline, deadline_scope
+from core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+metrics.describe("safebot_memory_queue_depth", "Turnos aguardando extração de memória")
+metrics.describe("safebot_memory_queue_lag_seconds", "Tempo entre o turno e a extração da memória")
+metrics.describe("safebot_memory_batches_total", "Lotes de extração de memória processados")
+metrics.describe("safebot_memory_dropped_total", "Turnos descartados pela fila de memória")
+metrics.describe("safebot_memory_injected", "Memórias injetadas por execução")
+metrics.describe("safebot_memory_consolidated_total", "Memórias removidas na consolidação")
+
+# Pergunta atual usada para ranquear memórias (definida durante a montagem do prompt)
+memory_query: ContextVar[Optional[str]] = ContextVar("memory_query", default=None)
+
+
+@dataclass
+class _PendingBatch:
+    """Turnos pendentes de um usuário em uma memória"""
+
+    memory: "DeferredMemory"
+    user_id: str
+    first_submitted: float
+    turns: List[Tuple[float, List[Message]]] = field(default_factory=list)
+
+
+class MemoryExtractionQueue:
+    """Fila em background que agrupa turnos e extrai memórias em lote"""
+
+    def __init__(
+        self,
+        batch_size: int = 4,
+        max_wait_seconds: float = 20.0,
+        deadline_seconds: float = 60.0,
+        max_pending: int = 1000,
+        workers: int = 2,
+    ):
+        self.batch_size = batch_size
+        self.max_wait_seconds = max_wait_seconds
+        self.deadline_seconds = deadline_seconds
+        self.max_pending = max_pending
+        self.workers = workers
+
+        self._pending: Dict[Tuple[int, str], _PendingBatch] = {}
+        self._depth = 0
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._running: set = set()
+        self._force_flush = False
+
+    def __deepcopy__(self, memo):
+        # A fila é compartilhada entre cópias de agentes (Playground usa deep_copy)
+        return self
+
+    def submit(self, memory: "DeferredMemory", user_id: str, messages: List[Message]) -> bool:
+        """Enfileira um turno sem bloquear; retorna False se a fila estiver cheia"""
+        now = time.time()
+        with self._cond:
+            if self._depth >= self.max_pending:
+                metrics.inc("safebot_memory_dropped_total", reason="queue_full")
+                logger.warning(f"Fila de memória cheia, turno de {user_id} descartado")
+                return False
+
+            key = (id(memory), user_id)
+            batch = self._pending.get(key)
+            if batch is None:
+                batch = self._pending[key] = _PendingBatch(memory=memory, user_id=user_id, first_submitted=now)
+            batch.turns.append((now, messages))
+            self._depth += 1
+            metrics.set_gauge("safebot_memory_queue_depth", self._depth)
+            self._cond.notify()
+
+        self._ensure_worker()
+        return True
+
+    def flush(self, timeout: Optional[float] = None):
+        """Força a extração de todos os lotes pendentes (usado no shutdown)"""
+        with self._cond:
+            if self._depth == 0:
+                return
+            self._force_flush = True
+            self._cond.notify()
+            self._cond.wait_for(lambda: self._depth == 0, timeout=timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        """Profundidade da fila e atraso do turno mais antigo"""
+        with self._cond:
+            oldest = min((b.first_submitted for b in self._pending.values()), default=None)
+            return {
+                "depth": self._depth,
+                "users": len(self._pending),
+                "oldest_lag_seconds": round(time.time() - oldest, 3) if oldest else 0.0,
+            }
+
+    def _ensure_worker(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._cond:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="safebot-memory")
+            self._thread = threading.Thread(target=self._loop, name="safebot-memory-queue", daemon=True)
+            self._thread.start()
+
+    def _take_ready_batches(self) -> List[_PendingBatch]:
+        """Retira da fila os lotes prontos, até o limite de lotes em andamento (um por usuário)"""
+        now = time.time()
+        slots = self.workers - len(self._running)
+        ready_keys = []
+        for key, batch in self._pending.items():
+            if len(ready_keys) >= slots:
+                break
+            if key in self._running:
+                continue  # Extrações do mesmo usuário não rodam em paralelo
+            if (
+                self._force_flush
+                or len(batch.turns) >= self.batch_size
+                or now - batch.first_submitted >= self.max_wait_seconds
+            ):
+                ready_keys.append(key)
+        self._running.update(ready_keys)
+        return [self._pending.pop(key) for key in ready_keys]
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                ready = self._take_ready_batches()
+                if not ready:
+                    self._cond.wait(timeout=self._next_wakeup())
+                    continue
+
+            # Submete sem esperar: até `workers` lotes em andamento ao mesmo tempo
+            for batch in ready:
+                self._submit(batch)
+
+    def _next_wakeup(self) -> Optional[float]:
+        if not self._pending or len(self._running) >= self.workers:
+            return None  # Acordado por submit() ou pelo fim de um lote
+        oldest = min(batch.first_submitted for batch in self._pending.values())
+        return max(0.05, self.max_wait_seconds - (time.time() - oldest))
+
+    def _submit(self, batch: _PendingBatch):
+        """Executa uma única chamada de extração para todos os turnos do lote"""
+        messages = [message for _, turn in batch.turns for message in turn]
+        started = time.time()
+        for submitted, _ in batch.turns:
+            metrics.observe("safebot_memory_queue_lag_seconds", started - submitted)
+
+        future = self._executor.submit(self._extract, batch, messages)
+        future.add_done_callback(lambda f: self._finish(batch, f))
+
+    def _extract(self, batch: _PendingBatch, messages: List[Message]):
+        # O prazo limita novas tentativas do modelo e encerra a extração entre chamadas
+        deadline = Deadline(self.deadline_seconds, source="memory")
+        with deadline_scope(deadline):
+            try:
+                return batch.memory.extract_now(messages, batch.user_id)
+            except Exception as e:
+                if deadline.done and not isinstance(e, DeadlineExceeded):
+                    raise DeadlineExceeded("deadline") from e
+                raise
+
+    def _finish(self, batch: _PendingBatch, future: Future):
+        error = future.exception()
+        if error is None:
+            metrics.inc("safebot_memory_batches_total", status="ok")
+        elif isinstance(error, DeadlineExceeded):
+            metrics.inc("safebot_memory_batches_total", status="timeout")
+            logger.warning(f"Extração de memória de {batch.user_id} excedeu {self.deadline_seconds}s")
+        else:
+            metrics.inc("safebot_memory_batches_total", status="error")
+            logger.error(f"Erro na extração de memória de {batch.user_id}: {error}")
+
+        with self._cond:
+            self._running.discard((id(batch.memory), batch.user_id))
+            self._depth -= len(batch.turns)
+            if self._depth == 0:
+                self._force_flush = False
+            metrics.set_gauge("safebot_memory_queue_depth", self._depth)
+            self._cond.notify_all()
+
+
+class _MemoryLock:
+    """Lock do estado em memória de uma Memory (cada cópia do agente tem o seu)"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+
+    def __enter__(self):
+        return self._lock.__enter__()
+
+    def __exit__(self, *exc):
+        return self._lock.__exit__(*exc)
+
+    def __deepcopy__(self, memo):
+        return _MemoryLock()
+
+
+class DeferredMemory(Memory):
+    """Memory do agno que agenda a extração de memórias em vez de executá-la no turno"""
+
+    def __init__(self, *args, extraction_queue: Optional[MemoryExtractionQueue] = None, **kwargs):
+        self._lock = _MemoryLock()
+        super().__init__(*args, **kwargs)
+        self.extraction_queue = extraction_queue or get_memory_extraction_queue()
+
+    # A extração roda em background enquanto os agentes leem e gravam a mesma
+    # Memory: o dicionário de memórias só é trocado e lido sob o lock.
+
+    def refresh_from_db(self, user_id: Optional[str] = None):
+        with self._lock:
+            super().refresh_from_db(user_id=user_id)
+
+    def get_user_memories(self, user_id: Optional[str] = None) -> List[UserMemory]:
+        with self._lock:
+            return super().get_user_memories(user_id=user_id)
+
+    def get_user_memory(self, memory_id: str, user_id: Optional[str] = None) -> Optional[UserMemory]:
+        with self._lock:
+            return super().get_user_memory(memory_id, user_id=user_id)
+
+    def add_user_memory(self, memory: UserMemory, user_id: Optional[str] = None, refresh_from_db: bool = True) -> str:
+        with self._lock:
+            return super().add_user_memory(memory, user_id=user_id, refresh_from_db=refresh_from_db)
+
+    def delete_user_memory(self, memory_id: str, user_id: Optional[str] = None, refresh_from_db: bool = True) -> None:
+        with self._lock:
+            return super().delete_user_memory(memory_id, user_id=user_id, refresh_from_db=refresh_from_db)
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return super().to_dict()
+
+    def create_user_memories(
+        self,
+        message: Optional[str] = None,
+        messages: Optional[List[Message]] = None,
+        user_id: Optional[str] = None,
+        refresh_from_db: bool = True,
+    ) -> str:
+        if message:
+            messages = [Message(role="user", content=message)]
+        if not messages:
+            raise ValueError("You must provide either a message or a list of messages")
+
+        deadline = current_deadline()
+        if deadline is not None and deadline.done:
+            # Requisição abandonada ou fora do prazo: a resposta não chegou ao usuário
+            deadline.record()
+            return "Extração de memórias descartada"
+        self.extraction_queue.submit(self, user_id or "default", list(messages))
+        return "Extração de memórias agendada"
+
+    async def acreate_user_memories(
+        self,
+        message: Optional[str] = None,
+        messages: Optional[List[Message]] = None,
+        user_id: Optional[str] = None,
+        refresh_from_db: bool = True,
+    ) -> str:
+        return self.create_user_memories(message=message, messages=messages, user_id=user_id)
+
+    def extract_now(self, messages: List[Message], user_id: str) -> str:
+        """Extração síncrona (executada pela fila em background, uma por usuário por vez)"""
+        if self.memory_manager is None or self.db is None:
+            return Memory.create_user_memories(self, messages=messages, user_id=user_id)
+
+        # Lê sob o lock e chama o modelo fora dele: os agentes não esperam pela extração
+        with self._lock:
+            self.refresh_from_db(user_id=user_id)
+            existing = [
+                {"memory_id": memory_id, "memory": memory.memory}
+                for memory_id, memory in self.memories.get(user_id, {}).items()
+            ]
+        response = self.memory_manager.create_or_update_memories(
+            messages=messages,
+            existing_memories=existing,
+            user_id=user_id,
+            db=self.db,
+            delete_memories=self.delete_memories,
+            clear_memories=self.clear_memories,
+        )
+        self.refresh_from_db(user_id=user_id)
+        return response
+
+
+_memory_extraction_queue: Optional[MemoryExtractionQueue] = None
+
+
+def get_memory_extraction_queue() -> MemoryExtractionQueue:
+    """Fila global de extração configurada pelo ambiente"""
+    global _memory_extraction_queue
+    if _memory_extraction_queue is None:
+        _memory_extraction_queue = MemoryExtractionQueue(
+            batch_size=int(os.getenv("SAFEBOT_MEMORY_BATCH_SIZE", "4")),
+            max_wait_seconds=float(os.getenv("SAFEBOT_MEMORY_MAX_WAIT_SECONDS", "20")),
+            deadline_seconds=float(os.getenv("SAFEBOT_MEMORY_DEADLINE_SECONDS", "60")),
+        )
+        atexit.register(_memory_extraction_queue.flush, 10.0)
+    return _memory_extraction_queue
+
+
+# ============================================================================
+# RECUPERAÇÃO RANQUEADA
+# ============================================================================
+
+STOPWORDS = {
+    "a", "o", "as", "os", "de", "da", "do", "das", "dos", "e", "em", "no", "na",
+    "nos", "nas", "um", "uma", "uns", "umas", "para", "por", "com", "sem", "que",
+    "se", "ao", "aos", "eu", "ele", "ela", "meu", "minha", "seu", "sua", "qual",
+    "quais", "como", "mais", "muito", "ser", "ter", "sobre", "the", "is", "and",
+}
+
+# Dimensão do vetor local (feature hashing)
+HASH_DIMENSIONS = 1024
+
+
+def tokenize(text: str) -> List[str]:
+    """Normaliza (minúsculas, sem acentos) e separa palavras relevantes"""
+    normalized = unicodedata.normalize("NFKD", text.lower())
+    normalized = "".join(c for c in normalized if not unicodedata.combining(c))
+    return [t for t in re.findall(r"[a-z0-9]+", normalized) if len(t) > 2 and t not in STOPWORDS]
+
+
+def local_embedding(text: str) -> Dict[int, float]:
+    """Vetor esparso normalizado por feature hashing (sem chamada de rede)"""
+    vector: Dict[int, float] = {}
+    for token in tokenize(text):
+        # Prefixo de 5 letras aproxima singular/plural e flexões ("luvas" ~ "luva")
+        for feature in {token, token[:5]}:
+            index = int(hashlib.md5(feature.encode()).hexdigest()[:8], 16) % HASH_DIMENSIONS
+            vector[index] = vector.get(index, 0.0) + 1.0
+    norm = math.sqrt(sum(v * v for v in vector.values()))
+    return {k: v / norm for k, v in vector.items()} if norm else {}
+
+
+def cosine(a: Any, b: Any) -> float:
+    """Similaridade de cosseno para vetores esparsos (dict) ou densos (list)"""
+    if isinstance(a, dict):
+        if len(a) > len(b):
+            a, b = b, a
+        return sum(v * b.get(k, 0.0) for k, v in a.items())
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimativa simples de tokens (~4 caracteres por token)"""
+    return len(text) // 4 + 1
+
+
+class MemoryIndex:
+    """Índice vetorial de memórias por usuário, atualizado incrementalmente"""
+
+    def __init__(self, embedder: Optional[Any] = None):
+        # embedder opcional do agno (ex.: OpenAIEmbedder); padrão é o vetor local
+        self.embedder = embedder
+        self._vectors: Dict[str, Dict[str, Tuple[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def embed(self, text: str) -> Any:
+        if self.embedder is not None:
+            return self.embedder.get_embedding(text)
+        return local_embedding(text)
+
+    def _sync(self, user_id: str, memories: List[UserMemory]) -> Dict[str, Tuple[str, Any]]:
+        """Re-indexa apenas memórias novas ou alteradas do usuário"""
+        with self._lock:
+            current = self._vectors.setdefault(user_id, {})
+            live_ids = set()
+            for memory in memories:
+                live_ids.add(memory.memory_id)
+                signature = hashlib.md5(memory.memory.encode()).hexdigest()
+                cached = current.get(memory.memory_id)
+                if cached is None or cached[0] != signature:
+                    current[memory.memory_id] = (signature, self.embed(memory.memory))
+            for stale_id in set(current) - live_ids:
+                del current[stale_id]
+            return dict(current)
+
+    def rank(
+        self,
+        user_id: str,
+        memories: List[UserMemory],
+        query: str,
+        top_k: int,
+        max_tokens: int,
+        min_score: float = 0.05,
+    ) -> List[UserMemory]:
+        """Seleciona as top-k memórias relevantes respeitando o limite de tokens"""
+        if not memories:
+            return []
+        vectors = self._sync(user_id, memories)
+        query_vector = self.embed(query)
+
+        # Memórias mais recentes recebem um pequeno bônus no desempate
+        by_recency = sorted(memories, key=lambda m: m.last_updated.timestamp() if m.last_updated else 0.0)
+        recency = {m.memory_id: i / max(len(by_recency) - 1, 1) for i, m in enumerate(by_recency)}
+
+        scored = []
+        for memory in memories:
+            similarity = cosine(query_vector, vectors[memory.memory_id][1])
+            if similarity >= min_score:
+                scored.append((similarity + 0.05 * recency[memory.memory_id], memory))
+        scored.sort(key=lambda item: item[0], reverse=True)
+
+        selected, tokens = [], 0
+        for _, memory in scored[:top_k]:
+            cost = estimate_tokens(memory.memory)
+            if tokens + cost > max_tokens:
+                break
+            selected.append(memory)
+            tokens += cost
+        return selected
+
+
+class RankedMemory(DeferredMemory):
+    """Memory que injeta no prompt apenas as memórias relevantes para a pergunta"""
+
+    def __init__(
+        self,
+        *args,
+        top_k: Optional[int] = None,
+        max_tokens: Optional[int] = None,
+        index: Optional[MemoryIndex] = None,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        self.top_k = top_k or int(os.getenv("SAFEBOT_MEMORY_TOP_K", "8"))
+        self.max_tokens = max_tokens or int(os.getenv("SAFEBOT_MEMORY_MAX_TOKENS", "400"))
+        self.index = index or MemoryIndex(embedder=_embedder_from_env())
+
+    def get_user_memories(self, user_id: Optional[str] = None) -> List[UserMemory]:
+        memories = super().get_user_memories(user_id=user_id)
+        query = memory_query.get()
+        # Fora da montagem do prompt (ex.: listagem no Playground) devolve todas
+        if query is None:
+            return memories
+
+        selected = self.index.rank(user_id or "default", memories, query, self.top_k, self.max_tokens)
+        metrics.observe("safebot_memory_injected", len(selected), buckets=(0, 1, 2, 4, 8, 16, 32))
+        return selected
+
+
+def _embedder_from_env() -> Optional[Any]:
+    """SAFEBOT_MEMORY_EMBEDDER=openai usa embeddings da OpenAI; padrão é local"""
+    if os.getenv("SAFEBOT_MEMORY_EMBEDDER", "local").lower() == "openai":
+        from agno.embedder.openai import OpenAIEmbedder
+
+        return OpenAIEmbedder()
+    return None
+
+
+@contextmanager
+def ranking_query(query: Optional[str]) -> Iterator[None]:
+    """Define a pergunta usada para ranquear memórias dentro do bloco"""
+    token = memory_query.set(query)
+    try:
+        yield
+    finally:
+        memory_query.reset(token)
+
+
+# ============================================================================
+# CONSOLIDAÇÃO
+# ============================================================================
+
+def consolidate_user_memories(
+    db: MemoryDb,
+    similarity: float = 0.9,
+    max_per_user: Optional[int] = None,
+) -> int:
+    """Remove memórias duplicadas e antigas de um MemoryDb; retorna quantas foram removidas"""
+    if max_per_user is None:
+        max_per_user = int(os.getenv("SAFEBOT_MEMORY_MAX_PER_USER", "200"))
+
+    by_user: Dict[str, List[Any]] = {}
+    for row in db.read_memories(sort="desc"):
+        by_user.setdefault(row.user_id or "default", []).append(row)
+
+    removed = 0
+    for user_id, rows in by_user.items():
+        # Mais recentes primeiro: a versão mais nova de uma duplicata é mantida
+        rows.sort(key=lambda r: r.last_updated.timestamp() if r.last_updated else 0.0, reverse=True)
+        kept: List[Tuple[Any, Dict[int, float]]] = []
+        for row in rows:
+            vector = local_embedding(str(row.memory.get("memory", "")))
+            duplicate = any(cosine(vector, other) >= similarity for _, other in kept)
+            if duplicate or len(kept) >= max_per_user:
+                db.delete_memory(row.id)
+                removed += 1
+            else:
+                kept.append((row, vector))
+
+    if removed:
+        metrics.inc("safebot_memory_consolidated_total", removed)
+        logger.info(f"{removed} memórias consolidadas")
+    return removed
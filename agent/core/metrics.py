@@ -0,0 +1,184 @@
+"""
+SafeBot Metrics - Registro de métricas em processo
+Contadores, gauges e histogramas thread-safe compartilhados por todos os
+componentes (bots, web, filas em background), exportados no formato texto do
+Prometheus (render_prometheus).
+"""
+import math
+import logging
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Content-Type do formato texto do Prometheus
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Buckets padrão (segundos) para histogramas de latência
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value: str, quotes: bool = True) -> str:
+    value = value.replace("\\", "\\\\").replace("\n", "\\n")
+    return value.replace('"', '\\"') if quotes else value
+
+
+def _labels_text(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _number(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return "NaN" if math.isnan(value) else repr(float(value))
+
+
+class Histogram:
+    """Histograma cumulativo no formato Prometheus"""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts: List[int] = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+
+class MetricsRegistry:
+    """Registro central de métricas da aplicação"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._gauges: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        self._help: Dict[str, str] = {}
+        self._collectors: List[Callable[[], None]] = []
+
+    def describe(self, name: str, help_text: str):
+        """Registra a descrição de uma métrica"""
+        self._help[name] = help_text
+
+    def add_collector(self, collector: Callable[[], None]):
+        """Registra uma função que atualiza gauges na hora da exportação (pools, filas)"""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def collect(self):
+        """Executa os coletores registrados"""
+        with self._lock:
+            collectors = list(self._collectors)
+        for collector in collectors:
+            try:
+                collector()
+            except Exception as e:
+                logger.warning(f"Coletor de métricas falhou: {e}")
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        """Incrementa um contador"""
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        """Define o valor atual de um gauge"""
+        with self._lock:
+            self._gauges.setdefault(name, {})[_label_key(labels)] = value
+
+    def observe(self, name: str, value: float, buckets: Optional[Tuple[float, ...]] = None, **labels):
+        """Registra uma observação em um histograma"""
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = Histogram(buckets or DEFAULT_BUCKETS)
+            series[key].observe(value)
+
+    def get_counter(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._counters.get(name, {}).get(_label_key(labels), 0.0)
+
+    def get_gauge(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._gauges.get(name, {}).get(_label_key(labels), 0.0)
+
+    def get_histogram(self, name: str, **labels) -> Optional[Histogram]:
+        with self._lock:
+            return self._histograms.get(name, {}).get(_label_key(labels))
+
+    def snapshot(self) -> Dict[str, Dict[str, object]]:
+        """Retorna uma cópia serializável de todas as métricas"""
+        def fmt(key: LabelKey) -> str:
+            return ",".join(f"{k}={v}" for k, v in key) or "_"
+
+        with self._lock:
+            return {
+                "counters": {
+                    name: {fmt(k): v for k, v in series.items()}
+                    for name, series in self._counters.items()
+                },
+                "gauges": {
+                    name: {fmt(k): v for k, v in series.items()}
+                    for name, series in self._gauges.items()
+                },
+                "histograms": {
+                    name: {
+                        fmt(k): {"count": h.count, "sum": round(h.sum, 6), "mean": round(h.mean, 6)}
+                        for k, h in series.items()
+                    }
+                    for name, series in self._histograms.items()
+                },
+            }
+
+    def render_prometheus(self) -> str:
+        """Todas as métricas no formato texto do Prometheus (executa os coletores antes)"""
+        self.collect()
+        lines: List[str] = []
+
+        def header(name: str, kind: str):
+            if name in self._help:
+                lines.append(f"# HELP {name} {_escape(self._help[name], quotes=False)}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                header(name, "counter")
+                for key, value in series.items():
+                    lines.append(f"{name}{_labels_text(key)} {_number(value)}")
+            for name, series in sorted(self._gauges.items()):
+                header(name, "gauge")
+                for key, value in series.items():
+                    lines.append(f"{name}{_labels_text(key)} {_number(value)}")
+            for name, series in sorted(self._histograms.items()):
+                header(name, "histogram")
+                for key, histogram in series.items():
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        lines.append(f"{name}_bucket{_labels_text(key, ('le', _number(bound)))} {count}")
+                    lines.append(f"{name}_bucket{_labels_text(key, ('le', '+Inf'))} {histogram.count}")
+                    lines.append(f"{name}_sum{_labels_text(key)} {_number(histogram.sum)}")
+                    lines.append(f"{name}_count{_labels_text(key)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+# Instância global de métricas
+metrics = MetricsRegistry()
@@ -0,0 +1,228 @@
+"""
+SafeBot Models - Registro de modelos com clientes HTTP compartilhados
+O OpenAIChat do agno abre um cliente HTTP novo a cada chamada (e o Claude, um
+por instância): conexões, pools e handshakes TLS não são reaproveitados entre
+agentes, memórias e teams. Aqui cada provedor tem um cliente httpx por processo,
+com keep-alive, pool configurável e HTTP/2 quando o pacote h2 está instalado;
+os modelos entregues por create_model são objetos leves que usam esse cliente,
+com novas tentativas, circuit breaker, failover e hedging (core/resilience.py).
+"""
+import os
+import atexit
+import asyncio
+import logging
+import threading
+import weakref
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+import httpx
+from agno.models.anthropic import Claude
+from agno.models.base import Model
+from agno.models.openai import OpenAIChat
+from anthropic import Anthropic as AnthropicClient, AsyncAnthropic as AsyncAnthropicClient
+from openai import AsyncOpenAI as AsyncOpenAIClient, OpenAI as OpenAIClient
+
+from core.metrics import metrics
+from core.resilience import ResilientModel, parse_failover
+
+logger = logging.getLogger(__name__)
+
+metrics.describe("safebot_http_requests_total", "Requisições aos provedores de modelo por conexão (new/reused)")
+metrics.describe("safebot_http_clients_total", "Clientes HTTP criados por provedor e tipo (sync/async)")
+
+# Provedores com cliente compartilhado (rótulo das métricas)
+PROVIDERS = ("openai", "anthropic")
+
+_clients: Dict[str, httpx.Client] = {}
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, httpx.AsyncClient]]" = weakref.WeakKeyDictionary()
+_clients_lock = threading.Lock()
+
+
+def http2_enabled() -> bool:
+    """SAFEBOT_HTTP2: auto (padrão, se o h2 estiver instalado), true ou false"""
+    setting = os.getenv("SAFEBOT_HTTP2", "auto").lower()
+    if setting == "false":
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        if setting == "true":
+            logger.warning("SAFEBOT_HTTP2=true, mas o pacote h2 não está instalado: usando HTTP/1.1")
+        return False
+    return True
+
+
+def pool_limits() -> httpx.Limits:
+    """Limites do pool (SAFEBOT_HTTP_MAX_CONNECTIONS, SAFEBOT_HTTP_MAX_KEEPALIVE, SAFEBOT_HTTP_KEEPALIVE_SECONDS)"""
+    return httpx.Limits(
+        max_connections=int(os.getenv("SAFEBOT_HTTP_MAX_CONNECTIONS", "100")),
+        max_keepalive_connections=int(os.getenv("SAFEBOT_HTTP_MAX_KEEPALIVE", "20")),
+        keepalive_expiry=float(os.getenv("SAFEBOT_HTTP_KEEPALIVE_SECONDS", "60")),
+    )
+
+
+def _client_options() -> Dict[str, Any]:
+    return {
+        "limits": pool_limits(),
+        "http2": http2_enabled(),
+        "timeout": httpx.Timeout(float(os.getenv("SAFEBOT_HTTP_TIMEOUT_SECONDS", "600")), connect=10.0),
+    }
+
+
+class _ConnectionTracker:
+    """Event hooks do httpx que contam se a requisição abriu conexão nova ou reaproveitou uma do pool"""
+
+    def __init__(self, provider: str):
+        self.provider = provider
+
+    def _tracer(self, request: httpx.Request):
+        request._safebot_new_connection = False  # type: ignore[attr-defined]
+
+        def trace(event_name: str, info: Dict[str, Any]):
+            if event_name == "connection.connect_tcp.started":
+                request._safebot_new_connection = True  # type: ignore[attr-defined]
+
+        return trace
+
+    def _record(self, response: httpx.Response):
+        new = getattr(response.request, "_safebot_new_connection", False)
+        metrics.inc("safebot_http_requests_total", provider=self.provider, connection="new" if new else "reused")
+
+    def on_request(self, request: httpx.Request):
+        request.extensions["trace"] = self._tracer(request)
+
+    def on_response(self, response: httpx.Response):
+        self._record(response)
+
+    async def aon_request(self, request: httpx.Request):
+        sync_trace = self._tracer(request)
+
+        async def trace(event_name: str, info: Dict[str, Any]):
+            sync_trace(event_name, info)
+
+        request.extensions["trace"] = trace
+
+    async def aon_response(self, response: httpx.Response):
+        self._record(response)
+
+
+def http_client(provider: str) -> httpx.Client:
+    """Cliente HTTP síncrono do provedor, compartilhado pelo processo"""
+    with _clients_lock:
+        client = _clients.get(provider)
+        if client is None or client.is_closed:
+            tracker = _ConnectionTracker(provider)
+            client = httpx.Client(
+                event_hooks={"request": [tracker.on_request], "response": [tracker.on_response]},
+                **_client_options(),
+            )
+            _clients[provider] = client
+            metrics.inc("safebot_http_clients_total", provider=provider, kind="sync")
+        return client
+
+
+def async_http_client(provider: str) -> httpx.AsyncClient:
+    """Cliente HTTP assíncrono do provedor, um por event loop (conexões não atravessam loops)"""
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        clients = _async_clients.setdefault(loop, {})
+        client = clients.get(provider)
+        if client is None or client.is_closed:
+            tracker = _ConnectionTracker(provider)
+            client = httpx.AsyncClient(
+                event_hooks={"request": [tracker.aon_request], "response": [tracker.aon_response]},
+                **_client_options(),
+            )
+            clients[provider] = client
+            metrics.inc("safebot_http_clients_total", provider=provider, kind="async")
+        return client
+
+
+def _sdk_params(params: Dict[str, Any]) -> Dict[str, Any]:
+    """Parâmetros do cliente do SDK sem as novas tentativas próprias (quem repete é o ResilientModel)"""
+    if params.get("max_retries") is None:
+        params["max_retries"] = 0
+    return params
+
+
+@dataclass
+class PooledOpenAIChat(ResilientModel, OpenAIChat):
+    """OpenAIChat que usa os clientes HTTP compartilhados do processo"""
+
+    resilience_provider = "openai"
+    hedge_after: Optional[float] = None
+    failover: Optional[Model] = None
+
+    def get_client(self) -> OpenAIClient:
+        if self.http_client is not None:
+            return super().get_client()
+        return OpenAIClient(**_sdk_params(self._get_client_params()), http_client=http_client("openai"))
+
+    def get_async_client(self) -> AsyncOpenAIClient:
+        if self.http_client is not None:
+            return super().get_async_client()
+        return AsyncOpenAIClient(**_sdk_params(self._get_client_params()), http_client=async_http_client("openai"))
+
+
+@dataclass
+class PooledClaude(ResilientModel, Claude):
+    """Claude que usa os clientes HTTP compartilhados do processo"""
+
+    resilience_provider = "anthropic"
+    hedge_after: Optional[float] = None
+    failover: Optional[Model] = None
+
+    def get_client(self) -> AnthropicClient:
+        if self.client is None or self.client.is_closed():
+            self.client = AnthropicClient(**_sdk_params(self._get_client_params()), http_client=http_client("anthropic"))
+        return self.client
+
+    def get_async_client(self) -> AsyncAnthropicClient:
+        return AsyncAnthropicClient(**_sdk_params(self._get_client_params()), http_client=async_http_client("anthropic"))
+
+
+def create_model(model_id: str = "gpt-4o-mini", hedge_after: Optional[float] = None, failover: bool = True, **kwargs) -> Model:
+    """
+    Modelo pelo id (claude-* na Anthropic, demais na OpenAI)
+
+    Cada chamada devolve um objeto novo (o agno guarda estado da execução no
+    modelo), mas todos compartilham o cliente HTTP do provedor. hedge_after
+    ativa o hedging; o alternativo vem de SAFEBOT_MODEL_FAILOVER (mesmo provedor).
+    """
+    model_class = PooledClaude if model_id.startswith("claude") else PooledOpenAIChat
+    alternative_id = parse_failover().get(model_id) if failover else None
+    alternative = None
+    if alternative_id:
+        if alternative_id.startswith("claude") == model_id.startswith("claude"):
+            alternative = create_model(alternative_id, hedge_after=hedge_after, failover=False, **kwargs)
+        else:
+            # Mensagens de ferramenta de um provedor não valem no outro no meio de uma execução
+            logger.warning(f"Failover de {model_id} para {alternative_id} ignorado: provedores diferentes")
+    return model_class(id=model_id, hedge_after=hedge_after, failover=alternative, **kwargs)
+
+
+def http_stats() -> Dict[str, Dict[str, Any]]:
+    """Requisições e taxa de reaproveitamento de conexões por provedor"""
+    stats = {}
+    for provider in PROVIDERS:
+        new = metrics.get_counter("safebot_http_requests_total", provider=provider, connection="new")
+        reused = metrics.get_counter("safebot_http_requests_total", provider=provider, connection="reused")
+        total = new + reused
+        stats[provider] = {
+            "requests": int(total),
+            "new_connections": int(new),
+            "reuse_rate": round(reused / total, 4) if total else None,
+        }
+    return stats
+
+
+def close_http_clients():
+    """Fecha os clientes síncronos (encerramento do processo)"""
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+
+
+atexit.register(close_http_clients)
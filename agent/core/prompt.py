@@ -0,0 +1,135 @@
+"""
+SafeBot Prompt - Layout do prompt favorável ao cache de prefixo dos provedores
+OpenAI e Anthropic reaproveitam (mais barato e mais rápido) o início idêntico de
+requisições seguidas. O system prompt fica só com as partes estáticas, em ordem
+estável (instruções, membros, ferramentas); data, memórias e resumo da sessão
+vão em uma mensagem de contexto depois do histórico, logo antes da pergunta.
+A proporção de tokens servidos do cache é registrada por agente.
+"""
+import copy
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set
+
+from agno.memory.v2.memory import Memory
+from agno.models.message import Message
+
+from core.metrics import metrics
+
+metrics.describe("safebot_prompt_tokens_total", "Tokens de entrada por agente/team e tipo (input/cached)")
+
+# Partes do prompt padrão do agno que mudam a cada execução
+VOLATILE_FLAGS = ("add_datetime_to_instructions", "add_memory_references", "add_session_summary_references")
+
+_agents: Set[str] = set()
+_agents_lock = threading.Lock()
+
+
+def static_prompt(owner: Any) -> Any:
+    """
+    Cópia rasa do agente/team sem as partes voláteis, para montar o system
+    prompt do agno (o original é compartilhado por execuções simultâneas)
+    """
+    view = copy.copy(owner)
+    for flag in VOLATILE_FLAGS:
+        setattr(view, flag, False)
+    return view
+
+
+def current_time(owner: Any) -> str:
+    """Data e hora em minutos (no fuso do agente, se configurado)"""
+    tz = None
+    if getattr(owner, "timezone_identifier", None):
+        try:
+            from zoneinfo import ZoneInfo
+
+            tz = ZoneInfo(owner.timezone_identifier)
+        except Exception:
+            tz = None
+    return (datetime.now(tz) if tz else datetime.now()).strftime("%Y-%m-%d %H:%M")
+
+
+def volatile_context(owner: Any, session_id: Optional[str], user_id: Optional[str]) -> Optional[str]:
+    """Data, memórias e resumo da sessão, no formato que o agno usaria no system prompt"""
+    parts: List[str] = []
+    if owner.add_datetime_to_instructions:
+        parts.append(f"The current time is {current_time(owner)}.")
+
+    memory = owner.memory
+    user_id = user_id or "default"
+    if isinstance(memory, Memory) and owner.add_memory_references:
+        memories = memory.get_user_memories(user_id=user_id)
+        if memories:
+            lines = "\n".join(f"- {m.memory}" for m in memories)
+            parts.append(
+                "You have access to memories from previous interactions with the user that you can use:\n\n"
+                f"<memories_from_previous_interactions>\n{lines}\n</memories_from_previous_interactions>\n\n"
+                "Note: this information is from previous interactions and may be updated in this conversation. "
+                "You should always prefer information from this conversation over the past memories."
+            )
+        else:
+            parts.append(
+                "You have the capability to retain memories from previous interactions with the user, "
+                "but have not had any interactions with the user yet."
+            )
+
+    if isinstance(memory, Memory) and owner.add_session_summary_references and session_id:
+        summary = memory.summaries.get(user_id, {}).get(session_id)
+        if summary is not None:
+            parts.append(
+                "Here is a brief summary of your previous interactions:\n\n"
+                f"<summary_of_previous_interactions>\n{summary.summary}\n</summary_of_previous_interactions>\n\n"
+                "Note: this information is from previous interactions and may be outdated. "
+                "You should ALWAYS prefer information from this conversation over the past summary."
+            )
+    return "\n\n".join(parts) or None
+
+
+def add_context_message(owner: Any, run_messages: Any, session_id: Optional[str], user_id: Optional[str]) -> Any:
+    """
+    Insere o contexto volátil logo antes da pergunta (depois do histórico)
+
+    A mensagem não entra na memória da sessão (add_to_agent_memory=False), então
+    o histórico das próximas execuções continua idêntico.
+    """
+    if owner.system_message is not None or run_messages.system_message is None:
+        return run_messages  # Prompt próprio: o agno não adiciona as partes voláteis
+    content = volatile_context(owner, session_id, user_id)
+    if content is None:
+        return run_messages
+    context = Message(role=owner.system_message_role, content=content, add_to_agent_memory=False)
+    messages = run_messages.messages
+    position = len(messages)
+    if run_messages.user_message is not None and run_messages.user_message in messages:
+        position = messages.index(run_messages.user_message)
+    messages.insert(position, context)
+    return run_messages
+
+
+def record_prompt_tokens(name: Optional[str], messages: List[Message]):
+    """Soma os tokens de entrada e os servidos do cache nas respostas do modelo desta execução"""
+    answers = [m for m in messages if m.role == "assistant" and m.metrics is not None and not m.from_history]
+    input_tokens = sum(m.metrics.input_tokens for m in answers)
+    if not input_tokens:
+        return
+    name = name or "unnamed"
+    with _agents_lock:
+        _agents.add(name)
+    metrics.inc("safebot_prompt_tokens_total", input_tokens, agent=name, kind="input")
+    metrics.inc("safebot_prompt_tokens_total", sum(m.metrics.cached_tokens for m in answers), agent=name, kind="cached")
+
+
+def prompt_cache_stats() -> Dict[str, Dict[str, Any]]:
+    """Proporção de tokens de entrada servidos do cache do provedor, por agente/team"""
+    with _agents_lock:
+        names = sorted(_agents)
+    stats = {}
+    for name in names:
+        input_tokens = metrics.get_counter("safebot_prompt_tokens_total", agent=name, kind="input")
+        cached = metrics.get_counter("safebot_prompt_tokens_total", agent=name, kind="cached")
+        stats[name] = {
+            "input_tokens": int(input_tokens),
+            "cached_tokens": int(cached),
+            "cached_ratio": round(cached / input_tokens, 4) if input_tokens else None,
+        }
+    return stats
@@ -0,0 +1,451 @@
+"""
+SafeBot Resilience - Chamadas aos modelos resistentes a falhas e lentidão
+Toda chamada dos modelos criados por create_model passa por aqui:
+- novas tentativas com backoff exponencial e jitter nos erros transitórios
+  (conexão, 408/409/429/5xx), respeitando Retry-After e o prazo da requisição;
+- circuit breaker por provedor e modelo: após falhas seguidas o modelo deixa de
+  ser chamado por um tempo e as chamadas vão para o modelo alternativo do mesmo
+  provedor (SAFEBOT_MODEL_FAILOVER);
+- requisições "hedged" opcionais nos caminhos sensíveis à latência: se a
+  resposta atrasa além do limite do alvo (SAFEBOT_HEDGE), uma segunda
+  requisição idêntica é feita e vale a que chegar primeiro.
+As ferramentas chamadas pelo modelo também respeitam o prazo da requisição.
+O efeito de cada política é exportado em métricas.
+"""
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+from agno.exceptions import ModelProviderError
+
+from core.deadline import check_deadline, current_deadline, run_in_context, with_deadline_hook
+from core.metrics import metrics
+from core.telemetry import watch_executor
+
+logger = logging.getLogger(__name__)
+
+metrics.describe("safebot_llm_calls_total", "Chamadas aos modelos por resultado (ok/error/rejected)")
+metrics.describe("safebot_llm_retries_total", "Novas tentativas de chamadas aos modelos por motivo")
+metrics.describe("safebot_llm_circuit_state", "Estado do circuit breaker por modelo (0 fechado, 1 meio-aberto, 2 aberto)")
+metrics.describe("safebot_llm_circuit_transitions_total", "Mudanças de estado do circuit breaker")
+metrics.describe("safebot_llm_failovers_total", "Chamadas desviadas para o modelo alternativo por motivo (open/error)")
+metrics.describe("safebot_llm_hedges_total", "Requisições hedged por resultado (fired/won/lost)")
+
+# Status HTTP transitórios (529: Anthropic sobrecarregada)
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504, 529}
+
+# Modelo alternativo padrão (mesmo provedor: o formato das mensagens de ferramenta não muda)
+DEFAULT_FAILOVER = {
+    "gpt-4o": "gpt-4o-mini",
+    "gpt-4o-mini": "gpt-4.1-mini",
+    "claude-3-5-sonnet-20241022": "claude-3-5-haiku-20241022",
+}
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+_EMPTY = object()
+
+
+class CircuitOpenError(ModelProviderError):
+    """Modelo com o circuito aberto e sem alternativo disponível"""
+
+    def __init__(self, provider: str, model_id: str, retry_in: float):
+        super().__init__(
+            f"{provider}/{model_id} indisponível (circuito aberto por mais {retry_in:.0f}s)",
+            status_code=503,
+            model_id=model_id,
+        )
+
+
+def error_reason(error: BaseException) -> Optional[str]:
+    """Motivo da falha se ela for transitória (status HTTP ou 'connection'); None se não vale repetir"""
+    if isinstance(error, CircuitOpenError):
+        return None
+    cause = error.__cause__ if isinstance(error, ModelProviderError) and error.__cause__ is not None else error
+    if isinstance(cause, httpx.TransportError) or type(cause).__name__ in ("APIConnectionError", "APITimeoutError"):
+        return "connection"
+    status = getattr(cause, "status_code", None)
+    return str(status) if status in RETRYABLE_STATUS else None
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """Segundos pedidos pelo provedor no cabeçalho Retry-After, se houver"""
+    response = getattr(error.__cause__ or error, "response", None)
+    try:
+        return float(response.headers["retry-after"])
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
+
+
+def parse_failover(raw: Optional[str] = None) -> Dict[str, str]:
+    """'modelo=alternativo,...' sobre os padrões (alternativo vazio desativa)"""
+    raw = os.getenv("SAFEBOT_MODEL_FAILOVER", "") if raw is None else raw
+    failover = dict(DEFAULT_FAILOVER)
+    for item in raw.split(","):
+        if "=" in item:
+            model_id, alternative = item.split("=", 1)
+            failover[model_id.strip()] = alternative.strip()
+    return {model_id: alternative for model_id, alternative in failover.items() if alternative}
+
+
+def parse_hedge_config(raw: Optional[str] = None) -> Dict[str, float]:
+    """'alvo=segundos,...' -> {alvo: segundos} (mesmos alvos da cascata)"""
+    raw = os.getenv("SAFEBOT_HEDGE", "") if raw is None else raw
+    config = {}
+    for item in raw.split(","):
+        if "=" in item:
+            target, seconds = item.split("=", 1)
+            config[target.strip()] = float(seconds)
+    return config
+
+
+def hedge_delay(target: str) -> Optional[float]:
+    """Limite para disparar a requisição hedged do alvo ("web.auditor" herda de "web")"""
+    config = parse_hedge_config()
+    parts = target.split(".")
+    for size in range(len(parts), 0, -1):
+        key = ".".join(parts[:size])
+        if key in config:
+            return config[key] or None
+    return None
+
+
+class RetryPolicy:
+    """Novas tentativas com backoff exponencial e jitter completo"""
+
+    def __init__(self, retries: Optional[int] = None, base: Optional[float] = None, cap: Optional[float] = None):
+        self.retries = retries if retries is not None else int(os.getenv("SAFEBOT_LLM_RETRIES", "2"))
+        self.base = base if base is not None else float(os.getenv("SAFEBOT_LLM_BACKOFF_SECONDS", "0.5"))
+        self.cap = cap if cap is not None else float(os.getenv("SAFEBOT_LLM_BACKOFF_MAX_SECONDS", "8"))
+
+    def delay(self, attempt: int, error: BaseException) -> Optional[float]:
+        """Espera antes da próxima tentativa; None se não há tempo (prazo da requisição)"""
+        delay = random.uniform(0, min(self.cap, self.base * 2 ** attempt))
+        requested = retry_after(error)
+        if requested is not None:
+            delay = max(delay, min(requested, self.cap))
+        deadline = current_deadline()
+        if deadline is not None and deadline.remaining() <= delay:
+            return None
+        return delay
+
+
+class CircuitBreaker:
+    """Circuito por provedor e modelo: abre após falhas seguidas, testa com uma chamada depois do intervalo"""
+
+    def __init__(self, provider: str, model_id: str, failures: Optional[int] = None, open_seconds: Optional[float] = None):
+        self.provider = provider
+        self.model_id = model_id
+        self.threshold = failures or int(os.getenv("SAFEBOT_CIRCUIT_FAILURES", "5"))
+        self.open_seconds = open_seconds or float(os.getenv("SAFEBOT_CIRCUIT_OPEN_SECONDS", "30"))
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        self._publish()
+
+    def _publish(self):
+        metrics.set_gauge("safebot_llm_circuit_state", STATE_VALUES[self.state], provider=self.provider, model=self.model_id)
+
+    def _move(self, state: str):
+        if state != self.state:
+            self.state = state
+            self._publish()
+            metrics.inc("safebot_llm_circuit_transitions_total", provider=self.provider, model=self.model_id, state=state)
+            log = logger.warning if state == OPEN else logger.info
+            log(f"Circuito {self.provider}/{self.model_id}: {state}")
+
+    @property
+    def retry_in(self) -> float:
+        return max(self.opened_at + self.open_seconds - time.monotonic(), 0.0)
+
+    def allow(self) -> bool:
+        """Se a chamada pode seguir (no meio-aberto, só uma chamada de teste por vez)"""
+        with self._lock:
+            if self.state == OPEN and self.retry_in <= 0:
+                self._move(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                if self._probing:
+                    return False
+                self._probing = True
+                return True
+            return self.state == CLOSED
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self._probing = False
+            self._move(CLOSED)
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == HALF_OPEN or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+                self._move(OPEN)
+
+    def release(self):
+        """Chamada de teste terminou sem veredito (erro não transitório)"""
+        with self._lock:
+            self._probing = False
+
+
+_breakers: Dict[Tuple[str, str], CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def circuit_breaker(provider: str, model_id: str) -> CircuitBreaker:
+    """Circuit breaker compartilhado pelo processo"""
+    with _breakers_lock:
+        breaker = _breakers.get((provider, model_id))
+        if breaker is None:
+            breaker = _breakers[(provider, model_id)] = CircuitBreaker(provider, model_id)
+        return breaker
+
+
+_hedge_executor: Optional[ThreadPoolExecutor] = None
+_hedge_executor_lock = threading.Lock()
+
+
+def hedge_executor() -> ThreadPoolExecutor:
+    """Pool das requisições hedged síncronas (SAFEBOT_HEDGE_WORKERS)"""
+    global _hedge_executor
+    with _hedge_executor_lock:
+        if _hedge_executor is None:
+            _hedge_executor = ThreadPoolExecutor(
+                max_workers=int(os.getenv("SAFEBOT_HEDGE_WORKERS", "16")),
+                thread_name_prefix="safebot-hedge",
+            )
+            watch_executor("hedge", _hedge_executor)
+        return _hedge_executor
+
+
+def _hedged(call: Callable[[], Any], delay: float, labels: Dict[str, str]) -> Any:
+    executor = hedge_executor()
+    primary = executor.submit(run_in_context(call))
+    if wait([primary], timeout=delay).done:
+        return primary.result()
+
+    metrics.inc("safebot_llm_hedges_total", outcome="fired", **labels)
+    backup = executor.submit(run_in_context(call))
+    pending, error = {primary, backup}, None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                # A requisição perdedora não é interrompida (sem cancelamento em chamadas síncronas)
+                metrics.inc("safebot_llm_hedges_total", outcome="won" if future is backup else "lost", **labels)
+                return future.result()
+            error = future.exception()
+    raise error
+
+
+async def _ahedged(call: Callable[[], Awaitable[Any]], delay: float, labels: Dict[str, str]) -> Any:
+    primary = asyncio.ensure_future(call())
+    done, _ = await asyncio.wait({primary}, timeout=delay)
+    if done:
+        return primary.result()
+
+    metrics.inc("safebot_llm_hedges_total", outcome="fired", **labels)
+    backup = asyncio.ensure_future(call())
+    pending, error = {primary, backup}, None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    metrics.inc("safebot_llm_hedges_total", outcome="won" if task is backup else "lost", **labels)
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+class ResilientModel:
+    """
+    Mixin dos modelos do SafeBot: novas tentativas, circuit breaker, failover e hedging em torno do invoke do agno
+
+    As respostas em streaming repetem só até o primeiro trecho (depois dele a
+    resposta já chegou ao usuário) e não usam hedging. As chamadas de
+    ferramentas passam pelo hook do prazo (core.deadline.with_deadline_hook).
+    """
+
+    resilience_provider = "openai"
+    hedge_after: Optional[float] = None
+    failover: Optional[Any] = None
+
+    def _labels(self) -> Dict[str, str]:
+        return {"provider": self.resilience_provider, "model": self.id}
+
+    def _start(self, breaker: CircuitBreaker, labels: Dict[str, str]) -> bool:
+        """Se o modelo pode ser chamado; False desvia para o alternativo"""
+        if breaker.allow():
+            return True
+        metrics.inc("safebot_llm_calls_total", result="rejected", **labels)
+        if self.failover is None:
+            raise CircuitOpenError(breaker.provider, breaker.model_id, breaker.retry_in)
+        metrics.inc("safebot_llm_failovers_total", to=self.failover.id, reason="open", **labels)
+        return False
+
+    def _failed(self, breaker: CircuitBreaker, labels: Dict[str, str], attempt: int, error: BaseException, policy: RetryPolicy) -> Optional[float]:
+        """Registra a falha; devolve a espera até a próxima tentativa ou None para desistir"""
+        reason = error_reason(error)
+        if reason is None:
+            breaker.release()
+            metrics.inc("safebot_llm_calls_total", result="error", **labels)
+            raise error
+        breaker.failure()
+        delay = policy.delay(attempt, error) if attempt < policy.retries and breaker.state == CLOSED else None
+        if delay is None:
+            metrics.inc("safebot_llm_calls_total", result="error", **labels)
+            return None
+        metrics.inc("safebot_llm_retries_total", reason=reason, **labels)
+        logger.warning(f"{labels['provider']}/{labels['model']} falhou ({reason}); nova tentativa em {delay:.1f}s")
+        return delay
+
+    def _give_up(self, error: BaseException, labels: Dict[str, str]) -> bool:
+        """Se há alternativo para a falha definitiva (senão o erro sobe)"""
+        if self.failover is None:
+            return False
+        metrics.inc("safebot_llm_failovers_total", to=self.failover.id, reason="error", **labels)
+        logger.warning(f"{labels['provider']}/{labels['model']} indisponível: usando {self.failover.id} ({error})")
+        return True
+
+    def _resilient(self, call: Callable[[], Any], failover: Callable[[], Any], hedge: bool = False) -> Any:
+        labels = self._labels()
+        breaker = circuit_breaker(labels["provider"], labels["model"])
+        policy = RetryPolicy()
+        for attempt in range(policy.retries + 1):
+            check_deadline()
+            if not self._start(breaker, labels):
+                return failover()
+            try:
+                result = _hedged(call, self.hedge_after, labels) if hedge and self.hedge_after else call()
+            except Exception as e:
+                delay = self._failed(breaker, labels, attempt, e, policy)
+                if delay is None:
+                    if self._give_up(e, labels):
+                        return failover()
+                    raise
+                time.sleep(delay)
+                continue
+            breaker.success()
+            metrics.inc("safebot_llm_calls_total", result="ok", **labels)
+            return result
+
+    async def _aresilient(self, call: Callable[[], Awaitable[Any]], failover: Callable[[], Awaitable[Any]], hedge: bool = False) -> Any:
+        labels = self._labels()
+        breaker = circuit_breaker(labels["provider"], labels["model"])
+        policy = RetryPolicy()
+        for attempt in range(policy.retries + 1):
+            check_deadline()
+            if not self._start(breaker, labels):
+                return await failover()
+            try:
+                result = await (_ahedged(call, self.hedge_after, labels) if hedge and self.hedge_after else call())
+            except Exception as e:
+                delay = self._failed(breaker, labels, attempt, e, policy)
+                if delay is None:
+                    if self._give_up(e, labels):
+                        return await failover()
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            breaker.success()
+            metrics.inc("safebot_llm_calls_total", result="ok", **labels)
+            return result
+
+    def run_function_calls(self, function_calls: List[Any], *args, **kwargs) -> Iterator[Any]:
+        return super().run_function_calls(with_deadline_hook(function_calls), *args, **kwargs)
+
+    def arun_function_calls(self, function_calls: List[Any], *args, **kwargs) -> AsyncIterator[Any]:
+        return super().arun_function_calls(with_deadline_hook(function_calls, asynchronous=True), *args, **kwargs)
+
+    def invoke(self, *args, **kwargs) -> Any:
+        return self._resilient(
+            lambda: super(ResilientModel, self).invoke(*args, **kwargs),
+            lambda: self.failover.invoke(*args, **kwargs),
+            hedge=True,
+        )
+
+    async def ainvoke(self, *args, **kwargs) -> Any:
+        return await self._aresilient(
+            lambda: super(ResilientModel, self).ainvoke(*args, **kwargs),
+            lambda: self.failover.ainvoke(*args, **kwargs),
+            hedge=True,
+        )
+
+    def invoke_stream(self, *args, **kwargs) -> Iterator[Any]:
+        def open_stream(stream: Callable[[], Iterator[Any]]) -> Callable[[], Tuple[Iterator[Any], Any]]:
+            def first():
+                iterator = iter(stream())
+                return iterator, next(iterator, _EMPTY)
+
+            return first
+
+        iterator, chunk = self._resilient(
+            open_stream(lambda: super(ResilientModel, self).invoke_stream(*args, **kwargs)),
+            open_stream(lambda: self.failover.invoke_stream(*args, **kwargs)),
+        )
+        if chunk is not _EMPTY:
+            yield chunk
+            yield from iterator
+
+    async def ainvoke_stream(self, *args, **kwargs) -> AsyncIterator[Any]:
+        def open_stream(stream: Callable[[], AsyncIterator[Any]]) -> Callable[[], Awaitable[Tuple[AsyncIterator[Any], Any]]]:
+            async def first():
+                iterator = stream().__aiter__()
+                try:
+                    return iterator, await iterator.__anext__()
+                except StopAsyncIteration:
+                    return iterator, _EMPTY
+
+            return first
+
+        iterator, chunk = await self._aresilient(
+            open_stream(lambda: super(ResilientModel, self).ainvoke_stream(*args, **kwargs)),
+            open_stream(lambda: self.failover.ainvoke_stream(*args, **kwargs)),
+        )
+        if chunk is not _EMPTY:
+            yield chunk
+            async for chunk in iterator:
+                yield chunk
+
+
+def resilience_stats() -> Dict[str, Dict[str, Any]]:
+    """Estado dos circuitos e efeito das políticas por modelo"""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    failover = parse_failover()
+    stats = {}
+    for breaker in breakers:
+        labels = {"provider": breaker.provider, "model": breaker.model_id}
+        calls = {result: metrics.get_counter("safebot_llm_calls_total", result=result, **labels) for result in ("ok", "error", "rejected")}
+        alternative = failover.get(breaker.model_id)
+        stats[f"{breaker.provider}/{breaker.model_id}"] = {
+            "circuit": breaker.state,
+            "calls": int(sum(calls.values())),
+            "errors": int(calls["error"]),
+            "retries": int(sum(
+                metrics.get_counter("safebot_llm_retries_total", reason=reason, **labels)
+                for reason in ["connection", *map(str, RETRYABLE_STATUS)]
+            )),
+            "failovers": int(sum(
+                metrics.get_counter("safebot_llm_failovers_total", to=alternative, reason=reason, **labels)
+                for reason in ("open", "error")
+            )) if alternative else 0,
+            "hedges_fired": int(metrics.get_counter("safebot_llm_hedges_total", outcome="fired", **labels)),
+            "hedges_won": int(metrics.get_counter("safebot_llm_hedges_total", outcome="won", **labels)),
+        }
+    return stats
@@ -0,0 +1,215 @@
+"""
+SafeBot Router - Pré-roteamento local para teams em modo route
+Um classificador TF-IDF (sem chamada de rede) decide o especialista das
+perguntas claras em menos de 1 ms; só as ambíguas vão para o roteador LLM. O
+modelo é treinado com os critérios de roteamento do team, as especialidades de
+cada membro e as decisões do roteador LLM registradas em log.
+"""
+import os
+import re
+import json
+import math
+import time
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from core.memory import tokenize
+
+logger = logging.getLogger(__name__)
+
+Example = Tuple[str, str]  # (texto, nome do membro)
+
+
+class RouteDecision(NamedTuple):
+    member: Optional[str]  # None quando a confiança é baixa (usar o roteador LLM)
+    best: Optional[str]
+    score: float
+    margin: float
+
+
+def features(text: str) -> List[str]:
+    """Palavras normalizadas e prefixos de 5 letras (aproxima flexões)"""
+    tokens = tokenize(text)
+    return tokens + [t[:5] for t in tokens if len(t) > 5]
+
+
+def seed_examples(members: Sequence[Any], instructions: Optional[Iterable[str]] = None) -> List[Example]:
+    """Exemplos iniciais a partir do papel e das especialidades de cada membro e dos critérios do team"""
+    names = {member.name for member in members if member.name}
+    examples: List[Example] = []
+    for member in members:
+        if not member.name:
+            continue
+        for line in [member.role or ""] + list(member.instructions or []):
+            text = line.strip(" •-")
+            if len(text) > 3:
+                examples.append((text, member.name))
+    # Critérios do líder no formato "• Nome: descrição"
+    for line in instructions or []:
+        match = re.match(r"\W*([^:]+):\s*(.+)", line)
+        if match and match.group(1).strip() in names:
+            examples.append((match.group(2), match.group(1).strip()))
+    return examples
+
+
+class TfidfRouter:
+    """Centroides TF-IDF por membro com limiar de confiança"""
+
+    def __init__(self, min_score: Optional[float] = None, min_margin: Optional[float] = None):
+        self.min_score = min_score if min_score is not None else float(os.getenv("SAFEBOT_ROUTER_MIN_SCORE", "0.15"))
+        self.min_margin = min_margin if min_margin is not None else float(os.getenv("SAFEBOT_ROUTER_MIN_MARGIN", "0.3"))
+        self.idf: Dict[str, float] = {}
+        self.centroids: Dict[str, Dict[str, float]] = {}
+
+    def _vector(self, terms: List[str]) -> Dict[str, float]:
+        vector: Dict[str, float] = {}
+        for term in terms:
+            if term in self.idf:
+                vector[term] = vector.get(term, 0.0) + self.idf[term]
+        norm = math.sqrt(sum(v * v for v in vector.values()))
+        return {k: v / norm for k, v in vector.items()} if norm else {}
+
+    def fit(self, examples: Iterable[Example]) -> "TfidfRouter":
+        documents = [(features(text), member) for text, member in examples]
+        frequency: Dict[str, int] = {}
+        for terms, _ in documents:
+            for term in set(terms):
+                frequency[term] = frequency.get(term, 0) + 1
+        total = len(documents)
+        self.idf = {term: math.log((1 + total) / (1 + count)) + 1 for term, count in frequency.items()}
+
+        sums: Dict[str, Dict[str, float]] = {}
+        for terms, member in documents:
+            centroid = sums.setdefault(member, {})
+            for term, weight in self._vector(terms).items():
+                centroid[term] = centroid.get(term, 0.0) + weight
+        self.centroids = {}
+        for member, centroid in sums.items():
+            norm = math.sqrt(sum(v * v for v in centroid.values()))
+            self.centroids[member] = {k: v / norm for k, v in centroid.items()} if norm else {}
+        return self
+
+    def scores(self, text: str) -> Dict[str, float]:
+        query = self._vector(features(text))
+        return {
+            member: sum(weight * centroid.get(term, 0.0) for term, weight in query.items())
+            for member, centroid in self.centroids.items()
+        }
+
+    def predict(self, text: str) -> RouteDecision:
+        ranked = sorted(self.scores(text).items(), key=lambda item: item[1], reverse=True)
+        if not ranked or ranked[0][1] <= 0:
+            return RouteDecision(None, None, 0.0, 0.0)
+        best, score = ranked[0]
+        second = ranked[1][1] if len(ranked) > 1 else 0.0
+        margin = (score - second) / score
+        confident = score >= self.min_score and margin >= self.min_margin
+        return RouteDecision(best if confident else None, best, round(score, 4), round(margin, 4))
+
+    def evaluate(self, labelled: Sequence[Example]) -> Dict[str, Any]:
+        """Acurácia no conjunto rotulado: geral, nas decisões locais e cobertura local"""
+        correct = local = local_correct = 0
+        started = time.perf_counter()
+        for text, expected in labelled:
+            decision = self.predict(text)
+            correct += decision.best == expected
+            if decision.member is not None:
+                local += 1
+                local_correct += decision.member == expected
+        elapsed = time.perf_counter() - started
+        total = len(labelled)
+        return {
+            "examples": total,
+            "accuracy": round(correct / total, 4) if total else None,
+            "local_coverage": round(local / total, 4) if total else None,
+            "local_accuracy": round(local_correct / local, 4) if local else None,
+            "mean_latency_ms": round(elapsed / total * 1000, 4) if total else None,
+        }
+
+
+class RoutingLog:
+    """Decisões do roteador LLM em JSONL, reaproveitadas como exemplos de treino
+
+    O arquivo guarda o texto das perguntas dos usuários como chegaram: trate-o
+    como dado pessoal (fora de backups públicos e do controle de versão). Ele
+    mantém só as max_entries decisões mais recentes (SAFEBOT_ROUTER_LOG_MAX_ENTRIES).
+    """
+
+    def __init__(self, path: Optional[str] = None, max_entries: Optional[int] = None):
+        self.path = Path(path or os.getenv("SAFEBOT_ROUTER_LOG", "tmp/routing_log.jsonl"))
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv("SAFEBOT_ROUTER_LOG_MAX_ENTRIES", "5000"))
+        self._lock = threading.Lock()
+        self._count: Optional[int] = None  # Linhas no arquivo (contadas na primeira escrita)
+
+    def append(self, query: str, member: str, source: str = "llm"):
+        record = {"query": query, "member": member, "source": source, "ts": int(time.time())}
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            if self._count is None:
+                self._count = _count_lines(self.path)
+            with self.path.open("a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._count += 1
+            # Folga de 10% para não reescrever o arquivo a cada decisão
+            if self.max_entries > 0 and self._count > self.max_entries + max(1, self.max_entries // 10):
+                self._truncate()
+
+    def _truncate(self):
+        with self.path.open(encoding="utf-8") as f:
+            lines = [line for line in f if line.strip()][-self.max_entries:]
+        partial = self.path.with_suffix(self.path.suffix + ".tmp")
+        with partial.open("w", encoding="utf-8") as f:
+            f.writelines(lines)
+        os.replace(partial, self.path)
+        self._count = len(lines)
+
+    def examples(self, source: str = "llm") -> List[Example]:
+        return [(text, member) for text, member, record_source in _read_jsonl(self.path) if record_source == source]
+
+
+def _count_lines(path: Path) -> int:
+    if not path.exists():
+        return 0
+    with path.open(encoding="utf-8") as f:
+        return sum(1 for line in f if line.strip())
+
+
+def _read_jsonl(path: Path) -> List[Tuple[str, str, str]]:
+    """Registros (pergunta, membro, origem); linhas truncadas ou inválidas são ignoradas"""
+    if not path.exists():
+        return []
+    records = []
+    skipped = 0
+    with path.open(encoding="utf-8", errors="replace") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                records.append((str(record["query"]), str(record["member"]), record.get("source", "llm")))
+            except (ValueError, KeyError, TypeError, AttributeError):
+                skipped += 1
+    if skipped:
+        logger.warning(f"⚠️ {path}: {skipped} linha(s) inválida(s) ignorada(s)")
+    return records
+
+
+def load_labelled(path: str) -> List[Example]:
+    """Conjunto rotulado em JSONL ({"query": ..., "member": ...})"""
+    return [(text, member) for text, member, _ in _read_jsonl(Path(path))]
+
+
+def create_pre_router(members: Sequence[Any], instructions: Optional[Iterable[str]] = None,
+                      keywords: Optional[Dict[str, str]] = None,
+                      log: Optional[RoutingLog] = None) -> Optional[TfidfRouter]:
+    """Treina o pré-roteador (SAFEBOT_ROUTER_ENABLED=false desativa)"""
+    if os.getenv("SAFEBOT_ROUTER_ENABLED", "true").lower() != "true":
+        return None
+    examples = seed_examples(members, instructions)
+    examples += [(text, member) for member, text in (keywords or {}).items()]
+    if log is not None:
+        known = {member.name for member in members}
+        examples += [(text, member) for text, member in log.examples() if member in known]
+    return TfidfRouter().fit(examples)
@@ -0,0 +1,731 @@
+"""
+SafeBot Runtime - Extensões do Agent e do Team do agno usadas pelas factories
+Centraliza os ganchos do SafeBot na execução dos agentes sem alterar a API do agno.
+"""
+import os
+import json
+import asyncio
+import inspect
+import time
+import logging
+import threading
+import uuid
+from functools import partial
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from dataclasses import dataclass, fields
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple, Union
+from agno.agent import Agent
+from agno.memory.team import TeamMemory
+from agno.run.response import RunEvent, RunResponse, RunResponseContentEvent
+from agno.run.team import RunResponseContentEvent as TeamRunResponseContentEvent, TeamRunResponse
+from agno.team import Team
+from agno.tools.function import Function
+
+from core.deadline import (
+    bounded,
+    check_deadline,
+    current_deadline,
+    run_abandoned,
+    run_in_context,
+)
+from core.memo import SubAnswerCache
+from core.memory import ranking_query
+from core.metrics import metrics
+from core.prompt import add_context_message, record_prompt_tokens, static_prompt
+from core.router import RoutingLog, TfidfRouter
+from core.telemetry import aobserve_run, observe_run, record_run_messages, stage, watch_executor
+
+logger = logging.getLogger(__name__)
+
+metrics.describe("safebot_team_member_seconds", "Duração das execuções de membros de teams por status")
+metrics.describe("safebot_router_decisions_total", "Decisões de roteamento por origem (local/llm)")
+metrics.describe("safebot_router_seconds", "Tempo de decisão do pré-roteador local")
+
+ROUTER_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01)
+
+# Argumentos de Team.run repassados ao membro quando o pré-roteador decide
+ROUTED_RUN_ARGS = ("user_id", "session_id", "images", "videos", "audio", "files", "knowledge_filters", "stream_intermediate_steps")
+
+MEMBER_BUCKETS = (1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 45.0, 60.0, 90.0, 120.0)
+
+_member_executor: Optional[ThreadPoolExecutor] = None
+_member_executor_lock = threading.Lock()
+
+
+def run_input_text(run_input: Any) -> Optional[str]:
+    """Extrai o texto da pergunta atual a partir do run_input do agno"""
+    if run_input is None:
+        return None
+    if isinstance(run_input, str):
+        return run_input
+    if isinstance(run_input, dict):
+        content = run_input.get("content")
+        return content if isinstance(content, str) else None
+    if isinstance(run_input, list):
+        for item in reversed(run_input):
+            if isinstance(item, dict) and item.get("role") == "user":
+                return run_input_text(item)
+    return None
+
+
+class SafeBotAgent(Agent):
+    """
+    Agent do agno que ranqueia as memórias pela pergunta atual ao montar o prompt
+    e respeita o prazo da requisição (não começa após ele, e os modelos de
+    create_model não chamam ferramentas depois dele; execuções substituídas ou
+    fora do prazo não entram no histórico da sessão)
+
+    O system prompt só tem partes estáticas; data e memórias vão depois do
+    histórico (core.prompt), preservando o prefixo em cache no provedor.
+    Execuções, etapas e tokens vão para as métricas (core.telemetry).
+    """
+
+    def run(self, *args, **kwargs):
+        check_deadline()
+        return observe_run(self, "agent", partial(super().run, *args, **kwargs))
+
+    async def arun(self, *args, **kwargs):
+        check_deadline()
+        return await aobserve_run(self, "agent", partial(super().arun, *args, **kwargs))
+
+    def get_system_message(self, session_id: str, user_id: Optional[str] = None):
+        return Agent.get_system_message(static_prompt(self), session_id=session_id, user_id=user_id)
+
+    def get_run_messages(self, *, session_id: str, user_id: Optional[str] = None, **kwargs):
+        run_messages = super().get_run_messages(session_id=session_id, user_id=user_id, **kwargs)
+        with ranking_query(run_input_text(self.run_input)):
+            return add_context_message(self, run_messages, session_id, user_id)
+
+    def aggregate_metrics_from_messages(self, messages):
+        record_prompt_tokens(self.name, messages)
+        record_run_messages(self.name, messages)
+        return super().aggregate_metrics_from_messages(messages)
+
+    def get_relevant_docs_from_knowledge(self, *args, **kwargs):
+        with stage(self.name, "retrieval"):
+            return super().get_relevant_docs_from_knowledge(*args, **kwargs)
+
+    async def aget_relevant_docs_from_knowledge(self, *args, **kwargs):
+        with stage(self.name, "retrieval"):
+            return await super().aget_relevant_docs_from_knowledge(*args, **kwargs)
+
+    def read_from_storage(self, *args, **kwargs):
+        with stage(self.name, "storage"):
+            return super().read_from_storage(*args, **kwargs)
+
+    def write_to_storage(self, *args, **kwargs):
+        if run_abandoned():
+            return self.agent_session  # Resposta não entregue: o histórico salvo fica como estava
+        with stage(self.name, "storage"):
+            return super().write_to_storage(*args, **kwargs)
+
+    def _add_run_to_memory(self, *args, **kwargs):
+        if not run_abandoned():
+            super()._add_run_to_memory(*args, **kwargs)
+
+
+def member_executor() -> ThreadPoolExecutor:
+    """Pool compartilhado para execuções paralelas de membros (SAFEBOT_MEMBER_WORKERS)"""
+    global _member_executor
+    with _member_executor_lock:
+        if _member_executor is None:
+            _member_executor = ThreadPoolExecutor(
+                max_workers=int(os.getenv("SAFEBOT_MEMBER_WORKERS", "16")),
+                thread_name_prefix="safebot-member",
+            )
+            watch_executor("team_members", _member_executor)
+        return _member_executor
+
+
+def member_output(member_name: str, response: Optional[RunResponse]) -> str:
+    """Texto da resposta de um membro, no mesmo formato usado pelo agno"""
+    if response is None:
+        return "No response from the member agent."
+    if isinstance(response.content, str) and response.content.strip():
+        return response.content.strip()
+    if response.content is None or isinstance(response.content, str):
+        results = [str(tool.result) for tool in (response.tools or []) if tool.result]
+        return ",".join(results) if results else "No response from the member agent."
+    if hasattr(response.content, "model_dump_json"):
+        return response.content.model_dump_json(indent=2)
+    return json.dumps(response.content, indent=2)
+
+
+def detached_copy(member: Agent) -> Agent:
+    """
+    Cópia de um membro para o team seguir usando enquanto a original termina em outra thread
+
+    Agent.deep_copy do agno falha em membros já inicializados pelo team (campos
+    como team_session_id não são aceitos pelo construtor); aqui só os campos do
+    construtor são copiados e a memória continua compartilhada.
+    """
+    accepted = inspect.signature(type(member).__init__).parameters
+    values = {
+        f.name: member._deep_copy_field(f.name, getattr(member, f.name))
+        for f in fields(member)
+        if f.name in accepted and f.name != "agent_session" and getattr(member, f.name) is not None
+    }
+    values["memory"] = member.memory
+    return type(member)(**values)
+
+
+class MemberRunError(Exception):
+    """Falha na execução de um membro (a causa fica em __cause__)"""
+
+    def __init__(self, finished_at: float):
+        super().__init__("member run failed")
+        self.finished_at = finished_at
+
+
+def _timed_run(member: Agent, *args, **kwargs) -> Tuple[RunResponse, float]:
+    try:
+        return member.run(*args, **kwargs), time.monotonic()
+    except Exception as e:
+        raise MemberRunError(time.monotonic()) from e
+
+
+@dataclass
+class _MemberJob:
+    index: int
+    member: Agent
+    task_description: str
+    future: Future
+    started_at: float
+    deadline: float
+    memo_key: Optional[str] = None
+    cached: bool = False
+
+
+class SafeBotTeam(Team):
+    """
+    Team do agno com delegação paralela para os membros
+
+    No modo coordinate, as delegações (transfer_task_to_member) emitidas pelo
+    líder na mesma resposta rodam ao mesmo tempo; no modo collaborate, todos os
+    membros rodam ao mesmo tempo. Vale para run e arun (Playground): no arun, o
+    agno já executa juntas as chamadas de ferramenta de uma resposta e os
+    membros rodam no mesmo pool de threads. Cada membro tem o próprio prazo
+    (SAFEBOT_MEMBER_TIMEOUT_SECONDS): membros atrasados ou com erro viram uma
+    nota para o líder, que sintetiza a partir de quem respondeu. O tempo de cada
+    membro fica em run_response.metrics["member_timings"]. Com sub_answers, as
+    respostas dos membros são reaproveitadas para a mesma sub-tarefa (status
+    "cached" nos tempos).
+
+    No modo route, um pré-roteador local (pre_router) encaminha as perguntas
+    claras direto ao especialista, sem a chamada do LLM roteador; as decisões
+    do LLM nas demais perguntas vão para o routing_log e treinam o pré-roteador.
+
+    Como no SafeBotAgent, memórias e data saem do system prompt e vão para
+    depois do histórico, mantendo estável o prefixo das instruções do líder.
+    """
+
+    def __init__(
+        self,
+        *args,
+        member_timeout: Optional[float] = None,
+        pre_router: Optional[TfidfRouter] = None,
+        routing_log: Optional[RoutingLog] = None,
+        sub_answers: Optional[SubAnswerCache] = None,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        self.member_timeout = member_timeout or float(os.getenv("SAFEBOT_MEMBER_TIMEOUT_SECONDS", "45"))
+        self.pre_router = pre_router
+        self.routing_log = routing_log
+        self.sub_answers = sub_answers
+        self.member_timings: List[Dict[str, Any]] = []
+        self._delegation: Dict[str, Any] = {}
+        self._prefetched: Dict[Tuple[str, str], _MemberJob] = {}
+
+    # ------------------------------------------------------------------
+    # Execução
+    # ------------------------------------------------------------------
+
+    def run(self, message: Any = None, *, stream: Optional[bool] = None, **kwargs):
+        check_deadline()
+        return observe_run(self, "team", partial(self._execute, message, stream=stream, **kwargs))
+
+    def _execute(self, message: Any, stream: Optional[bool], **kwargs):
+        self.member_timings = []
+        self._prefetched = {}
+        routed_by_llm = False
+        if self.mode == "route" and self.pre_router is not None and isinstance(message, str):
+            member = self._pre_route(message)
+            if member is not None:
+                return self._run_routed(member, message, stream=bool(self.stream) if stream is None else stream, **kwargs)
+            routed_by_llm = True
+
+        result = super().run(message, stream=stream, **kwargs)
+        if isinstance(result, TeamRunResponse):
+            self._finish_run(result, message if routed_by_llm else None)
+            return result
+        return self._stream_with_timings(result, message if routed_by_llm else None)
+
+    async def arun(self, message: Any = None, *, stream: Optional[bool] = None, **kwargs):
+        check_deadline()
+        return await aobserve_run(self, "team", partial(self._aexecute, message, stream=stream, **kwargs))
+
+    async def _aexecute(self, message: Any, stream: Optional[bool], **kwargs):
+        self.member_timings = []
+        self._prefetched = {}
+        routed_by_llm = False
+        if self.mode == "route" and self.pre_router is not None and isinstance(message, str):
+            member = self._pre_route(message)
+            if member is not None:
+                return await self._arun_routed(member, message, stream=bool(self.stream) if stream is None else stream, **kwargs)
+            routed_by_llm = True
+
+        result = await super().arun(message, stream=stream, **kwargs)
+        if isinstance(result, TeamRunResponse):
+            self._finish_run(result, message if routed_by_llm else None)
+            return result
+        return self._astream_with_timings(result, message if routed_by_llm else None)
+
+    def get_system_message(self, session_id: str, user_id: Optional[str] = None, **kwargs):
+        return Team.get_system_message(static_prompt(self), session_id, user_id, **kwargs)
+
+    def get_run_messages(self, *, session_id: str, user_id: Optional[str] = None, **kwargs):
+        run_messages = super().get_run_messages(session_id=session_id, user_id=user_id, **kwargs)
+        with ranking_query(run_input_text(self.run_input)):
+            return add_context_message(self, run_messages, session_id, user_id)
+
+    def _aggregate_metrics_from_messages(self, messages):
+        record_prompt_tokens(self.name, messages)
+        record_run_messages(self.name, messages)
+        return super()._aggregate_metrics_from_messages(messages)
+
+    def get_relevant_docs_from_knowledge(self, *args, **kwargs):
+        with stage(self.name, "retrieval"):
+            return super().get_relevant_docs_from_knowledge(*args, **kwargs)
+
+    async def aget_relevant_docs_from_knowledge(self, *args, **kwargs):
+        with stage(self.name, "retrieval"):
+            return await super().aget_relevant_docs_from_knowledge(*args, **kwargs)
+
+    def read_from_storage(self, *args, **kwargs):
+        with stage(self.name, "storage"):
+            return super().read_from_storage(*args, **kwargs)
+
+    def write_to_storage(self, *args, **kwargs):
+        if run_abandoned():
+            return self.team_session  # Resposta não entregue: o histórico salvo fica como estava
+        with stage(self.name, "storage"):
+            return super().write_to_storage(*args, **kwargs)
+
+    def _add_run_to_memory(self, *args, **kwargs):
+        if not run_abandoned():
+            super()._add_run_to_memory(*args, **kwargs)
+
+    def _stream_with_timings(self, events: Iterator[Any], routed_message: Optional[str] = None) -> Iterator[Any]:
+        yield from events
+        if isinstance(self.run_response, TeamRunResponse):
+            self._finish_run(self.run_response, routed_message)
+
+    async def _astream_with_timings(self, events: AsyncIterator[Any], routed_message: Optional[str] = None) -> AsyncIterator[Any]:
+        async for event in events:
+            yield event
+        if isinstance(self.run_response, TeamRunResponse):
+            self._finish_run(self.run_response, routed_message)
+
+    def _finish_run(self, response: TeamRunResponse, routed_message: Optional[str]):
+        self._attach_timings(response)
+        if routed_message is not None and self.routing_log is not None:
+            # Decisão do LLM roteador vira exemplo de treino (só quando um único membro respondeu)
+            answered = [r.agent_name for r in response.member_responses if getattr(r, "agent_name", None)]
+            if len(set(answered)) == 1:
+                self.routing_log.append(routed_message, answered[0])
+
+    # ------------------------------------------------------------------
+    # Pré-roteamento local (modo route)
+    # ------------------------------------------------------------------
+
+    def _pre_route(self, message: str) -> Optional[Agent]:
+        started = time.perf_counter()
+        decision = self.pre_router.predict(message)
+        metrics.observe("safebot_router_seconds", time.perf_counter() - started, buckets=ROUTER_BUCKETS)
+        member = next((m for m in self.members if m.name == decision.member), None) if decision.member else None
+        metrics.inc("safebot_router_decisions_total", source="local" if member is not None else "llm")
+        if member is not None:
+            logger.debug(f"{self.name}: pré-roteado para {member.name} (score={decision.score}, margem={decision.margin})")
+        return member
+
+    def _run_routed(self, member: Agent, message: str, stream: bool, **kwargs):
+        """Executa o especialista escolhido localmente, como o agno faz ao encaminhar"""
+        member_kwargs = {key: kwargs[key] for key in ROUTED_RUN_ARGS if kwargs.get(key) is not None}
+        self._initialize_member(member, session_id=member_kwargs.get("session_id"))
+        if stream:
+            return self._stream_routed(member, message, **member_kwargs)
+        response = member.run(message, stream=False, **member_kwargs)
+        self.run_response = self._routed_response(member, response)
+        return self.run_response
+
+    def _stream_routed(self, member: Agent, message: str, **kwargs) -> Iterator[Any]:
+        for event in member.run(message, stream=True, **kwargs):
+            if getattr(event, "event", None) == RunEvent.run_response_content.value:
+                yield self._routed_event(event)
+        self.run_response = self._routed_response(member, member.run_response)
+
+    async def _arun_routed(self, member: Agent, message: str, stream: bool, **kwargs):
+        member_kwargs = {key: kwargs[key] for key in ROUTED_RUN_ARGS if kwargs.get(key) is not None}
+        self._initialize_member(member, session_id=member_kwargs.get("session_id"))
+        if stream:
+            return self._astream_routed(member, message, **member_kwargs)
+        response = await member.arun(message, stream=False, **member_kwargs)
+        self.run_response = self._routed_response(member, response)
+        return self.run_response
+
+    async def _astream_routed(self, member: Agent, message: str, **kwargs) -> AsyncIterator[Any]:
+        async for event in await member.arun(message, stream=True, **kwargs):
+            if getattr(event, "event", None) == RunEvent.run_response_content.value:
+                yield self._routed_event(event)
+        self.run_response = self._routed_response(member, member.run_response)
+
+    def _routed_event(self, event: Any) -> TeamRunResponseContentEvent:
+        """Evento de conteúdo do membro como conteúdo do team (é o que os canais consomem)"""
+        return TeamRunResponseContentEvent(
+            content=event.content,
+            team_id=self.team_id or "",
+            team_name=self.name or "",
+            run_id=event.run_id,
+            session_id=event.session_id,
+        )
+
+    def _routed_response(self, member: Agent, response: RunResponse) -> TeamRunResponse:
+        team_response = TeamRunResponse(
+            content=response.content,
+            content_type=response.content_type,
+            run_id=response.run_id,
+            team_id=self.team_id,
+            team_name=self.name,
+            session_id=response.session_id,
+            model=response.model,
+            model_provider=response.model_provider,
+            metrics=dict(response.metrics or {}, pre_routed_to=member.name),
+            status=response.status,
+        )
+        team_response.add_member_run(response)
+        return team_response
+
+    def _attach_timings(self, response: TeamRunResponse):
+        if not self.member_timings:
+            return
+        response.metrics = dict(response.metrics or {}, member_timings=list(self.member_timings))
+        summary = ", ".join(f"{t['member']}={t['seconds']}s ({t['status']})" for t in self.member_timings)
+        logger.info(f"{self.name}: membros {summary}")
+
+    # ------------------------------------------------------------------
+    # Membros em paralelo
+    # ------------------------------------------------------------------
+
+    def _memo_key(self, member: Agent, task_description: str, expected_output: Optional[str]) -> Optional[str]:
+        context = self._delegation
+        if self.sub_answers is None or any(context[media] for media in ("images", "videos", "audio", "files")):
+            return None
+        return self.sub_answers.key(member.name or "", task_description, expected_output)
+
+    def _cached_job(self, index: int, member: Agent, task_description: str, output: str) -> _MemberJob:
+        """Job já concluído com a resposta reaproveitada"""
+        response = RunResponse(
+            content=output,
+            run_id=str(uuid.uuid4()),
+            agent_id=member.agent_id,
+            agent_name=member.name,
+            session_id=self._delegation["session_id"],
+            metrics={"memoized": True},
+        )
+        now = time.monotonic()
+        future: Future = Future()
+        future.set_result((response, now))
+        return _MemberJob(index, member, task_description, future, now, now, cached=True)
+
+    def _start_member(self, index: int, member: Agent, task_description: str, expected_output: Optional[str]) -> _MemberJob:
+        context = self._delegation
+        session_id = context["session_id"]
+        self._initialize_member(member, session_id=session_id)
+        if member.expected_output is not None:
+            expected_output = None
+        memo_key = self._memo_key(member, task_description, expected_output)
+        if memo_key is not None:
+            output = self.sub_answers.get(memo_key)
+            if output is not None:
+                return self._cached_job(index, member, task_description, output)
+        team_context_str, team_member_interactions_str = self._determine_team_context(
+            session_id, context["images"], context["videos"], context["audio"]
+        )
+        member_task = self._format_member_agent_task(
+            task_description, expected_output, team_context_str, team_member_interactions_str
+        )
+        knowledge_filters = context.get("knowledge_filters")
+        if self.enable_agentic_knowledge_filters and not member.enable_agentic_knowledge_filters:
+            member.enable_agentic_knowledge_filters = self.enable_agentic_knowledge_filters
+
+        started_at = time.monotonic()
+        # A thread do membro enxerga o prazo da requisição (contextvars)
+        future = member_executor().submit(
+            run_in_context(_timed_run),
+            member,
+            member_task,
+            user_id=context["user_id"],
+            session_id=session_id,
+            images=context["images"],
+            videos=context["videos"],
+            audio=context["audio"],
+            files=context["files"],
+            stream=False,
+            knowledge_filters=knowledge_filters if not member.knowledge_filters and member.knowledge else None,
+        )
+        return _MemberJob(
+            index, member, task_description, future, started_at, started_at + bounded(self.member_timeout), memo_key=memo_key
+        )
+
+    def _finish_member(self, job: _MemberJob) -> Tuple[str, Optional[str]]:
+        """Aguarda o membro até o prazo; retorna (nome, saída ou None se não respondeu)"""
+        try:
+            outcome = job.future.result(timeout=max(job.deadline - time.monotonic(), 0))
+        except FutureTimeoutError:
+            outcome = None
+        except MemberRunError as e:
+            outcome = e
+        return self._settle_member(job, outcome)
+
+    async def _afinish_member(self, job: _MemberJob) -> Tuple[str, Optional[str]]:
+        """Versão assíncrona de _finish_member (o membro segue rodando na thread se o prazo acabar)"""
+        if job.future.done():
+            return self._finish_member(job)  # Resposta reaproveitada ou já concluída
+        try:
+            outcome = await asyncio.wait_for(
+                asyncio.shield(asyncio.wrap_future(job.future)), timeout=max(job.deadline - time.monotonic(), 0)
+            )
+        except asyncio.TimeoutError:
+            outcome = None
+        except MemberRunError as e:
+            outcome = e
+        return self._settle_member(job, outcome)
+
+    def _settle_member(
+        self, job: _MemberJob, outcome: Union[Tuple[RunResponse, float], MemberRunError, None]
+    ) -> Tuple[str, Optional[str]]:
+        """Registra o resultado do membro (resposta, erro ou None no timeout) no team"""
+        member = job.member
+        member_name = member.name or f"agent_{job.index}"
+        response = None
+        if outcome is None:
+            # A thread atrasada continua com esta instância: o team passa a usar uma cópia
+            self.members[job.index] = detached_copy(member)
+            status, output, finished_at = "timeout", None, time.monotonic()
+        elif isinstance(outcome, MemberRunError):
+            logger.warning(f"Membro {member_name} falhou: {outcome.__cause__}")
+            status, output, finished_at = "error", None, outcome.finished_at
+        else:
+            response, finished_at = outcome
+            status, output = "cached" if job.cached else "ok", member_output(member_name, response)
+
+        seconds = finished_at - job.started_at
+        self.member_timings.append({"member": member_name, "seconds": round(seconds, 2), "status": status})
+        metrics.observe("safebot_team_member_seconds", seconds, buckets=MEMBER_BUCKETS, status=status)
+
+        if status in ("ok", "cached"):
+            if isinstance(self.memory, TeamMemory):
+                self.memory.add_interaction_to_team_context(
+                    member_name=member_name, task=job.task_description, run_response=response
+                )
+            else:
+                self.memory.add_interaction_to_team_context(
+                    session_id=self._delegation["session_id"],
+                    member_name=member_name,
+                    task=job.task_description,
+                    run_response=response,
+                )
+            self.run_response.add_member_run(response)
+        if status == "ok":
+            self._update_team_session_state(member)
+            self._update_workflow_session_state(member)
+            self._update_team_media(response)
+            if job.memo_key is not None and response is not None and output != member_output(member_name, None):
+                self.sub_answers.set(job.memo_key, output)
+        return member_name, output
+
+    def _missing_note(self, member_name: str) -> str:
+        timing = self.member_timings[-1]
+        if timing["status"] == "timeout":
+            return f"{member_name} não respondeu em {self.member_timeout:.0f}s; sintetize com as demais respostas."
+        return f"{member_name} falhou; sintetize com as demais respostas."
+
+    def _prefetch_transfers(self, function_calls: List[Any]):
+        """Dispara juntas as delegações emitidas pelo líder na mesma resposta"""
+        transfers = [fc for fc in function_calls if fc.function.name == "transfer_task_to_member" and fc.arguments]
+        deadline = current_deadline()
+        if len(transfers) < 2 or not self._delegation or (deadline is not None and deadline.done):
+            return
+        for fc in transfers:
+            member_id = fc.arguments.get("member_id")
+            task_description = fc.arguments.get("task_description")
+            found = self._find_member_by_id(member_id) if member_id else None
+            if found is None or not isinstance(found[1], Agent) or (member_id, task_description) in self._prefetched:
+                continue
+            index, member = found
+            if index >= len(self.members) or self.members[index] is not member:
+                continue  # membro de sub-team: fica no caminho padrão
+            self._prefetched[(member_id, task_description)] = self._start_member(
+                index, member, task_description, fc.arguments.get("expected_output")
+            )
+
+    def _install_prefetch(self):
+        """Envolve run_function_calls do modelo do líder para antecipar as delegações"""
+        model = self.model
+        if model is None or getattr(model, "_safebot_prefetch", False):
+            return
+        run_function_calls = model.run_function_calls
+
+        def prefetching_run_function_calls(function_calls, *args, **kwargs):
+            self._prefetch_transfers(function_calls)
+            return run_function_calls(function_calls, *args, **kwargs)
+
+        model.run_function_calls = prefetching_run_function_calls
+        model._safebot_prefetch = True
+
+    def get_transfer_task_function(self, session_id: str, user_id: Optional[str] = None, async_mode: bool = False, **kwargs) -> Function:
+        self._delegation = dict(
+            session_id=session_id,
+            user_id=user_id,
+            images=kwargs.get("images") or [],
+            videos=kwargs.get("videos") or [],
+            audio=kwargs.get("audio") or [],
+            files=kwargs.get("files") or [],
+            knowledge_filters=kwargs.get("knowledge_filters"),
+        )
+        if async_mode:
+            return self._atransfer_task_function(session_id, user_id, **kwargs)
+        self._install_prefetch()
+
+        def transfer_task_to_member(member_id: str, task_description: str, expected_output: Optional[str] = None) -> Iterator[str]:
+            """Use this function to transfer a task to the selected team member.
+            You must provide a clear and concise description of the task the member should achieve AND the expected output.
+
+            Args:
+                member_id (str): The ID of the member to transfer the task to. Use only the ID of the member, not the ID of the team followed by the ID of the member.
+                task_description (str): A clear and concise description of the task the member should achieve.
+                expected_output (str, optional): The expected output from the member (optional).
+            Returns:
+                str: The result of the delegated task.
+            """
+            job = self._prefetched.pop((member_id, task_description), None)
+            if job is None:
+                found = self._find_member_by_id(member_id)
+                if found is None:
+                    yield f"Member with ID {member_id} not found in the team or any subteams. Please choose the correct member from the list of members:\n\n{self.get_members_system_message_content(indent=0)}"
+                    return
+                index, member = found
+                if not isinstance(member, Agent) or index >= len(self.members) or self.members[index] is not member:
+                    # Sub-team: caminho padrão do agno
+                    yield from super(SafeBotTeam, self).get_transfer_task_function(
+                        session_id=session_id, user_id=user_id, async_mode=False, **kwargs
+                    ).entrypoint(member_id, task_description, expected_output)
+                    return
+                job = self._start_member(index, member, task_description, expected_output)
+            member_name, output = self._finish_member(job)
+            yield output if output is not None else self._missing_note(member_name)
+
+        return Function.from_callable(transfer_task_to_member, name="transfer_task_to_member", strict=True)
+
+    def _atransfer_task_function(self, session_id: str, user_id: Optional[str], **kwargs) -> Function:
+        """
+        transfer_task_to_member do arun
+
+        O agno executa juntas (gather) as chamadas de ferramenta de uma resposta,
+        mas só itera geradores depois, um por vez: por isso esta versão é uma
+        corrotina que já devolve o texto do membro.
+        """
+
+        async def transfer_task_to_member(member_id: str, task_description: str, expected_output: Optional[str] = None) -> str:
+            """Use this function to transfer a task to the selected team member.
+            You must provide a clear and concise description of the task the member should achieve AND the expected output.
+
+            Args:
+                member_id (str): The ID of the member to transfer the task to. Use only the ID of the member, not the ID of the team followed by the ID of the member.
+                task_description (str): A clear and concise description of the task the member should achieve.
+                expected_output (str, optional): The expected output from the member (optional).
+            Returns:
+                str: The result of the delegated task.
+            """
+            found = self._find_member_by_id(member_id)
+            if found is None:
+                return f"Member with ID {member_id} not found in the team or any subteams. Please choose the correct member from the list of members:\n\n{self.get_members_system_message_content(indent=0)}"
+            index, member = found
+            if not isinstance(member, Agent) or index >= len(self.members) or self.members[index] is not member:
+                # Sub-team: caminho padrão do agno
+                output = ""
+                async for item in super(SafeBotTeam, self).get_transfer_task_function(
+                    session_id=session_id, user_id=user_id, async_mode=True, **kwargs
+                ).entrypoint(member_id, task_description, expected_output):
+                    if isinstance(item, str):
+                        output += item
+                    elif isinstance(item, (RunResponseContentEvent, TeamRunResponseContentEvent)) and isinstance(item.content, str):
+                        output += item.content
+                return output
+            job = self._start_member(index, member, task_description, expected_output)
+            member_name, output = await self._afinish_member(job)
+            return output if output is not None else self._missing_note(member_name)
+
+        return Function.from_callable(transfer_task_to_member, name="transfer_task_to_member", strict=True)
+
+    def get_run_member_agents_function(self, session_id: str, user_id: Optional[str] = None, async_mode: bool = False, **kwargs) -> Function:
+        self._delegation = dict(
+            session_id=session_id,
+            user_id=user_id,
+            images=kwargs.get("images") or [],
+            videos=kwargs.get("videos") or [],
+            audio=kwargs.get("audio") or [],
+            files=kwargs.get("files") or [],
+        )
+
+        def run_member_agents(task_description: str, expected_output: Optional[str] = None) -> Iterator[str]:
+            """
+            Send the same task to all the member agents and return the responses.
+
+            Args:
+                task_description (str): The task description to send to the member agents.
+                expected_output (str, optional): The expected output from the member agents.
+
+            Returns:
+                str: The responses from the member agents.
+            """
+            # Todos os membros começam juntos; o contexto do team é o mesmo para todos
+            jobs = [
+                self._start_member(index, member, task_description, expected_output)
+                for index, member in enumerate(self.members)
+                if isinstance(member, Agent)
+            ]
+            for job in jobs:
+                member_name, output = self._finish_member(job)
+                yield self._member_line(member_name, output)
+
+        async def arun_member_agents(task_description: str, expected_output: Optional[str] = None) -> str:
+            """
+            Send the same task to all the member agents and return the responses.
+
+            Args:
+                task_description (str): The task description to send to the member agents.
+                expected_output (str, optional): The expected output from the member agents.
+
+            Returns:
+                str: The responses from the member agents.
+            """
+            jobs = [
+                self._start_member(index, member, task_description, expected_output)
+                for index, member in enumerate(self.members)
+                if isinstance(member, Agent)
+            ]
+            lines = []
+            for job in jobs:
+                member_name, output = await self._afinish_member(job)
+                lines.append(self._member_line(member_name, output))
+            return "".join(lines)
+
+        function = arun_member_agents if async_mode else run_member_agents
+        return Function.from_callable(function, name="run_member_agents", strict=True)
+
+    def _member_line(self, member_name: str, output: Optional[str]) -> str:
+        if output is None:
+            return f"Agent {member_name}: {self._missing_note(member_name)}\n"
+        return f"Agent {member_name}: {output}\n"
@@ -0,0 +1,314 @@
+"""
+SafeBot Search - Pesquisa web com cache e prazo para o Web Researcher
+Envolve o backend de busca (DuckDuckGo ou um stub local) com cache persistente
+por consulta (TTL conforme o tipo da consulta), busca concorrente de várias
+consultas e prazo rígido: ao fim do prazo o agente recebe o que já chegou, e os
+resultados atrasados entram no cache para a próxima vez.
+"""
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional
+
+from agno.tools import Toolkit
+
+from core.deadline import bounded
+from core.metrics import metrics
+from core.state import SessionStateStore, create_state_store
+from core.telemetry import watch_executor
+
+logger = logging.getLogger(__name__)
+
+metrics.describe("safebot_search_total", "Consultas de pesquisa web por resultado (hit/miss/stale/timeout/error)")
+metrics.describe("safebot_search_seconds", "Duração das consultas ao backend de pesquisa")
+
+# TTL padrão (segundos) por tipo de consulta
+DEFAULT_TTLS = {"news": 3600, "recent": 6 * 3600, "reference": 7 * 86400, "general": 86400}
+
+RECENT_QUERY = re.compile(r"\b(20\d\d|hoje|atual\w*|recente\w*|novidade\w*|[uú]ltim\w*|nov[oa]s?)\b", re.IGNORECASE)
+REFERENCE_QUERY = re.compile(r"\b(nr[- ]?\d+|norma\w*|portaria|lei|decreto|ca \d+|certificado de aprova[cç][aã]o|abnt|nbr)\b", re.IGNORECASE)
+
+_search_executor: Optional[ThreadPoolExecutor] = None
+_search_executor_lock = threading.Lock()
+
+
+def search_executor() -> ThreadPoolExecutor:
+    """Pool compartilhado para as consultas (SAFEBOT_SEARCH_WORKERS)"""
+    global _search_executor
+    with _search_executor_lock:
+        if _search_executor is None:
+            _search_executor = ThreadPoolExecutor(
+                max_workers=int(os.getenv("SAFEBOT_SEARCH_WORKERS", "8")),
+                thread_name_prefix="safebot-search",
+            )
+            watch_executor("search", _search_executor)
+        return _search_executor
+
+
+def query_class(query: str, kind: str = "text") -> str:
+    """Tipo da consulta, que define o TTL do cache"""
+    if kind == "news":
+        return "news"
+    if RECENT_QUERY.search(query):
+        return "recent"
+    if REFERENCE_QUERY.search(query):
+        return "reference"
+    return "general"
+
+
+def parse_ttls(raw: Optional[str] = None) -> Dict[str, float]:
+    """'news=3600,general=86400' sobre os TTLs padrão"""
+    raw = os.getenv("SAFEBOT_SEARCH_TTLS", "") if raw is None else raw
+    ttls = dict(DEFAULT_TTLS)
+    for item in raw.split(","):
+        if "=" in item:
+            name, seconds = item.split("=", 1)
+            ttls[name.strip()] = float(seconds)
+    return ttls
+
+
+class SearchBackend:
+    """Interface dos backends de pesquisa"""
+
+    name = "base"
+
+    def text(self, query: str, max_results: int) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def news(self, query: str, max_results: int) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+
+class DuckDuckGoBackend(SearchBackend):
+    """Pesquisa no DuckDuckGo (pacote ddgs, ou o antigo duckduckgo-search)"""
+
+    name = "duckduckgo"
+
+    def __init__(self, timeout: int = 10, modifier: Optional[str] = None):
+        try:
+            from ddgs import DDGS
+        except ImportError:
+            try:
+                from duckduckgo_search import DDGS
+            except ImportError:
+                raise ImportError("Backend DuckDuckGo requer o pacote ddgs: pip install ddgs")
+        self._ddgs = DDGS
+        self.timeout = timeout
+        self.modifier = modifier
+
+    # A consulta vai posicional: o ddgs chama o parâmetro de query, o duckduckgo-search de keywords
+    def text(self, query: str, max_results: int) -> List[Dict[str, Any]]:
+        keywords = f"{self.modifier} {query}" if self.modifier else query
+        return self._ddgs(timeout=self.timeout).text(keywords, max_results=max_results)
+
+    def news(self, query: str, max_results: int) -> List[Dict[str, Any]]:
+        return self._ddgs(timeout=self.timeout).news(query, max_results=max_results)
+
+
+class StubSearchBackend(SearchBackend):
+    """
+    Backend local, sem rede (desenvolvimento e testes)
+
+    Resultados vêm de um JSON {consulta: [resultados]} ou são gerados a partir da
+    própria consulta; delay simula a latência de um backend real.
+    """
+
+    name = "stub"
+
+    def __init__(self, path: Optional[str] = None, delay: float = 0.0):
+        self.delay = delay
+        self.results: Dict[str, List[Dict[str, Any]]] = {}
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.results = json.load(f)
+
+    def text(self, query: str, max_results: int) -> List[Dict[str, Any]]:
+        if self.delay:
+            time.sleep(self.delay)
+        if query in self.results:
+            return self.results[query][:max_results]
+        slug = hashlib.md5(query.encode("utf-8")).hexdigest()[:8]
+        return [
+            {"title": f"{query} ({i + 1})", "href": f"https://example.com/{slug}/{i + 1}", "body": f"Resultado local para: {query}"}
+            for i in range(max_results)
+        ]
+
+    def news(self, query: str, max_results: int) -> List[Dict[str, Any]]:
+        return [dict(item, date="1970-01-01T00:00:00+00:00", source="stub") for item in self.text(query, max_results)]
+
+
+class CachedSearch:
+    """Cache persistente por consulta, com busca concorrente e prazo rígido"""
+
+    def __init__(
+        self,
+        backend: SearchBackend,
+        store: Optional[SessionStateStore] = None,
+        deadline: Optional[float] = None,
+        ttls: Optional[Dict[str, float]] = None,
+    ):
+        self.backend = backend
+        self.store = store
+        self.deadline = deadline if deadline is not None else float(os.getenv("SAFEBOT_SEARCH_DEADLINE_SECONDS", "6"))
+        self.ttls = ttls or parse_ttls()
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, kind: str, query: str, max_results: int) -> str:
+        normalized = " ".join(query.lower().split())
+        return "search:" + hashlib.sha1(f"{self.backend.name}|{kind}|{max_results}|{normalized}".encode("utf-8")).hexdigest()
+
+    def _cached(self, key: str) -> Optional[Dict[str, Any]]:
+        return self.store.get(key) if self.store is not None else None
+
+    def _fetch(self, key: str, kind: str, query: str, max_results: int) -> List[Dict[str, Any]]:
+        started = time.monotonic()
+        results = getattr(self.backend, kind)(query, max_results)
+        metrics.observe("safebot_search_seconds", time.monotonic() - started, backend=self.backend.name)
+        if self.store is not None:
+            ttl = self.ttls.get(query_class(query, kind), self.ttls["general"])
+            self.store.set(key, {"query": query, "results": results, "expires_at": time.time() + ttl})
+        return results
+
+    def _submit(self, key: str, kind: str, query: str, max_results: int) -> Future:
+        """Uma busca em andamento por chave (consultas repetidas aguardam a mesma)"""
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                return future
+            future = search_executor().submit(self._fetch, key, kind, query, max_results)
+            self._inflight[key] = future
+        # Fora do lock: se a busca já terminou, o callback roda nesta thread
+        future.add_done_callback(lambda _: self._forget(key))
+        return future
+
+    def _forget(self, key: str):
+        with self._lock:
+            self._inflight.pop(key, None)
+
+    def search_many(self, queries: List[str], kind: str = "text", max_results: int = 5, deadline: Optional[float] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        Busca as consultas em paralelo até o prazo
+
+        Retorna {consulta: {"status": hit|miss|stale|timeout|error, "results": [...]}}.
+        Entradas vencidas do cache são usadas quando a busca atrasa ou falha.
+        """
+        limit = time.monotonic() + bounded(self.deadline if deadline is None else deadline)
+        outcome: Dict[str, Dict[str, Any]] = {}
+        pending: Dict[str, Any] = {}
+        for query in dict.fromkeys(q.strip() for q in queries if q.strip()):
+            key = self._key(kind, query, max_results)
+            cached = self._cached(key)
+            if cached and cached.get("expires_at", 0) > time.time():
+                outcome[query] = {"status": "hit", "results": cached["results"]}
+            else:
+                pending[query] = (self._submit(key, kind, query, max_results), cached)
+
+        if pending:
+            wait([future for future, _ in pending.values()], timeout=max(limit - time.monotonic(), 0))
+        for query, (future, stale) in pending.items():
+            if future.done() and future.exception() is None:
+                outcome[query] = {"status": "miss", "results": future.result()}
+                continue
+            status = "timeout" if not future.done() else "error"
+            if status == "error":
+                logger.warning(f"Pesquisa falhou para '{query}': {future.exception()}")
+            if stale:
+                outcome[query] = {"status": "stale", "results": stale["results"]}
+            else:
+                outcome[query] = {"status": status, "results": []}
+
+        for entry in outcome.values():
+            metrics.inc("safebot_search_total", backend=self.backend.name, result=entry["status"])
+        return outcome
+
+
+def format_results(outcome: Dict[str, Dict[str, Any]]) -> str:
+    """Saída da ferramenta: resultados por consulta e aviso das que não chegaram a tempo"""
+    payload = {}
+    for query, entry in outcome.items():
+        if entry["status"] == "timeout":
+            payload[query] = "Sem resultado dentro do prazo; prossiga com as demais fontes."
+        elif entry["status"] == "error":
+            payload[query] = "Falha na pesquisa; prossiga com as demais fontes."
+        else:
+            payload[query] = entry["results"]
+    return json.dumps(payload, indent=2, ensure_ascii=False)
+
+
+class WebSearchTools(Toolkit):
+    """Ferramentas de pesquisa web do SafeBot (cache, paralelismo e prazo)"""
+
+    def __init__(self, search: Optional[CachedSearch] = None, news: bool = True, **kwargs):
+        self.search = search or create_cached_search()
+        tools: List[Any] = [self.web_search, self.web_search_many]
+        if news:
+            tools.append(self.web_news)
+        super().__init__(name="web_search", tools=tools, **kwargs)
+
+    def web_search(self, query: str, max_results: int = 5) -> str:
+        """Use this function to search the web for a query.
+
+        Args:
+            query (str): The query to search for.
+            max_results (optional, default=5): The maximum number of results to return.
+
+        Returns:
+            The search results as JSON.
+        """
+        return format_results(self.search.search_many([query], "text", max_results))
+
+    def web_search_many(self, queries: List[str], max_results: int = 3) -> str:
+        """Use this function to search the web for several queries at once (faster than one by one).
+
+        Args:
+            queries (List[str]): The queries to search for.
+            max_results (optional, default=3): The maximum number of results per query.
+
+        Returns:
+            The search results for each query as JSON.
+        """
+        return format_results(self.search.search_many(queries, "text", max_results))
+
+    def web_news(self, query: str, max_results: int = 5) -> str:
+        """Use this function to get the latest news about a query.
+
+        Args:
+            query (str): The query to search for.
+            max_results (optional, default=5): The maximum number of results to return.
+
+        Returns:
+            The latest news as JSON.
+        """
+        return format_results(self.search.search_many([query], "news", max_results))
+
+
+_cached_search: Optional[CachedSearch] = None
+_cached_search_lock = threading.Lock()
+
+
+def create_cached_search() -> CachedSearch:
+    """
+    Pesquisa compartilhada do processo, configurada pelo ambiente
+
+    SAFEBOT_SEARCH_BACKEND: duckduckgo (padrão) ou stub (SAFEBOT_SEARCH_STUB_FILE)
+    SAFEBOT_SEARCH_CACHE_URL: backend do cache (padrão sqlite:///tmp/search_cache.db; vazio desativa)
+    """
+    global _cached_search
+    with _cached_search_lock:
+        if _cached_search is None:
+            if os.getenv("SAFEBOT_SEARCH_BACKEND", "duckduckgo") == "stub":
+                backend: SearchBackend = StubSearchBackend(
+                    os.getenv("SAFEBOT_SEARCH_STUB_FILE"), float(os.getenv("SAFEBOT_SEARCH_STUB_DELAY", "0"))
+                )
+            else:
+                backend = DuckDuckGoBackend(timeout=int(os.getenv("SAFEBOT_SEARCH_TIMEOUT_SECONDS", "10")))
+            url = os.getenv("SAFEBOT_SEARCH_CACHE_URL", "sqlite:///tmp/search_cache.db")
+            store = create_state_store(url, cache_seconds=0) if url else None
+            _cached_search = CachedSearch(backend, store)
+        return _cached_search
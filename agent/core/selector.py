@@ -0,0 +1,166 @@
+"""
+SafeBot Selector - Escolha automática do team pela complexidade da pergunta
+No modo "auto" cada pergunta recebe uma nota de complexidade (tamanho,
+intenção detectada, número de especialidades envolvidas e histórico do
+usuário) e vai para o team mais barato que a atende: Quick para perguntas
+diretas, Research para pesquisa e Comprehensive para análises completas.
+"""
+import os
+import re
+import logging
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from core.memory import tokenize
+from core.metrics import metrics
+from core.router import TfidfRouter
+
+logger = logging.getLogger(__name__)
+
+metrics.describe("safebot_team_selections_total", "Teams escolhidos pelo modo auto")
+metrics.describe("safebot_team_overrides_total", "Trocas manuais de team após uma escolha automática")
+metrics.describe("safebot_team_run_seconds", "Duração das execuções de teams por team e forma de seleção")
+metrics.describe("safebot_auto_latency_saved_seconds_total", "Latência economizada pelo modo auto em relação ao team de referência")
+
+AUTO_TEAM = "auto"
+
+# Ordem de custo (mais barato primeiro)
+TEAM_COST = {"quick": 0, "research": 1, "comprehensive": 2}
+
+# Intenções que pedem mais do que um especialista
+COMPREHENSIVE_INTENT = re.compile(
+    r"\b(implementa\w*|programa|plano|planej\w*|elabor\w*|estrutur\w*|passo a passo|completo|completa|"
+    r"detalhad\w*|relat[oó]rio|diagn[oó]stico|gest[aã]o|pgr|ppra|obra|empresa|setor|todos os)\b",
+    re.IGNORECASE,
+)
+RESEARCH_INTENT = re.compile(
+    r"\b(pesquis\w*|tend[eê]ncia\w*|novidade\w*|inova\w*|estudo\w*|compar\w*|estado da arte|"
+    r"tecnologia\w*|mercado|atualiza[cç][aã]o|mudan[cç]as?|recente\w*|internacional)\b",
+    re.IGNORECASE,
+)
+QUICK_INTENT = re.compile(
+    r"^\s*(o que [eé]|qual|quais|quando|quem|onde|pode|posso|preciso|existe|[eé] obrigat[oó]rio)\b",
+    re.IGNORECASE,
+)
+
+# Pesos da nota de complexidade
+LENGTH_WEIGHT = 0.02  # por palavra além das primeiras 12
+LENGTH_CAP = 1.0
+COMPREHENSIVE_WEIGHT = 0.8
+RESEARCH_WEIGHT = 0.6
+QUICK_WEIGHT = -0.4
+SPECIALTY_WEIGHT = 0.5  # por especialidade além da primeira
+QUESTION_WEIGHT = 0.3  # por pergunta além da primeira
+
+# Ajuste do viés do usuário a cada troca manual
+BIAS_STEP = 0.25
+BIAS_LIMIT = 1.0
+
+
+class TeamChoice(NamedTuple):
+    team: str
+    score: float
+    reasons: List[str]
+
+
+class ComplexitySelector:
+    """Nota de complexidade e escolha do team mais barato adequado"""
+
+    def __init__(
+        self,
+        router: Optional[TfidfRouter] = None,
+        quick_max: Optional[float] = None,
+    ):
+        self.router = router  # Pré-roteador do Quick Team (conta especialidades envolvidas)
+        self.quick_max = quick_max if quick_max is not None else float(os.getenv("SAFEBOT_AUTO_QUICK_MAX_SCORE", "0.8"))
+
+    def specialties(self, text: str) -> int:
+        """Especialistas com afinidade relevante (ao menos metade do melhor)"""
+        if self.router is None:
+            return 1
+        scores = self.router.scores(text)
+        best = max(scores.values(), default=0.0)
+        if best < self.router.min_score:
+            return 1
+        return sum(1 for score in scores.values() if score >= best * 0.5)
+
+    def score(self, text: str, bias: float = 0.0) -> TeamChoice:
+        reasons: List[str] = []
+        words = len(tokenize(text))
+        score = min(max(words - 12, 0) * LENGTH_WEIGHT, LENGTH_CAP)
+        if score:
+            reasons.append(f"tamanho={words}")
+
+        analysis = bool(COMPREHENSIVE_INTENT.search(text))
+        research = bool(RESEARCH_INTENT.search(text))
+        if analysis:
+            score += COMPREHENSIVE_WEIGHT
+            reasons.append("intenção=análise")
+        if research:
+            score += RESEARCH_WEIGHT
+            reasons.append("intenção=pesquisa")
+        if QUICK_INTENT.search(text) and words <= 20:
+            score += QUICK_WEIGHT
+            reasons.append("intenção=direta")
+
+        specialties = self.specialties(text)
+        if specialties > 1:
+            score += (specialties - 1) * SPECIALTY_WEIGHT
+            reasons.append(f"especialidades={specialties}")
+
+        questions = text.count("?")
+        if questions > 1:
+            score += (questions - 1) * QUESTION_WEIGHT
+            reasons.append(f"perguntas={questions}")
+
+        if bias:
+            score += bias
+            reasons.append(f"histórico={bias:+.2f}")
+
+        if score <= self.quick_max:
+            team = "quick"
+        elif research and not analysis:
+            team = "research"
+        else:
+            team = "comprehensive"
+        return TeamChoice(team, round(score, 3), reasons)
+
+    def select(self, text: str, session: Optional[Dict[str, Any]] = None) -> TeamChoice:
+        """Escolhe o team considerando o viés do usuário salvo na sessão"""
+        choice = self.score(text, bias=float((session or {}).get("complexity_bias", 0.0)))
+        metrics.inc("safebot_team_selections_total", team=choice.team)
+        logger.info(f"Auto: {choice.team} (nota={choice.score}; {', '.join(choice.reasons) or 'simples'})")
+        return choice
+
+
+def override_bias(session: Dict[str, Any], chosen: str) -> Optional[float]:
+    """
+    Novo viés do usuário quando ele troca manualmente o team escolhido pelo auto
+    (subir para um team mais caro aumenta a nota das próximas perguntas)
+    """
+    selected = session.get("last_auto_team")
+    if session.get("current_team") != AUTO_TEAM or not selected or selected == chosen:
+        return None
+    metrics.inc("safebot_team_overrides_total", selected=selected, chosen=chosen)
+    logger.info(f"Auto: usuário trocou {selected} por {chosen}")
+    step = BIAS_STEP if TEAM_COST.get(chosen, 0) > TEAM_COST.get(selected, 0) else -BIAS_STEP
+    bias = float(session.get("complexity_bias", 0.0)) + step
+    return max(-BIAS_LIMIT, min(BIAS_LIMIT, bias))
+
+
+def record_run(team: str, elapsed: float, auto: bool):
+    """Registra a duração e, no modo auto, a latência economizada frente ao team de referência"""
+    metrics.observe("safebot_team_run_seconds", elapsed, team=team, selection="auto" if auto else "manual")
+    baseline = os.getenv("SAFEBOT_AUTO_BASELINE_TEAM", "comprehensive")
+    if not auto or team == baseline:
+        return
+    reference = [
+        metrics.get_histogram("safebot_team_run_seconds", team=baseline, selection=selection)
+        for selection in ("manual", "auto")
+    ]
+    count = sum(h.count for h in reference if h)
+    if not count:
+        return
+    saved = sum(h.sum for h in reference if h) / count - elapsed
+    if saved > 0:
+        metrics.inc("safebot_auto_latency_saved_seconds_total", saved, team=team)
+        logger.info(f"Auto: {team} em {elapsed:.1f}s (~{saved:.1f}s a menos que {baseline})")
@@ -0,0 +1,280 @@
+"""
+SafeBot State - Estado de sessão dos bots fora do processo
+Guarda pequenos dicionários por chave (team atual, contadores, session_id do
+agente) em memória, SQLite ou Redis, para que reinícios não percam o estado e
+várias réplicas do bot possam compartilhá-lo. Um cache local com TTL curto
+evita ida ao backend a cada mensagem.
+"""
+import os
+import json
+import math
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import closing
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+State = Dict[str, Any]
+Updater = Callable[[State], State]
+
+
+def encode_state(value: State) -> str:
+    """Serialização compacta (JSON sem espaços)"""
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def decode_state(raw: Optional[Any]) -> Optional[State]:
+    if raw is None:
+        return None
+    if isinstance(raw, bytes):
+        raw = raw.decode("utf-8")
+    return json.loads(raw)
+
+
+class SessionStateStore:
+    """Interface dos backends de estado"""
+
+    def get(self, key: str) -> Optional[State]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: State):
+        raise NotImplementedError
+
+    def update(self, key: str, updater: Updater, default: Optional[State] = None) -> State:
+        """Leitura-modificação-escrita atômica; retorna o novo valor"""
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+
+class MemoryStateStore(SessionStateStore):
+    """Estado em memória (um único processo)"""
+
+    def __init__(self):
+        self._data: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[State]:
+        return decode_state(self._data.get(key))
+
+    def set(self, key: str, value: State):
+        self._data[key] = encode_state(value)
+
+    def update(self, key: str, updater: Updater, default: Optional[State] = None) -> State:
+        with self._lock:
+            current = decode_state(self._data.get(key)) or dict(default or {})
+            value = updater(current)
+            self._data[key] = encode_state(value)
+            return value
+
+    def delete(self, key: str):
+        self._data.pop(key, None)
+
+
+class SqliteStateStore(SessionStateStore):
+    """Estado em SQLite (WAL), compartilhado por processos na mesma máquina"""
+
+    def __init__(self, db_file: str, table: str = "bot_state", ttl_seconds: Optional[float] = None):
+        self.db_file = db_file
+        self.table = table
+        self.ttl_seconds = ttl_seconds  # Sem TTL, as chaves ficam até serem apagadas
+        self._purged_at = 0.0
+        Path(db_file).parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                f'CREATE TABLE IF NOT EXISTS "{table}" '
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, updated_at INTEGER NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        # Conexão curta por operação: segura entre threads e processos
+        conn = sqlite3.connect(self.db_file, timeout=10, isolation_level=None)
+        conn.execute("PRAGMA busy_timeout=10000")
+        return conn
+
+    def _expired_before(self) -> Optional[int]:
+        return int(time.time() - self.ttl_seconds) if self.ttl_seconds else None
+
+    def get(self, key: str) -> Optional[State]:
+        with closing(self._connect()) as conn:
+            row = conn.execute(f'SELECT value, updated_at FROM "{self.table}" WHERE key = ?', (key,)).fetchone()
+            expired_before = self._expired_before()
+            if row and expired_before is not None and row[1] < expired_before:
+                conn.execute(f'DELETE FROM "{self.table}" WHERE key = ? AND updated_at < ?', (key, expired_before))
+                return None
+        return decode_state(row[0]) if row else None
+
+    def set(self, key: str, value: State):
+        with closing(self._connect()) as conn:
+            conn.execute(
+                f'INSERT OR REPLACE INTO "{self.table}" (key, value, updated_at) VALUES (?, ?, ?)',
+                (key, encode_state(value), int(time.time())),
+            )
+        self._purge_expired()
+
+    def _purge_expired(self):
+        """Apaga as chaves vencidas que não são mais lidas (no máximo uma vez por minuto)"""
+        expired_before = self._expired_before()
+        if expired_before is None or time.monotonic() - self._purged_at < 60:
+            return
+        self._purged_at = time.monotonic()
+        with closing(self._connect()) as conn:
+            conn.execute(f'DELETE FROM "{self.table}" WHERE updated_at < ?', (expired_before,))
+
+    def update(self, key: str, updater: Updater, default: Optional[State] = None) -> State:
+        conn = self._connect()
+        try:
+            # BEGIN IMMEDIATE trava escrita: outro processo espera até o COMMIT
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(f'SELECT value FROM "{self.table}" WHERE key = ?', (key,)).fetchone()
+            value = updater(decode_state(row[0]) if row else dict(default or {}))
+            conn.execute(
+                f'INSERT OR REPLACE INTO "{self.table}" (key, value, updated_at) VALUES (?, ?, ?)',
+                (key, encode_state(value), int(time.time())),
+            )
+            conn.execute("COMMIT")
+            return value
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def delete(self, key: str):
+        with closing(self._connect()) as conn:
+            conn.execute(f'DELETE FROM "{self.table}" WHERE key = ?', (key,))
+
+
+class RedisStateStore(SessionStateStore):
+    """Estado em Redis, compartilhado por réplicas em máquinas diferentes"""
+
+    def __init__(self, url: str, prefix: str = "safebot:state:", ttl_seconds: Optional[int] = None):
+        try:
+            import redis
+        except ImportError:
+            raise ImportError("Backend Redis requer o pacote redis: pip install redis")
+
+        self._redis = redis
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.ttl_seconds = ttl_seconds
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}{key}"
+
+    def get(self, key: str) -> Optional[State]:
+        return decode_state(self.client.get(self._key(key)))
+
+    def set(self, key: str, value: State):
+        self.client.set(self._key(key), encode_state(value), ex=self.ttl_seconds)
+
+    def update(self, key: str, updater: Updater, default: Optional[State] = None) -> State:
+        name = self._key(key)
+        with self.client.pipeline() as pipe:
+            while True:
+                try:
+                    # Transação otimista: refaz se outra réplica alterou a chave
+                    pipe.watch(name)
+                    value = updater(decode_state(pipe.get(name)) or dict(default or {}))
+                    pipe.multi()
+                    pipe.set(name, encode_state(value), ex=self.ttl_seconds)
+                    pipe.execute()
+                    return value
+                except self._redis.WatchError:
+                    continue
+
+    def delete(self, key: str):
+        self.client.delete(self._key(key))
+
+
+class CachedStateStore(SessionStateStore):
+    """Cache local read-through (TTL curto) na frente de outro backend"""
+
+    def __init__(self, store: SessionStateStore, ttl_seconds: float = 2.0, max_entries: int = 10000):
+        self.store = store
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._cache: "OrderedDict[str, Tuple[float, Optional[State]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _remember(self, key: str, value: Optional[State]):
+        with self._lock:
+            self._cache[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    def get(self, key: str) -> Optional[State]:
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached and cached[0] > time.monotonic():
+                self.hits += 1
+                self._cache.move_to_end(key)
+                return dict(cached[1]) if cached[1] is not None else None
+        self.misses += 1
+        value = self.store.get(key)
+        self._remember(key, value)
+        return dict(value) if value is not None else None
+
+    def set(self, key: str, value: State):
+        self.store.set(key, value)
+        self._remember(key, dict(value))
+
+    def update(self, key: str, updater: Updater, default: Optional[State] = None) -> State:
+        # Atualizações vão sempre ao backend, que garante a atomicidade
+        value = self.store.update(key, updater, default)
+        self._remember(key, dict(value))
+        return value
+
+    def delete(self, key: str):
+        self.store.delete(key)
+        with self._lock:
+            self._cache.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else None,
+        }
+
+
+def create_state_store(
+    url: Optional[str] = None,
+    cache_seconds: Optional[float] = None,
+    ttl_seconds: Optional[float] = None,
+    name: str = "state",
+) -> SessionStateStore:
+    """
+    Cria o backend de estado a partir de uma URL
+
+    Args:
+        url: memory://, sqlite:///caminho/relativo.db, sqlite:////caminho/absoluto.db
+             ou redis://host:6379/0 (padrão: SAFEBOT_STATE_URL ou sqlite:///tmp/bot_state.db)
+        cache_seconds: TTL do cache local; 0 desativa (padrão: SAFEBOT_STATE_CACHE_SECONDS ou 2)
+        ttl_seconds: validade das chaves no backend (Redis: EX; SQLite: apagadas ao vencer)
+        name: espaço de chaves (tabela no SQLite, prefixo no Redis); "state" é o dos bots
+    """
+    url = url or os.getenv("SAFEBOT_STATE_URL", "sqlite:///tmp/bot_state.db")
+    if cache_seconds is None:
+        cache_seconds = float(os.getenv("SAFEBOT_STATE_CACHE_SECONDS", "2"))
+
+    if url.startswith("memory://"):
+        # Já é local: cache não traz ganho
+        return MemoryStateStore()
+    if url.startswith("sqlite:///"):
+        store: SessionStateStore = SqliteStateStore(url[len("sqlite:///"):], table=f"bot_{name}", ttl_seconds=ttl_seconds)
+    elif url.startswith(("redis://", "rediss://", "unix://")):
+        store = RedisStateStore(url, prefix=f"safebot:{name}:", ttl_seconds=math.ceil(ttl_seconds) if ttl_seconds else None)
+    else:
+        raise ValueError(f"URL de estado não suportada: {url}")
+
+    return CachedStateStore(store, ttl_seconds=cache_seconds) if cache_seconds > 0 else store
@@ -3,12 +3,13 @@ SafeBot Teams - Sistema Multi-Agente para NR-06
 Implementação de teams colaborativos especializados em segurança do trabalho
 """
 import os
-from typing import Optional, List, Dict, Any
+import queue
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional, List, Dict, Any
 from agno.agent import Agent
 from agno.team import Team
-from agno.models.openai import OpenAIChat
-from agno.models.anthropic import Claude
-from agno.tools.duckduckgo import DuckDuckGoTools
 from agno.tools.reasoning import ReasoningTools
 from agno.knowledge.pdf import PDFKnowledgeBase
 from agno.vectordb.lancedb import LanceDb
@@ -17,8 +18,37 @@ from agno.memory.v2.db.sqlite import SqliteMemoryDb
 from agno.memory.v2.memory import Memory
 from dotenv import load_dotenv
 
+from core.cascade import cascade_model
+from core.memo import SubAnswerCache, create_sub_answer_cache, files_version
+from core.memory import RankedMemory
+from core.models import create_model
+from core.router import RoutingLog, create_pre_router, load_labelled
+from core.runtime import SafeBotAgent, SafeBotTeam
+from core.search import WebSearchTools
+
 load_dotenv()
 
+# Vocabulário extra de cada especialista para o pré-roteador local do Quick Consultation Team
+QUICK_ROUTING_KEYWORDS = {
+    "EPI Specialist": "luva capacete protetor auricular máscara respirador PFF2 óculos viseira calçado botina bota cinturão trava-quedas avental perneira mangote jaqueta modelo tipo indicado usar escolher",
+    "Compliance Auditor": "documento registro ficha entrega certificado aprovação CA validade auditoria checklist conformidade penalidade multa fiscalização responsabilidade obrigação empregador empregado punição advertência",
+    "Training Specialist": "treinamento capacitação reciclagem curso carga horária metodologia material didático aula avaliação aprendizagem dinâmica instrutor ensino",
+    "Risk Analyst": "risco exposição ruído vibração químico biológico físico mecânico queda altura hierarquia controle medição agente insalubridade análise ambiente",
+}
+
+QUICK_ROUTING_INSTRUCTIONS = [
+    "Você é um roteador inteligente de consultas sobre NR-06.",
+    "Analise a questão do usuário e direcione para o especialista mais adequado:",
+    "",
+    "🎯 CRITÉRIOS DE ROTEAMENTO:",
+    "• EPI Specialist: Questões sobre tipos, seleção, especificações de EPIs",
+    "• Compliance Auditor: Questões sobre conformidade, auditoria, documentação",
+    "• Training Specialist: Questões sobre treinamentos, capacitação, educação",
+    "• Risk Analyst: Questões sobre riscos, exposições, análise de ambiente",
+    "",
+    "Se a questão envolver múltiplas especialidades, encaminhe para o especialista principal e mencione a necessidade de consulta adicional.",
+]
+
 class SafeBotTeamsFactory:
     """Factory para criar teams SafeBot especializados em NR-06"""
     
@@ -28,7 +58,39 @@ class SafeBotTeamsFactory:
         self._vector_db = None
         self._knowledge_base = None
         self._shared_memory = None
+        self._routing_log = None
+        self._quick_router = None
+        self._sub_answers = None
+        self._sub_answers_ready = False
         
+    @property
+    def routing_log(self) -> RoutingLog:
+        """Log das decisões do roteador LLM (treino do pré-roteador)"""
+        if self._routing_log is None:
+            self._routing_log = RoutingLog(os.getenv("SAFEBOT_ROUTER_LOG", f"{self.tmp_dir}/routing_log.jsonl"))
+        return self._routing_log
+    
+    def quick_pre_router(self, members: List[Agent]):
+        """Pré-roteador do Quick Consultation Team (treinado uma vez por factory)"""
+        if self._quick_router is None:
+            self._quick_router = create_pre_router(
+                members, QUICK_ROUTING_INSTRUCTIONS, QUICK_ROUTING_KEYWORDS, self.routing_log
+            )
+        return self._quick_router
+    
+    @property
+    def knowledge_files(self) -> List[str]:
+        """PDFs da base de conhecimento (a versão deles entra na chave do cache de respostas)"""
+        return [f"{self.data_dir}/pdfs/nr-06-atualizada-2022-1.pdf"]
+    
+    @property
+    def sub_answers(self) -> Optional[SubAnswerCache]:
+        """Cache das respostas dos especialistas, compartilhado pelos teams da factory"""
+        if not self._sub_answers_ready:
+            self._sub_answers = create_sub_answer_cache(version=files_version(self.knowledge_files))
+            self._sub_answers_ready = True
+        return self._sub_answers
+    
     @property
     def vector_db(self) -> LanceDb:
         """Vector database compartilhado para todos os agentes"""
@@ -46,7 +108,7 @@ class SafeBotTeamsFactory:
             self._knowledge_base = PDFKnowledgeBase(
                 path=[
                     {
-                        "path": f"{self.data_dir}/pdfs/nr-06-atualizada-2022-1.pdf",
+                        "path": self.knowledge_files[0],
                         "metadata": {
                             "document_type": "norma_regulamentadora",
                             "nr_number": "06",
@@ -62,9 +124,10 @@ class SafeBotTeamsFactory:
     
     @property
     def shared_memory(self) -> Memory:
-        """Memória compartilhada para teams"""
+        """Memória compartilhada para teams (indexada e ranqueada por usuário)"""
         if self._shared_memory is None:
-            self._shared_memory = Memory(
+            self._shared_memory = RankedMemory(
+                model=create_model("gpt-4o"),
                 db=SqliteMemoryDb(
                     table_name="safebot_team_memory",
                     db_file=f"{self.tmp_dir}/team_memories.db"
@@ -85,10 +148,10 @@ class SafeBotTeamsFactory:
     
     def create_epi_specialist_agent(self) -> Agent:
         """Agente especialista em EPIs específicos"""
-        return Agent(
+        return SafeBotAgent(
             name="EPI Specialist",
             role="Especialista em tipos específicos de EPIs e suas aplicações",
-            model=OpenAIChat(id="gpt-4o-mini"),
+            model=cascade_model("specialist.epi", "gpt-4o-mini"),
             knowledge=self.knowledge_base,
             storage=self.create_base_storage("epi_specialist"),
             memory=self.shared_memory,
@@ -113,10 +176,10 @@ class SafeBotTeamsFactory:
     
     def create_compliance_auditor_agent(self) -> Agent:
         """Agente especialista em auditoria e conformidade"""
-        return Agent(
+        return SafeBotAgent(
             name="Compliance Auditor",
             role="Especialista em auditoria de conformidade com NR-06",
-            model=OpenAIChat(id="gpt-4o-mini"),
+            model=cascade_model("specialist.compliance", "gpt-4o-mini"),
             knowledge=self.knowledge_base,
             storage=self.create_base_storage("compliance_auditor"),
             memory=self.shared_memory,
@@ -140,10 +203,10 @@ class SafeBotTeamsFactory:
     
     def create_training_specialist_agent(self) -> Agent:
         """Agente especialista em treinamentos e capacitação"""
-        return Agent(
+        return SafeBotAgent(
             name="Training Specialist",
             role="Especialista em treinamentos e capacitação sobre EPIs",
-            model=OpenAIChat(id="gpt-4o-mini"),
+            model=cascade_model("specialist.training", "gpt-4o-mini"),
             knowledge=self.knowledge_base,
             storage=self.create_base_storage("training_specialist"),
             memory=self.shared_memory,
@@ -167,14 +230,14 @@ class SafeBotTeamsFactory:
     
     def create_risk_analyst_agent(self) -> Agent:
         """Agente especialista em análise de riscos"""
-        return Agent(
+        return SafeBotAgent(
             name="Risk Analyst",
             role="Especialista em análise de riscos ocupacionais",
-            model=OpenAIChat(id="gpt-4o-mini"),
+            model=cascade_model("specialist.risk", "gpt-4o-mini"),
             knowledge=self.knowledge_base,
             storage=self.create_base_storage("risk_analyst"),
             memory=self.shared_memory,
-            tools=[DuckDuckGoTools()],
+            tools=[WebSearchTools()],
             instructions=[
                 "Você é especialista em análise de riscos ocupacionais relacionados à NR-06.",
                 "Foque em: identificação de riscos, avaliação de exposição, medidas de controle.",
@@ -195,11 +258,11 @@ class SafeBotTeamsFactory:
     
     def create_web_researcher_agent(self) -> Agent:
         """Agente para pesquisas web complementares"""
-        return Agent(
+        return SafeBotAgent(
             name="Web Researcher",
             role="Pesquisador web para informações complementares sobre segurança",
-            model=OpenAIChat(id="gpt-4o-mini"),
-            tools=[DuckDuckGoTools()],
+            model=cascade_model("specialist.web_research", "gpt-4o-mini"),
+            tools=[WebSearchTools()],
             storage=self.create_base_storage("web_researcher"),
             memory=self.shared_memory,
             instructions=[
@@ -208,6 +271,7 @@ class SafeBotTeamsFactory:
                 "Complemente informações da NR-06 com dados atuais do mercado.",
                 "Verifique sempre a confiabilidade das fontes.",
                 "Foque em sites oficiais, fabricantes reconhecidos e órgãos técnicos.",
+                "Para vários tópicos, use web_search_many com todas as consultas de uma vez.",
                 "",
                 "🔍 ESPECIALIDADES:",
                 "• Novos produtos e tecnologias em EPIs",
@@ -227,11 +291,12 @@ class SafeBotTeamsFactory:
         """
         Team abrangente para análise completa de segurança
         Modo: COORDINATE - O líder coordena especialistas e sintetiza respostas
+        (delegações da mesma rodada rodam em paralelo, cada uma com prazo próprio)
         """
-        return Team(
+        return SafeBotTeam(
             name="Comprehensive Safety Team",
             mode="coordinate",
-            model=Claude(id="claude-3-5-sonnet-20241022"),
+            model=cascade_model("comprehensive", "claude-3-5-sonnet-20241022"),
             members=[
                 self.create_epi_specialist_agent(),
                 self.create_compliance_auditor_agent(),
@@ -249,7 +314,7 @@ class SafeBotTeamsFactory:
                 "",
                 "📋 PROCESSO DE COORDENAÇÃO:",
                 "1. Analise a questão e identifique quais especialistas devem ser consultados",
-                "2. Delegue tarefas específicas para cada especialista relevante",
+                "2. Delegue tarefas específicas para cada especialista relevante, todas na mesma rodada (rodam em paralelo)",
                 "3. Colete e analise as respostas de todos os especialistas",
                 "4. Sintetize em um relatório final estruturado e abrangente",
                 "5. Identifique lacunas ou necessidades de informações adicionais",
@@ -267,48 +332,43 @@ class SafeBotTeamsFactory:
             show_members_responses=True,
             markdown=True,
             add_datetime_to_instructions=True,
+            sub_answers=self.sub_answers,
         )
     
     def create_quick_consultation_team(self) -> Team:
         """
         Team para consultas rápidas e específicas
         Modo: ROUTE - Direciona para o especialista mais adequado
+        (perguntas claras são roteadas localmente, sem chamada ao LLM)
         """
-        return Team(
+        members = [
+            self.create_epi_specialist_agent(),
+            self.create_compliance_auditor_agent(),
+            self.create_training_specialist_agent(),
+            self.create_risk_analyst_agent(),
+        ]
+        return SafeBotTeam(
             name="Quick Consultation Team",
             mode="route",
-            model=OpenAIChat(id="gpt-4o"),
-            members=[
-                self.create_epi_specialist_agent(),
-                self.create_compliance_auditor_agent(),
-                self.create_training_specialist_agent(),
-                self.create_risk_analyst_agent(),
-            ],
-            instructions=[
-                "Você é um roteador inteligente de consultas sobre NR-06.",
-                "Analise a questão do usuário e direcione para o especialista mais adequado:",
-                "",
-                "🎯 CRITÉRIOS DE ROTEAMENTO:",
-                "• EPI Specialist: Questões sobre tipos, seleção, especificações de EPIs",
-                "• Compliance Auditor: Questões sobre conformidade, auditoria, documentação",
-                "• Training Specialist: Questões sobre treinamentos, capacitação, educação",
-                "• Risk Analyst: Questões sobre riscos, exposições, análise de ambiente",
-                "",
-                "Se a questão envolver múltiplas especialidades, encaminhe para o especialista principal e mencione a necessidade de consulta adicional.",
-            ],
+            model=cascade_model("quick", "gpt-4o"),
+            members=members,
+            instructions=QUICK_ROUTING_INSTRUCTIONS,
             show_members_responses=True,
             markdown=True,
+            pre_router=self.quick_pre_router(members),
+            routing_log=self.routing_log,
         )
     
     def create_collaborative_research_team(self) -> Team:
         """
         Team para pesquisa colaborativa sobre tópicos complexos
         Modo: COLLABORATE - Todos os membros trabalham na mesma questão
+        (em paralelo, cada um com prazo próprio)
         """
-        return Team(
+        return SafeBotTeam(
             name="Collaborative Research Team",
             mode="collaborate",
-            model=OpenAIChat(id="gpt-4o"),
+            model=cascade_model("research", "gpt-4o"),
             members=[
                 self.create_epi_specialist_agent(),
                 self.create_risk_analyst_agent(),
@@ -332,8 +392,80 @@ class SafeBotTeamsFactory:
             enable_agentic_context=True,
             show_members_responses=True,
             markdown=True,
+            sub_answers=self.sub_answers,
         )
 
+# ============================================================================
+# EXECUÇÃO CONCORRENTE
+# ============================================================================
+
+class TeamPool:
+    """
+    Instâncias de um mesmo team para execuções concorrentes
+    
+    Um Team do agno guarda session_id, session_state e run_response no próprio
+    objeto, então duas execuções simultâneas na mesma instância se misturam.
+    Cada execução usa uma instância exclusiva e recebe user_id/session_id
+    explícitos; o contexto agêntico (memória v2) já é separado por session_id.
+    """
+    
+    def __init__(self, create_team: Callable[[], Team], max_size: int = 8):
+        self.create_team = create_team
+        self.max_size = max_size
+        self._idle: "queue.LifoQueue[Team]" = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        # Instância criada de imediato: valida a configuração e serve de metadado
+        self.template = self._create()
+        self._idle.put(self.template)
+    
+    @property
+    def name(self) -> Optional[str]:
+        return self.template.name
+    
+    @property
+    def mode(self) -> str:
+        return self.template.mode
+    
+    def _create(self) -> Team:
+        with self._lock:
+            self._created += 1
+        return self.create_team()
+    
+    @contextmanager
+    def checkout(self) -> Iterator[Team]:
+        """Empresta uma instância exclusiva (cria outra até max_size, depois espera)"""
+        try:
+            team = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_create = self._created < self.max_size
+            team = self._create() if can_create else self._idle.get()
+        try:
+            yield team
+        finally:
+            self._idle.put(team)
+    
+    def run(self, message: str, *, user_id: str, session_id: str, stream: bool = False, **kwargs):
+        """Executa o team com contexto explícito do usuário"""
+        if stream:
+            return self._stream(message, user_id=user_id, session_id=session_id, **kwargs)
+        with self.checkout() as team:
+            return team.run(message, user_id=user_id, session_id=session_id, **kwargs)
+    
+    def _stream(self, message: str, **kwargs):
+        # A instância fica reservada até o stream terminar (ou ser fechado)
+        with self.checkout() as team:
+            yield from team.run(message, stream=True, **kwargs)
+    
+    def stats(self) -> Dict[str, int]:
+        return {"created": self._created, "idle": self._idle.qsize(), "max_size": self.max_size}
+
+
+def team_session_id(channel: str, user_id: Any, team_name: str) -> str:
+    """Sessão estável por canal, usuário e team (mesma em qualquer réplica)"""
+    return f"{channel}-{user_id}-{team_name}"
+
 # ============================================================================
 # FUNÇÕES DE CONVENIÊNCIA
 # ============================================================================
@@ -357,6 +489,32 @@ def load_knowledge_base(recreate: bool = False) -> bool:
         print(f"❌ Erro ao carregar base de conhecimento: {e}")
         return False
 
+def _percent(value: Optional[float]) -> str:
+    return "n/d" if value is None else f"{value:.0%}"
+
+def evaluate_router(labelled_path: str = "data/routing_labels.jsonl") -> Optional[Dict[str, Any]]:
+    """Avalia o pré-roteador do Quick Consultation Team no conjunto rotulado"""
+    if not Path(labelled_path).exists():
+        print(f"❌ Conjunto rotulado não encontrado: {labelled_path}")
+        return None
+    labelled = load_labelled(labelled_path)
+    if not labelled:
+        print(f"❌ Conjunto rotulado sem exemplos válidos: {labelled_path}")
+        return None
+    
+    factory = SafeBotTeamsFactory()
+    team = factory.create_quick_consultation_team()
+    if team.pre_router is None:
+        print("⚠️ Pré-roteador desativado (SAFEBOT_ROUTER_ENABLED=false)")
+        return None
+    
+    result = team.pre_router.evaluate(labelled)
+    print(f"🧭 Pré-roteador: {result['examples']} exemplos rotulados")
+    print(f"🎯 Acurácia geral: {_percent(result['accuracy'])}")
+    print(f"⚡ Cobertura local: {_percent(result['local_coverage'])} (acurácia {_percent(result['local_accuracy'])})")
+    print(f"⏱️ Latência média: {result['mean_latency_ms']} ms")
+    return result
+
 # ============================================================================
 # EXEMPLO DE USO
 # ============================================================================
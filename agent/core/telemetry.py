@@ -0,0 +1,279 @@
+"""
+SafeBot Telemetry - Métricas por agente/team e exportação para o Prometheus
+Registra, por agente e por team, execuções, duração total e por etapa
+(retrieval, LLM, ferramentas, storage) e tokens de saída; acompanha a fila dos
+thread pools e a ocupação dos pools de conexão do SQLAlchemy. Os apps FastAPI
+ganham /metrics (instrument_app); os bots do Telegram, que não têm servidor
+HTTP, expõem as mesmas métricas em uma porta lateral (SAFEBOT_METRICS_PORT).
+"""
+import os
+import time
+import logging
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from core.deadline import DeadlineExceeded
+from core.metrics import PROMETHEUS_CONTENT_TYPE, metrics
+
+logger = logging.getLogger(__name__)
+
+metrics.describe("safebot_runs_total", "Execuções por agente/team, tipo (agent/team) e status (ok/error/cancelled)")
+metrics.describe("safebot_run_seconds", "Duração total das execuções por agente/team")
+metrics.describe("safebot_stage_seconds", "Duração das etapas das execuções por agente/team (retrieval/llm/tool/storage)")
+metrics.describe("safebot_completion_tokens_total", "Tokens de saída por agente/team")
+metrics.describe("safebot_http_server_requests_total", "Requisições HTTP atendidas por serviço, rota, agente/team do Playground e status")
+metrics.describe("safebot_http_server_seconds", "Duração das requisições HTTP por serviço, rota e agente/team do Playground")
+metrics.describe("safebot_executor_queue_depth", "Tarefas aguardando thread nos pools de execução")
+metrics.describe("safebot_db_pool_size", "Conexões mantidas pelo pool do banco")
+metrics.describe("safebot_db_pool_checked_out", "Conexões do pool do banco em uso")
+metrics.describe("safebot_db_pool_overflow", "Conexões abertas além do tamanho do pool")
+metrics.describe("safebot_db_pool_utilization", "Conexões em uso sobre o máximo do pool (tamanho + overflow)")
+
+RUN_BUCKETS = (0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 45.0, 60.0, 90.0, 120.0, 300.0)
+
+
+def run_label(name: Optional[str]) -> str:
+    return name or "unnamed"
+
+
+# ============================================================================
+# EXECUÇÕES E ETAPAS
+# ============================================================================
+
+@contextmanager
+def stage(name: Optional[str], stage_name: str) -> Iterator[None]:
+    """Mede uma etapa da execução (retrieval, storage) do agente/team"""
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        metrics.observe("safebot_stage_seconds", time.monotonic() - started, agent=run_label(name), stage=stage_name)
+
+
+def record_run_messages(name: Optional[str], messages: List[Any]):
+    """Tempo de LLM e tokens de saída das respostas do modelo nesta execução (sem o histórico)"""
+    label = run_label(name)
+    for message in messages:
+        if message.role != "assistant" or message.metrics is None or message.from_history:
+            continue
+        if message.metrics.time is not None:
+            metrics.observe("safebot_stage_seconds", message.metrics.time, agent=label, stage="llm")
+        if message.metrics.output_tokens:
+            metrics.inc("safebot_completion_tokens_total", message.metrics.output_tokens, agent=label)
+
+
+def _record_tools(label: str, response: Any):
+    for tool in getattr(response, "tools", None) or []:
+        elapsed = getattr(getattr(tool, "metrics", None), "time", None)
+        if elapsed is not None:
+            metrics.observe("safebot_stage_seconds", elapsed, agent=label, stage="tool")
+
+
+def _finish(owner: Any, kind: str, started: float, status: str):
+    label = run_label(owner.name)
+    metrics.inc("safebot_runs_total", agent=label, kind=kind, status=status)
+    metrics.observe("safebot_run_seconds", time.monotonic() - started, buckets=RUN_BUCKETS, agent=label, kind=kind)
+    if status == "ok":
+        _record_tools(label, owner.run_response)
+
+
+def _status(error: BaseException) -> str:
+    return "cancelled" if isinstance(error, DeadlineExceeded) else "error"
+
+
+def observe_run(owner: Any, kind: str, call: Callable[[], Any]) -> Any:
+    """Executa o run do agente/team registrando contagem e duração (em streaming, até o último evento)"""
+    started = time.monotonic()
+    try:
+        result = call()
+    except Exception as e:
+        _finish(owner, kind, started, _status(e))
+        raise
+    if isinstance(result, Iterator):
+        return _observe_stream(owner, kind, started, result)
+    _finish(owner, kind, started, "ok")
+    return result
+
+
+def _observe_stream(owner: Any, kind: str, started: float, events: Iterator[Any]) -> Iterator[Any]:
+    status = "cancelled"  # Stream fechado pelo consumidor antes do fim (GeneratorExit)
+    try:
+        yield from events
+        status = "ok"
+    except Exception as e:
+        status = _status(e)
+        raise
+    finally:
+        _finish(owner, kind, started, status)
+
+
+async def aobserve_run(owner: Any, kind: str, call: Callable[[], Awaitable[Any]]) -> Any:
+    """Versão assíncrona de observe_run"""
+    started = time.monotonic()
+    try:
+        result = await call()
+    except Exception as e:
+        _finish(owner, kind, started, _status(e))
+        raise
+    if hasattr(result, "__aiter__"):
+        return _aobserve_stream(owner, kind, started, result)
+    _finish(owner, kind, started, "ok")
+    return result
+
+
+async def _aobserve_stream(owner: Any, kind: str, started: float, events: AsyncIterator[Any]) -> AsyncIterator[Any]:
+    status = "cancelled"  # aclose() do consumidor ou tarefa cancelada
+    try:
+        async for event_ in events:
+            yield event_
+        status = "ok"
+    except Exception as e:
+        status = _status(e)
+        raise
+    finally:
+        _finish(owner, kind, started, status)
+
+
+# ============================================================================
+# FILAS E POOLS DE CONEXÃO
+# ============================================================================
+
+_executors: Dict[str, "weakref.ref[ThreadPoolExecutor]"] = {}
+_engines: "weakref.WeakSet[Engine]" = weakref.WeakSet()
+_watch_lock = threading.Lock()
+
+
+def watch_executor(name: str, executor: ThreadPoolExecutor):
+    """Exporta a fila do thread pool em safebot_executor_queue_depth{pool=name}"""
+    with _watch_lock:
+        _executors[name] = weakref.ref(executor)
+
+
+def _track_engine(connection: Any):
+    with _watch_lock:
+        _engines.add(connection.engine)
+
+
+def database_label(engine: Engine) -> str:
+    """Rótulo do banco: backend e arquivo (SQLite) ou host e base (Postgres)"""
+    url = engine.url
+    if url.get_backend_name() == "sqlite":
+        return f"sqlite:{os.path.basename(url.database or '') or 'memory'}"
+    return f"{url.get_backend_name()}:{url.host}/{url.database}"
+
+
+def _collect_pools():
+    with _watch_lock:
+        executors = {name: ref() for name, ref in _executors.items()}
+        engines = list(_engines)
+    for name, executor in executors.items():
+        if executor is not None:
+            metrics.set_gauge("safebot_executor_queue_depth", executor._work_queue.qsize(), pool=name)
+    for engine in engines:
+        pool = engine.pool
+        if not hasattr(pool, "checkedout"):
+            continue  # Pools sem contagem (NullPool, StaticPool)
+        db = database_label(engine)
+        size, checked_out, overflow = pool.size(), pool.checkedout(), max(pool.overflow(), 0)
+        metrics.set_gauge("safebot_db_pool_size", size, db=db)
+        metrics.set_gauge("safebot_db_pool_checked_out", checked_out, db=db)
+        metrics.set_gauge("safebot_db_pool_overflow", overflow, db=db)
+        capacity = size + max(getattr(pool, "_max_overflow", 0), 0)
+        if capacity:
+            metrics.set_gauge("safebot_db_pool_utilization", round(checked_out / capacity, 4), db=db)
+
+
+# Todos os engines do processo (storage e memória do agno, manutenção, estado dos bots)
+event.listen(Engine, "engine_connect", _track_engine)
+metrics.add_collector(_collect_pools)
+
+
+# ============================================================================
+# EXPORTAÇÃO
+# ============================================================================
+
+class MetricsMiddleware:
+    """Middleware ASGI que conta e mede as requisições por rota (o modelo da rota, não o caminho)"""
+
+    def __init__(self, app, service: str):
+        self.app = app
+        self.service = service
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.monotonic()
+        status = {"code": 500}
+
+        async def tracked_send(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, tracked_send)
+        finally:
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            params = scope.get("path_params") or {}
+            # Rotas do Playground por agente/team: /playground/agents/{agent_id}/runs
+            agent = params.get("agent_id") or params.get("team_id") or ""
+            labels = {"service": self.service, "route": route, "agent": agent}
+            metrics.inc("safebot_http_server_requests_total", status=str(status["code"]), **labels)
+            metrics.observe("safebot_http_server_seconds", time.monotonic() - started, **labels)
+
+
+def instrument_app(app: Any, service: str):
+    """Adiciona a medição das requisições e o endpoint /metrics a um app FastAPI"""
+    from fastapi import Response
+
+    app.add_middleware(MetricsMiddleware, service=service)
+
+    async def metrics_endpoint():
+        return Response(metrics.render_prometheus(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+    app.add_api_route("/metrics", metrics_endpoint, methods=["GET"], include_in_schema=False)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", PROMETHEUS_CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Scrapes a cada poucos segundos não devem poluir o log do bot
+
+
+def start_metrics_server(port: int, host: str = "0.0.0.0") -> Optional[ThreadingHTTPServer]:
+    """Servidor HTTP mínimo em thread com /metrics (processos sem FastAPI)"""
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        logger.warning(f"Métricas indisponíveis: porta {port} em uso ({e})")
+        return None
+    threading.Thread(target=server.serve_forever, name="safebot-metrics", daemon=True).start()
+    logger.info(f"Métricas em http://{host}:{port}/metrics")
+    return server
+
+
+def start_metrics_server_from_env(offset: int = 0) -> Optional[ThreadingHTTPServer]:
+    """Porta lateral dos bots: SAFEBOT_METRICS_PORT (+offset por worker; 0 desativa)"""
+    port = int(os.getenv("SAFEBOT_METRICS_PORT", "9464"))
+    if port <= 0:
+        return None
+    return start_metrics_server(port + offset, os.getenv("SAFEBOT_METRICS_HOST", "0.0.0.0"))
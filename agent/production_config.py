@@ -3,8 +3,6 @@ Configuração de produção para o sistema NR-06
 """
 import os
 from pathlib import Path
-from agno.agent import Agent
-from agno.models.openai import OpenAIChat
 from agno.playground import Playground
 from agno.storage.postgres import PostgresStorage
 from agno.knowledge.pdf import PDFKnowledgeBase
@@ -13,6 +11,11 @@ from agno.memory.v2.db.postgres import PostgresMemoryDb
 from agno.memory.v2.memory import Memory
 from agno.tools.duckduckgo import DuckDuckGoTools
 from agno.tools.python import PythonTools
+from core.memory import RankedMemory, get_memory_extraction_queue
+from core.models import create_model
+from core.runtime import SafeBotAgent
+from core.telemetry import instrument_app
+from telegram_bot.webhook import mount_from_env
 import sentry_sdk
 from sentry_sdk.integrations.fastapi import FastApiIntegration
 from dotenv import load_dotenv
@@ -62,9 +65,9 @@ def create_production_vector_db():
     )
 
 def create_production_memory(agent_name: str):
-    """Cria memória PostgreSQL para produção"""
-    return Memory(
-        model=OpenAIChat(id="gpt-4o-mini"),
+    """Cria memória PostgreSQL para produção (extração em background, leitura ranqueada)"""
+    return RankedMemory(
+        model=create_model("gpt-4o-mini"),
         db=PostgresMemoryDb(
             table_name=f"{agent_name}_memories",
             db_url=DATABASE_URL
@@ -115,7 +118,7 @@ def create_production_agents():
     
     # Configuração base para todos os agentes
     base_config = {
-        "model": OpenAIChat(id="gpt-4o-mini"),
+        "model": create_model("gpt-4o-mini"),
         "knowledge": knowledge_base,
         "search_knowledge": True,
         "add_datetime_to_instructions": True,
@@ -125,7 +128,7 @@ def create_production_agents():
     }
     
     # 1. EPI Selector
-    agents.append(Agent(
+    agents.append(SafeBotAgent(
         name="🎯 Seletor de EPIs",
         memory=create_production_memory("epi_selector"),
         user_id="epi_specialist",
@@ -141,7 +144,7 @@ def create_production_agents():
     ))
     
     # 2. Auditor
-    agents.append(Agent(
+    agents.append(SafeBotAgent(
         name="📋 Auditor NR-06",
         memory=create_production_memory("audit_agent"),
         user_id="audit_specialist",
@@ -156,7 +159,7 @@ def create_production_agents():
     ))
     
     # 3. Training Designer
-    agents.append(Agent(
+    agents.append(SafeBotAgent(
         name="🎓 Designer de Treinamentos",
         memory=create_production_memory("training_agent"),
         user_id="training_specialist",
@@ -171,7 +174,7 @@ def create_production_agents():
     ))
     
     # 4. Incident Investigator
-    agents.append(Agent(
+    agents.append(SafeBotAgent(
         name="🔍 Investigador de Acidentes",
         memory=create_production_memory("incident_agent"),
         user_id="incident_specialist",
@@ -186,7 +189,7 @@ def create_production_agents():
     ))
     
     # 5. Legal Advisor
-    agents.append(Agent(
+    agents.append(SafeBotAgent(
         name="⚖️ Consultor Legal NR-06",
         memory=create_production_memory("legal_agent"),
         user_id="legal_specialist",
@@ -201,7 +204,7 @@ def create_production_agents():
     ))
     
     # 6. Procedure Generator
-    agents.append(Agent(
+    agents.append(SafeBotAgent(
         name="📝 Gerador de POPs",
         memory=create_production_memory("procedure_agent"),
         user_id="procedure_specialist",
@@ -233,6 +236,8 @@ def create_production_app():
     )
     
     app = playground_app.get_app()
+    # /metrics no formato do Prometheus e medição das requisições
+    instrument_app(app, "production")
     
     # Health check endpoint
     @app.get("/health")
@@ -241,9 +246,13 @@ def create_production_app():
             "status": "healthy",
             "environment": ENVIRONMENT,
             "agents_count": len(agents),
-            "knowledge_base": "loaded" if knowledge_base else "not_loaded"
+            "knowledge_base": "loaded" if knowledge_base else "not_loaded",
+            "memory_queue": get_memory_extraction_queue().stats(),
         }
     
+    # Webhook do bot Telegram nos mesmos workers (SAFEBOT_TELEGRAM_WEBHOOK=agent)
+    mount_from_env(app, "agent")
+    
     return app, knowledge_base
 
 # Criar aplicação
@@ -5,7 +5,7 @@ Ponto de entrada unificado para todos os canais (Web, Telegram, CLI)
 """
 import sys
 import os
-from typing import Optional
+from typing import Optional, Tuple
 
 
 def show_help():
@@ -21,13 +21,18 @@ def show_help():
    • Múltiplos usuários simultâneos
    • Memória individual por usuário
    • Comandos: /start, /help, /status
+   • --webhook: recebe updates via HTTP em vez de polling
+   • --workers N: N processos, chats distribuídos por hash do chat_id
 
 2. 🤝 TELEGRAM TEAMS (Novo!)
    python safebot.py telegram-teams
    • Bot com sistema multi-agente
    • 3 teams especializados (Quick, Comprehensive, Research)
+   • Modo Auto (padrão): team escolhido pela complexidade da pergunta
    • Colaboração entre especialistas
    • Análises mais completas e precisas
+   • --webhook: recebe updates via HTTP em vez de polling
+   • --workers N: N processos, chats distribuídos por hash do chat_id
 
 3. 🌐 WEB APPLICATION  
    python safebot.py web
@@ -48,6 +53,21 @@ def show_help():
    • Carrega base de conhecimento NR-06
    • Execute antes do primeiro uso
 
+   python safebot.py maintenance [--dry-run] [--postgres]
+   • Arquiva sessões ociosas e runs antigas (tmp/archive/*.jsonl.gz)
+   • Executa VACUUM/ANALYZE nos bancos de sessão e memória
+   • Reporta espaço recuperado e latência de leitura antes/depois
+
+   python safebot.py router-eval [arquivo.jsonl]
+   • Avalia o pré-roteador local do Quick Team (data/routing_labels.jsonl)
+   • Mostra acurácia, cobertura local e latência por pergunta
+
+   python safebot.py batch entradas.csv --target auditor [--out resultados.jsonl]
+   • Processa auditorias, checklists e POPs em lote (CSV ou JSONL)
+   • Alvos: agente web (auditor, procedure, ...) ou team:quick|comprehensive|research
+   • Concorrência, novas tentativas e retomada pelo JSONL de saída
+   • --provider-batch: Batch API da OpenAI (mais barato, até 24h)
+
 4. ℹ️ INFORMAÇÕES
    python safebot.py info
    • Mostra informações do sistema
@@ -57,6 +77,12 @@ def show_help():
 export OPENAI_API_KEY=sua-chave-aqui
 export TELEGRAM_TOKEN=seu-token-aqui  # Apenas para Telegram
 
+📨 MODO WEBHOOK (Telegram):
+export TELEGRAM_WEBHOOK_URL=https://seu-dominio  # URL pública (nginx)
+export TELEGRAM_WEBHOOK_SECRET=segredo-aleatorio
+export SAFEBOT_TELEGRAM_WEBHOOK=agent,teams      # Monta nos apps web (um processo)
+# Com vários workers web: python safebot.py telegram --webhook (receptor único)
+
 🏗️ NOVA ARQUITETURA MULTI-AGENTE:
 ├── core/
 │   ├── agent.py         # Factory de agentes individuais
@@ -125,9 +151,57 @@ def show_info():
     print("\n💡 Use 'python safebot.py help' para mais informações")
 
 
+def parse_workers() -> Optional[int]:
+    """Lê '--workers N' da linha de comando (sem N: um worker por núcleo)"""
+    args = sys.argv[2:]
+    if "--workers" not in args:
+        return None
+    index = args.index("--workers")
+    value = args[index + 1] if index + 1 < len(args) else None
+    if value is None or value.startswith("--"):
+        return os.cpu_count() or 1
+    try:
+        workers = int(value)
+    except ValueError:
+        raise ValueError(f"--workers espera um número inteiro, recebeu '{value}'")
+    if workers < 1:
+        raise ValueError("--workers deve ser >= 1")
+    return workers
+
+
+def parse_telegram_mode() -> Tuple[Optional[int], bool]:
+    """Lê '--workers N' e '--webhook'; os dois juntos não são suportados"""
+    workers = parse_workers()
+    webhook = "--webhook" in sys.argv[2:]
+    if workers and webhook:
+        raise ValueError(
+            "--workers e --webhook não podem ser usados juntos: o webhook já é um receptor único "
+            "(use --webhook sozinho, ou --workers N com polling)"
+        )
+    return workers, webhook
+
+
 def run_telegram():
     """Executa o bot do Telegram (individual)"""
     try:
+        workers, webhook = parse_telegram_mode()
+    except ValueError as e:
+        print(f"❌ {e}")
+        return
+
+    try:
+        if workers:
+            from telegram_bot.workers import main as workers_main
+
+            workers_main("agent", workers)
+            return
+
+        if webhook:
+            from telegram_bot.webhook import serve
+
+            serve("agent")
+            return
+
         from telegram_bot.bot import main as telegram_main
 
         telegram_main()
@@ -143,6 +217,24 @@ def run_telegram():
 def run_telegram_teams():
     """Executa o bot do Telegram com teams"""
     try:
+        workers, webhook = parse_telegram_mode()
+    except ValueError as e:
+        print(f"❌ {e}")
+        return
+
+    try:
+        if workers:
+            from telegram_bot.workers import main as workers_main
+
+            workers_main("teams", workers)
+            return
+
+        if webhook:
+            from telegram_bot.webhook import serve
+
+            serve("teams")
+            return
+
         from telegram_bot.teams_bot import main as telegram_teams_main
 
         telegram_teams_main()
@@ -197,6 +289,69 @@ def load_knowledge_base():
         print(f"❌ Erro ao carregar knowledge base: {e}")
 
 
+def run_maintenance():
+    """Executa retenção, arquivamento e compactação dos bancos"""
+    try:
+        from core.maintenance import run_maintenance as maintenance
+
+        args = sys.argv[2:]
+        database_url = os.getenv("DATABASE_URL") if "--postgres" in args else None
+        report = maintenance(database_url=database_url, dry_run="--dry-run" in args)
+        report.print_summary()
+    except ImportError as e:
+        print(f"❌ Erro ao importar módulo Core: {e}")
+    except Exception as e:
+        print(f"❌ Erro ao executar manutenção: {e}")
+
+
+def run_router_eval():
+    """Avalia o pré-roteador local do Quick Consultation Team"""
+    try:
+        from core.teams import evaluate_router
+
+        args = [arg for arg in sys.argv[2:] if not arg.startswith("-")]
+        evaluate_router(args[0]) if args else evaluate_router()
+    except ImportError as e:
+        print(f"❌ Erro ao importar módulo Core: {e}")
+    except Exception as e:
+        print(f"❌ Erro ao avaliar pré-roteador: {e}")
+
+
+def run_batch():
+    """Processa um arquivo de entradas em lote"""
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="safebot.py batch", description="Processamento em lote do SafeBot")
+    parser.add_argument("input", help="CSV (com cabeçalho) ou JSONL; prompt nas colunas prompt/input/pergunta")
+    parser.add_argument("--target", default="agent:general", help="agent:<tipo> ou team:<quick|comprehensive|research>")
+    parser.add_argument("--out", help="JSONL de resultados (padrão: <entrada>.results.jsonl)")
+    parser.add_argument("--template", help="Prompt com campos da entrada, ex.: 'Audite: {descricao}'")
+    parser.add_argument("--concurrency", type=int, help="Execuções simultâneas (SAFEBOT_BATCH_CONCURRENCY)")
+    parser.add_argument("--retries", type=int, help="Novas tentativas por item (SAFEBOT_BATCH_RETRIES)")
+    parser.add_argument("--provider-batch", action="store_true", help="Enviar pela Batch API da OpenAI")
+    parser.add_argument("--wait", action="store_true", help="Com --provider-batch, aguardar o fim do lote")
+    args = parser.parse_args(sys.argv[2:])
+
+    try:
+        from core.batch import run_batch as batch
+
+        report = batch(
+            args.input,
+            target=args.target,
+            output_path=args.out,
+            template=args.template,
+            concurrency=args.concurrency,
+            retries=args.retries,
+            provider_batch=args.provider_batch,
+            wait=args.wait,
+        )
+        report.print_summary()
+    except ImportError as e:
+        print(f"❌ Erro ao importar módulo Core: {e}")
+    except Exception as e:
+        print(f"❌ Erro no processamento em lote: {e}")
+
+
 def main():
     """Função principal do launcher"""
 
@@ -210,6 +365,9 @@ def main():
         print("• web           - Executar aplicação web individual")
         print("• web-teams     - Executar aplicação web com teams")
         print("• load-kb       - Carregar base de conhecimento")
+        print("• maintenance   - Retenção e compactação dos bancos")
+        print("• router-eval   - Avaliar o pré-roteador do Quick Team")
+        print("• batch         - Processar entradas em lote (CSV/JSONL)")
         print("• info          - Mostrar informações do sistema")
         print("• help          - Mostrar ajuda completa")
         print("\n💡 Use 'python safebot.py help' para mais detalhes")
@@ -224,6 +382,9 @@ def main():
         "web": run_web,
         "web-teams": run_web_teams,
         "load-kb": load_knowledge_base,
+        "maintenance": run_maintenance,
+        "router-eval": run_router_eval,
+        "batch": run_batch,
         "info": show_info,
         "help": show_help,
         "--help": show_help,
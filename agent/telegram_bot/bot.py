@@ -1,8 +1,12 @@
 import os
+import time
+import uuid
+import asyncio
 import logging
-from typing import Dict
+from typing import Dict, Optional
 from telegram import Update
 from telegram.ext import Application, MessageHandler, CommandHandler, filters, ContextTypes
+from agno.exceptions import ModelProviderError
 from dotenv import load_dotenv
 
 # Importar factory do core
@@ -10,6 +14,16 @@ import sys
 import os
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 from core.agent import create_telegram_agent
+from core.state import SessionStateStore, create_state_store
+from core.maintenance import start_scheduler_from_env
+from core.telemetry import start_metrics_server_from_env
+from core.deadline import DeadlineExceeded, deadline_scope
+from telegram_bot.executor import AgentExecutor
+from telegram_bot.formatting import render_html, split_html
+from telegram_bot.sender import OutboundSender
+from telegram_bot.coalescer import CoalescedRun, MessageCoalescer
+from telegram_bot.scheduler import ChatScheduler, QueueFullError, queue_notice
+from telegram_bot.streaming import TelegramStreamWriter, stream_run, streaming_enabled
 
 # Configurar logging
 logging.basicConfig(
@@ -24,13 +38,32 @@ load_dotenv()
 class SafeBotTelegram:
     """Bot real do Telegram que responde automaticamente"""
     
-    def __init__(self, telegram_token: str):
+    def __init__(
+        self,
+        telegram_token: str,
+        concurrency: Optional[int] = None,
+        streaming: Optional[bool] = None,
+        state_store: Optional[SessionStateStore] = None,
+        global_rate: Optional[float] = None,
+    ):
         self.telegram_token = telegram_token
-        self.user_agents: Dict[str, object] = {}  # Cache de agentes por usuário
+        self.streaming = streaming_enabled() if streaming is None else streaming  # Respostas progressivas
+        self.state = state_store or create_state_store()  # Estado compartilhado entre réplicas
+        self.user_agents: Dict[str, object] = {}  # Cache local de agentes por usuário
+        self.user_locks: Dict[str, asyncio.Lock] = {}  # Uma execução por agente (a fila é por chat)
+        self.executor = AgentExecutor(concurrency)  # Execuções de LLM fora do event loop
+        self.scheduler = ChatScheduler(max_in_flight=self.executor.max_workers)  # Fila ordenada por chat
+        self.sender = OutboundSender(global_rate=global_rate)  # Envio com limites do Telegram e reenvio
+        self.coalescer = MessageCoalescer()  # Junta mensagens em rajada em uma execução
         
     def get_user_agent(self, user_id: str):
         """Obtém ou cria agente para um usuário específico"""
         if user_id not in self.user_agents:
+            # A sessão do agno fica no state store: qualquer réplica retoma o mesmo histórico
+            state = self.state.update(
+                f"agent:{user_id}",
+                lambda state: {**state, "session_id": state.get("session_id") or str(uuid.uuid4())}
+            )
             self.user_agents[user_id] = create_telegram_agent(
                 user_id=user_id,
                 telegram_tools=[],  # Lista vazia - sem tools telegram
@@ -38,7 +71,8 @@ class SafeBotTelegram:
                     "IMPORTANTE: Você deve apenas retornar o conteúdo da resposta.",
                     "NÃO envie mensagens diretamente - o bot controlará o envio.",
                     "Foque apenas em gerar conteúdo útil e bem formatado em HTML."
-                ]
+                ],
+                session_id=state["session_id"]
             )
             
             logger.info(f"Novo agente criado para usuário {user_id}")
@@ -81,6 +115,7 @@ Exemplo: <i>"Preciso de equipamentos para soldador"</i>
 /start - Iniciar conversa com o SafeBot
 /help - Mostrar esta ajuda
 /status - Ver status da sua sessão
+/cancelar - Interromper a resposta em andamento
 
 <b>💡 Como usar:</b>
 Simplesmente digite sua pergunta sobre segurança do trabalho!
@@ -102,7 +137,7 @@ Estou aqui para ajudar! 🛡️
         user_id = str(user.id)
         
         # Estatísticas básicas
-        agent_exists = user_id in self.user_agents
+        agent_exists = self.state.get(f"agent:{user_id}") is not None
         
         status_text = f"""
 📊 <b>Status da Sessão - {user.first_name}</b>
@@ -116,11 +151,41 @@ Estou aqui para ajudar! 🛡️
         
         await update.message.reply_text(status_text, parse_mode='HTML')
     
+    async def cancel_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Comando /cancelar: interrompe a resposta em andamento"""
+        if self.coalescer.cancel(update.effective_chat.id):
+            await update.message.reply_text("🛑 Resposta cancelada.")
+        else:
+            await update.message.reply_text("Nenhuma resposta em andamento.")
+    
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Handler principal para mensagens do usuário"""
+        """Handler principal: agrupa a rajada e enfileira na fila ordenada do chat"""
+        received_at = time.monotonic()
+        run = await self.coalescer.collect(update.effective_chat.id, update.message.text)
+        if run is None:
+            return  # Mensagem incorporada à execução da mensagem seguinte
+        try:
+            await self.scheduler.submit(
+                update.effective_chat.id,
+                lambda: self._process_message(update, context, received_at, run),
+                notify=lambda position: self._reply(update, queue_notice(position), parse_mode='HTML')
+            )
+        except QueueFullError as e:
+            logger.warning(f"Mensagem recusada: {e}")
+            self.coalescer.release(run)
+            self._reply(update, "⚠️ Muitas mensagens em processamento. Tente novamente em alguns instantes.")
+    
+    async def _process_message(
+        self, update: Update, context: ContextTypes.DEFAULT_TYPE, received_at: float, run: CoalescedRun
+    ):
+        """Processa uma mensagem (ou rajada de mensagens) do usuário com o agente"""
+        if run.superseded:
+            return  # Substituída antes de começar
+        deadline = run.start_deadline()
         user = update.effective_user
         user_id = str(user.id)
-        message_text = update.message.text
+        message_text = run.text
+        writer: Optional[TelegramStreamWriter] = None
         
         logger.info(f"Mensagem recebida de {user.first_name} (ID: {user_id}): {message_text[:50]}...")
         
@@ -131,85 +196,113 @@ Estou aqui para ajudar! 🛡️
             # Obter agente do usuário
             agent = self.get_user_agent(user_id)
             
-            # Processar mensagem com o agente
-            response = agent.run(message_text)
-            
-            # Enviar resposta dividindo mensagens longas se necessário
-            await self._send_response(update, response.content)
+            # O mesmo usuário pode escrever no privado e em um grupo ao mesmo tempo:
+            # o agente dele (não thread-safe) atende um chat por vez
+            async with self.user_locks.setdefault(user_id, asyncio.Lock()):
+                if self.streaming:
+                    # Primeira mensagem imediata, atualizada conforme os tokens chegam
+                    writer = TelegramStreamWriter(
+                        context.bot,
+                        update.effective_chat.id,
+                        reply_to_message_id=update.message.message_id,
+                        started_at=received_at,
+                        sender=self.sender
+                    )
+                    await writer.start()
+                    with deadline_scope(deadline):
+                        await stream_run(self.executor.run, agent.run, message_text, writer.append, cancel=run.cancel)
+                    if not self.coalescer.deliverable(run):
+                        await writer.discard()
+                        return
+                    await writer.finish(render_html(writer.text))
+                else:
+                    # Processar mensagem com o agente (em thread, sem bloquear outros chats)
+                    with deadline_scope(deadline):
+                        response = await self.executor.run(agent.run, message_text)
+                    if not self.coalescer.deliverable(run):
+                        return  # Nova mensagem chegou: a próxima execução responde a tudo
+                
+                    # Enviar resposta dividindo mensagens longas se necessário
+                    self._send_response(update, response.content)
             
             logger.info(f"Resposta enviada para {user.first_name}")
             
+        except DeadlineExceeded as e:
+            self.coalescer.release(run)
+            if writer is not None:
+                await writer.discard()  # Sem meia resposta ao lado do aviso
+            if e.reason == "deadline":  # Substituída ou cancelada: nada a enviar
+                self._reply(update, "⏱️ A resposta demorou mais que o esperado. Tente uma pergunta mais específica.")
+            
+        except ModelProviderError as e:
+            # Novas tentativas e modelo alternativo já esgotados (core/resilience.py)
+            self.coalescer.release(run)
+            if writer is not None:
+                await writer.discard()
+            logger.error(f"Provedor de IA indisponível para {user.first_name}: {e}")
+            self._reply(update, "🔌 O serviço de IA está instável no momento. Tente novamente em alguns minutos.")
+            
         except Exception as e:
+            self.coalescer.release(run)
+            if writer is not None:
+                await writer.discard()
             logger.error(f"Erro ao processar mensagem de {user.first_name}: {e}")
-            await update.message.reply_text(
+            self._reply(
+                update,
                 "❌ Desculpe, ocorreu um erro. Tente novamente em alguns instantes.",
                 parse_mode='HTML'
             )
     
-    async def _send_response(self, update: Update, response_text: str):
-        """Envia resposta dividindo mensagens longas se necessário"""
-        max_length = 4000  # Limite do Telegram
-        
-        if len(response_text) <= max_length:
-            await update.message.reply_text(response_text, parse_mode='HTML')
-        else:
-            # Dividir mensagem longa
-            parts = self._split_message(response_text, max_length)
-            for i, part in enumerate(parts):
-                if i == 0:
-                    await update.message.reply_text(part, parse_mode='HTML')
-                else:
-                    await update.message.reply_text(f"<i>(continuação)</i>\n\n{part}", parse_mode='HTML')
+    def _reply(self, update: Update, text: str, **kwargs) -> asyncio.Future:
+        """Enfileira uma resposta no chat respeitando os limites do Telegram"""
+        return self.sender.submit(update.effective_chat.id, lambda: update.message.reply_text(text, **kwargs))
     
-    def _split_message(self, text: str, max_length: int):
-        """Divide mensagem longa em partes menores"""
-        if len(text) <= max_length:
-            return [text]
-        
-        parts = []
-        current_part = ""
-        
-        # Dividir por linhas para manter formatação
-        lines = text.split('\n')
-        
-        for line in lines:
-            if len(current_part) + len(line) + 1 <= max_length:
-                if current_part:
-                    current_part += '\n'
-                current_part += line
+    def _send_response(self, update: Update, response_text: str):
+        """Envia resposta dividindo mensagens longas se necessário"""
+        # As partes entram na fila de envio em ordem; o slot do LLM é liberado sem esperar a entrega
+        parts = split_html(render_html(response_text))
+        for i, part in enumerate(parts):
+            if i == 0:
+                self._reply(update, part, parse_mode='HTML')
             else:
-                if current_part:
-                    parts.append(current_part)
-                current_part = line
-        
-        if current_part:
-            parts.append(current_part)
-        
-        return parts
+                self._reply(update, f"<i>(continuação)</i>\n\n{part}", parse_mode='HTML')
     
     async def error_handler(self, update: object, context: ContextTypes.DEFAULT_TYPE):
         """Handler para erros globais"""
         logger.error(f"Exception while handling an update: {context.error}")
     
+    def build_application(self) -> Application:
+        """Cria a aplicação do Telegram com todos os handlers (polling ou webhook)"""
+        # Criar aplicação usando o padrão builder
+        application = (
+            Application.builder()
+            .token(self.telegram_token)
+            # Updates chegam todos ao agendador, que limita as execuções de LLM
+            .concurrent_updates(self.scheduler.max_queued + self.scheduler.max_in_flight)
+            .build()
+        )
+        
+        # Adicionar handlers
+        application.add_handler(CommandHandler("start", self.start_command))
+        application.add_handler(CommandHandler("help", self.help_command))
+        application.add_handler(CommandHandler("status", self.status_command))
+        application.add_handler(CommandHandler("cancelar", self.cancel_command))
+        
+        # Handler para mensagens de texto
+        application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_message))
+        
+        # Handler para erros
+        application.add_error_handler(self.error_handler)
+        
+        return application
+    
     def run_bot(self):
         """Executa o bot do Telegram"""
         print("🤖 INICIANDO SAFEBOT TELEGRAM")
         print("=" * 60)
         
         try:
-            # Criar aplicação usando o padrão builder
-            application = Application.builder().token(self.telegram_token).build()
-            
-            # Adicionar handlers
-            application.add_handler(CommandHandler("start", self.start_command))
-            application.add_handler(CommandHandler("help", self.help_command))
-            application.add_handler(CommandHandler("status", self.status_command))
-            
-            # Handler para mensagens de texto
-            application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_message))
-            
-            # Handler para erros
-            application.add_error_handler(self.error_handler)
+            application = self.build_application()
             
             print("✅ Bot configurado com sucesso!")
             print("📱 O bot está ativo e escutando mensagens...")
@@ -254,6 +347,11 @@ def main():
         print("O bot funcionará, mas sem a base de conhecimento completa.")
         input("Pressione Enter para continuar mesmo assim...")
     
+    # Manutenção periódica opcional (SAFEBOT_MAINTENANCE_INTERVAL_HOURS)
+    start_scheduler_from_env()
+    # /metrics em porta lateral (SAFEBOT_METRICS_PORT; 0 desativa)
+    start_metrics_server_from_env()
+    
     try:
         # Criar e executar bot
         bot = SafeBotTelegram(telegram_token)
@@ -0,0 +1,117 @@
+"""
+SafeBot Telegram - Agrupamento de mensagens em rajada
+Usuários costumam mandar uma pergunta em várias mensagens seguidas. Uma janela
+de debounce por chat junta a rajada em uma única execução; se chega mensagem
+nova antes de a resposta anterior ser enviada, a execução em andamento é
+substituída por uma com o texto completo: a anterior para na próxima chamada ao
+modelo ou ferramenta e não grava a pergunta nem a resposta no histórico.
+"""
+import os
+import time
+import asyncio
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, Hashable, List, Optional
+
+from core.deadline import Deadline, request_deadline_seconds
+from core.metrics import metrics
+
+metrics.describe("safebot_telegram_messages_total", "Mensagens de texto recebidas")
+metrics.describe("safebot_telegram_runs_total", "Execuções de agente/team disparadas pelas mensagens")
+metrics.describe("safebot_telegram_superseded_runs_total", "Execuções substituídas por mensagens posteriores")
+
+
+@dataclass
+class CoalescedRun:
+    """Uma execução com o texto de uma ou mais mensagens do chat"""
+
+    chat_id: Hashable
+    texts: List[str]
+    cancel: threading.Event = field(default_factory=threading.Event)
+    superseded: bool = False
+    deadline: Optional[Deadline] = None  # Prazo da execução (compartilha o evento cancel)
+
+    @property
+    def text(self) -> str:
+        return "\n".join(self.texts)
+
+    def start_deadline(self) -> Deadline:
+        """Prazo da execução no Telegram; substituir ou cancelar a execução encerra o prazo"""
+        self.deadline = Deadline(request_deadline_seconds("telegram"), source="telegram", cancelled=self.cancel)
+        return self.deadline
+
+    def supersede(self):
+        self.superseded = True
+        self.cancel.set()
+
+
+@dataclass
+class _Burst:
+    texts: List[str] = field(default_factory=list)
+    generation: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+
+
+class MessageCoalescer:
+    """Debounce por chat e substituição de execuções ainda não entregues"""
+
+    def __init__(self, window: Optional[float] = None, max_window: Optional[float] = None):
+        self.window = window if window is not None else float(os.getenv("SAFEBOT_TELEGRAM_DEBOUNCE_SECONDS", "1.5"))
+        self.max_window = max_window or float(os.getenv("SAFEBOT_TELEGRAM_DEBOUNCE_MAX_SECONDS", "6"))
+        self._bursts: Dict[Hashable, _Burst] = {}
+        self._in_flight: Dict[Hashable, CoalescedRun] = {}
+
+    async def collect(self, chat_id: Hashable, text: str) -> Optional[CoalescedRun]:
+        """Registra a mensagem; retorna a execução da rajada ou None se outra mensagem assumiu"""
+        metrics.inc("safebot_telegram_messages_total")
+        burst = self._bursts.setdefault(chat_id, _Burst())
+        burst.texts.append(text)
+        burst.generation += 1
+        generation = burst.generation
+
+        # Espera a janela, sem passar do limite contado desde a primeira mensagem
+        delay = min(self.window, burst.started_at + self.max_window - time.monotonic())
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if self._bursts.get(chat_id) is not burst or burst.generation != generation:
+            # Uma mensagem mais recente vai disparar a execução com o texto completo
+            return None
+        del self._bursts[chat_id]
+
+        texts = burst.texts
+        previous = self._in_flight.get(chat_id)
+        if previous is not None:
+            # Resposta anterior ainda não enviada: substitui pela versão com todas as mensagens
+            previous.supersede()
+            texts = previous.texts + texts
+            metrics.inc("safebot_telegram_superseded_runs_total")
+
+        run = CoalescedRun(chat_id=chat_id, texts=texts)
+        self._in_flight[chat_id] = run
+        metrics.inc("safebot_telegram_runs_total")
+        return run
+
+    def cancel(self, chat_id: Hashable) -> bool:
+        """Cancela a execução em andamento do chat (/cancelar); False se não havia nenhuma"""
+        self._bursts.pop(chat_id, None)
+        run = self._in_flight.pop(chat_id, None)
+        if run is None:
+            return False
+        run.superseded = True
+        if run.deadline is not None:
+            run.deadline.cancel("user")
+        else:
+            run.cancel.set()
+        return True
+
+    def deliverable(self, run: CoalescedRun) -> bool:
+        """Reserva o envio da resposta; False se a execução foi substituída"""
+        if run.superseded:
+            return False
+        self.release(run)
+        return True
+
+    def release(self, run: CoalescedRun):
+        """Remove a execução do controle (resposta enviada ou erro)"""
+        if self._in_flight.get(run.chat_id) is run:
+            del self._in_flight[run.chat_id]
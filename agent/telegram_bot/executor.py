@@ -0,0 +1,39 @@
+"""
+SafeBot Telegram - Execução de agentes fora do event loop
+As chamadas agent.run/team.run do agno são síncronas; rodá-las diretamente nos
+handlers async congela o python-telegram-bot para todos os usuários. Este módulo
+as executa em um thread pool limitado.
+"""
+import os
+import asyncio
+import functools
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from core.telemetry import watch_executor
+
+
+def default_concurrency() -> int:
+    """Número máximo de execuções de LLM simultâneas (SAFEBOT_TELEGRAM_CONCURRENCY)"""
+    return int(os.getenv("SAFEBOT_TELEGRAM_CONCURRENCY", "8"))
+
+
+class AgentExecutor:
+    """Thread pool limitado para executar agentes e teams a partir de handlers async"""
+
+    def __init__(self, max_workers: Optional[int] = None, name: str = "telegram"):
+        self.max_workers = max_workers or default_concurrency()
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="safebot-agent")
+        watch_executor(name, self._pool)  # Fila exportada em safebot_executor_queue_depth
+
+    async def run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Executa func(*args, **kwargs) no pool sem bloquear o event loop"""
+        loop = asyncio.get_running_loop()
+        # Preserva contextvars (ex.: contexto da requisição) dentro da thread
+        context = contextvars.copy_context()
+        call = functools.partial(context.run, func, *args, **kwargs)
+        return await loop.run_in_executor(self._pool, call)
+
+    def shutdown(self, wait: bool = False):
+        self._pool.shutdown(wait=wait)
@@ -0,0 +1,384 @@
+"""
+SafeBot Telegram - Renderização de respostas em HTML do Telegram
+Converte a resposta do agente/team (Markdown, HTML ou uma mistura dos dois) em
+HTML aceito pelo Telegram em uma única passada, com as tags sempre balanceadas,
+e divide textos longos em partes que fecham as tags abertas no fim de cada
+parte e as reabrem no início da seguinte.
+"""
+import re
+import time
+from html import escape, unescape
+from typing import Dict, List, NamedTuple, Optional
+
+# Limite do Telegram é 4096; a folga cobre o cabeçalho de continuação
+MAX_MESSAGE_LENGTH = 4000
+
+# Tags HTML aceitas pelo Telegram (com sinônimos normalizados)
+HTML_TAGS = {
+    "b": "b", "strong": "b",
+    "i": "i", "em": "i",
+    "u": "u", "ins": "u",
+    "s": "s", "strike": "s", "del": "s",
+    "code": "code", "pre": "pre", "a": "a",
+    "tg-spoiler": "tg-spoiler", "blockquote": "blockquote",
+    "h1": "b", "h2": "b", "h3": "b", "h4": "b", "h5": "b", "h6": "b",
+}
+# Tags de estrutura sem equivalente no Telegram: removidas mantendo o conteúdo
+DROPPED_TAGS = {"p", "div", "span", "ul", "ol", "li", "br", "hr"}
+
+# Marcadores Markdown de ênfase e a tag correspondente
+MARKERS = {"**": "b", "__": "b", "*": "i", "_": "i", "~~": "s", "`": "code"}
+
+# Esquemas aceitos em links (Markdown e <a href>); os demais viram texto
+LINK_SCHEMES = r"(?:https?|tg|mailto):"
+
+_TOKEN = re.compile(
+    r"(?P<fence>^[ \t]*```[ \t]*(?P<lang>[\w+#.-]*)[^\n]*(?:\n|$))"
+    r"|(?P<rule>^[ \t]*(?:[-*_][ \t]*){3,}$)"
+    r"|(?P<heading>^[ \t]*#{1,6}[ \t]+)"
+    r"|(?P<bullet>^[ \t]*[-*+][ \t]+)"
+    r"|(?P<tag><(?P<closing>/)?(?P<name>[a-zA-Z][\w-]*)(?P<attrs>[^<>]*)>)"
+    r"|(?P<entity>&(?:#\d+|#[xX][0-9a-fA-F]+|[a-zA-Z][a-zA-Z0-9]*);)"
+    r"|(?P<link>\[(?P<label>[^\[\]\n]+)\]\((?P<url>" + LINK_SCHEMES + r"[^\s()]+)\))"
+    r"|(?P<marker>\*\*|__|~~|\*|_|`)"
+    r"|(?P<newline>\n)"
+    r"|(?P<special>[<>&])",
+    re.MULTILINE,
+)
+_HREF = re.compile(r"""href\s*=\s*["']([^"']*)["']""", re.IGNORECASE)
+_SAFE_URL = re.compile(LINK_SCHEMES, re.IGNORECASE)
+_SPOILER = re.compile(r"""class\s*=\s*["']tg-spoiler["']""", re.IGNORECASE)
+_LANGUAGE = re.compile(r"""class\s*=\s*["']language-([\w+#.-]+)["']""", re.IGNORECASE)
+_HTML_TOKEN = re.compile(r"<(/?)([a-zA-Z][\w-]*)[^>]*>|&[^;\s<&]*;|[^<&]+|[<&]")
+
+
+class _Open(NamedTuple):
+    key: str         # marcador de origem ("**", "#", "<b>", "```"...)
+    name: str        # tag do Telegram
+    open_html: str
+    close_html: str  # vazio quando a mesma tag já está aberta (Telegram não aninha iguais)
+
+
+class _Renderer:
+    """Estado de uma renderização: saída e pilha de tags abertas"""
+
+    def __init__(self, text: str):
+        self.text = text
+        self.out: List[str] = []
+        self.stack: List[_Open] = []
+
+    def _is_open(self, name: str) -> bool:
+        return any(entry.name == name and entry.close_html for entry in self.stack)
+
+    def _in_code(self) -> bool:
+        return any(entry.name in ("code", "pre") for entry in self.stack)
+
+    def _find(self, key: str) -> int:
+        for index in range(len(self.stack) - 1, -1, -1):
+            if self.stack[index].key == key:
+                return index
+        return -1
+
+    def open(self, key: str, name: str, open_html: Optional[str] = None, close_html: Optional[str] = None):
+        if self._is_open(name):
+            self.stack.append(_Open(key, name, "", ""))
+            return
+        entry = _Open(key, name, open_html or f"<{name}>", close_html or f"</{name}>")
+        self.stack.append(entry)
+        self.out.append(entry.open_html)
+
+    def close_at(self, index: int, reopen: bool = True):
+        """Fecha a entrada index; as abertas depois dela são fechadas e reabertas"""
+        above = self.stack[index + 1:]
+        for entry in reversed(above):
+            self.out.append(entry.close_html)
+        target = self.stack[index]
+        self.out.append(target.close_html)
+        del self.stack[index:]
+        if not reopen:
+            return
+        for entry in above:
+            self.open(entry.key, entry.name, entry.open_html or None, entry.close_html or None)
+
+    def _starts_pre(self) -> bool:
+        """True se nada além de espaços foi escrito desde o <pre> do topo (que é descartado)"""
+        if not self.stack or self.stack[-1].key != "<pre>" or not self.stack[-1].open_html:
+            return False
+        tail = len(self.out)
+        while tail and not self.out[tail - 1].strip():
+            tail -= 1
+        if tail and self.out[tail - 1] == self.stack[-1].open_html:
+            del self.out[tail:]
+            return True
+        return False
+
+    def close_where(self, predicate):
+        while True:
+            indexes = [i for i, entry in enumerate(self.stack) if predicate(entry)]
+            if not indexes:
+                return
+            self.close_at(indexes[-1])
+
+    def close_all(self):
+        while self.stack:
+            self.out.append(self.stack.pop().close_html)
+
+    def render(self) -> str:
+        text = self.text
+        out = self.out
+        position = 0
+        for match in _TOKEN.finditer(text):
+            start = match.start()
+            if start > position:
+                out.append(text[position:start])
+            position = match.end()
+            kind = match.lastgroup  # grupo externo da alternativa que casou
+            token = match.group(0)
+
+            if kind == "fence":
+                fence = self._find("```")
+                if fence >= 0:
+                    self.close_at(fence)
+                    out.append("\n")
+                elif self._in_code():
+                    out.append(escape(token, quote=False))
+                else:
+                    lang = match.group("lang")
+                    code = f'<code class="language-{escape(lang)}">' if lang else "<code>"
+                    self.open("```", "pre", f"<pre>{code}", "</code></pre>")
+            elif self._find("```") >= 0:
+                # Dentro de bloco de código tudo é literal
+                out.append(escape(token, quote=False))
+            elif kind == "tag":
+                self._tag(match)
+            elif kind == "entity":
+                out.append(escape(unescape(token), quote=False))
+            elif self._in_code() and kind != "marker":
+                out.append(escape(token, quote=False))
+            elif kind == "marker":
+                self._marker(token, start, position)
+            elif kind == "newline":
+                self._newline(start)
+            elif kind == "heading":
+                self.open("#", "b")
+            elif kind == "bullet":
+                out.append(token[:len(token) - len(token.lstrip())] + "• ")
+            elif kind == "rule":
+                out.append("——————")
+            elif kind == "link":
+                url = escape(match.group("url"))
+                self.open("<a>", "a", f'<a href="{url}">', "</a>")
+                out.append(escape(match.group("label"), quote=False))
+                self.close_at(self._find("<a>"))
+            else:
+                out.append(escape(token, quote=False))
+
+        out.append(text[position:])
+        self.close_all()
+        return "".join(out)
+
+    def _tag(self, match: re.Match):
+        raw = match.group("name").lower()
+        closing = match.group("closing") is not None
+        name = HTML_TAGS.get(raw)
+
+        if raw == "span" and (self._find("<span>") >= 0 if closing else _SPOILER.search(match.group("attrs"))):
+            name = "tg-spoiler"
+        if self._in_code():
+            if raw == "code" and not closing and self._starts_pre():
+                # Bloco com linguagem: <pre><code class="language-python">
+                language = _LANGUAGE.search(match.group("attrs"))
+                code = f'<code class="language-{escape(language.group(1))}">' if language else "<code>"
+                self.open("<code>", "code", code, "</code>")
+                return
+            # Dentro de código só o fechamento da própria tag tem efeito
+            index = self._find(f"<{raw}>")
+            if closing and index >= 0:
+                self.close_at(index, reopen=raw != "pre")
+            else:
+                self.out.append(escape(match.group(0), quote=False))
+            return
+        if name is None:
+            if raw in DROPPED_TAGS:
+                if raw == "br" or (raw in ("p", "div") and closing):
+                    self.out.append("\n")
+                elif raw == "li" and not closing:
+                    self.out.append("• ")
+                return
+            self.out.append(escape(match.group(0), quote=False))
+            return
+
+        key = f"<{raw}>"
+        if closing:
+            index = self._find(key)
+            if index >= 0:
+                self.close_at(index)
+            return  # Fechamento sem abertura: descartado
+        if name == "a":
+            href = _HREF.search(match.group("attrs"))
+            url = unescape(href.group(1)).strip() if href else ""
+            if not _SAFE_URL.match(url):
+                return  # Sem href ou esquema não permitido (javascript:, data:...): só o texto
+            self.open(key, "a", f'<a href="{escape(url)}">', "</a>")
+        elif name == "pre":
+            self.open(key, "pre")
+        else:
+            self.open(key, name)
+
+    def _marker(self, token: str, start: int, end: int):
+        text = self.text
+        before = text[start - 1] if start > 0 else " "
+        after = text[end] if end < len(text) else " "
+        index = self._find(token)
+
+        if self._in_code():
+            # Em código inline só a crase de fechamento tem efeito
+            if token == "`" and index >= 0:
+                self.close_at(index)
+            else:
+                self.out.append(escape(token, quote=False))
+            return
+        if index >= 0 and not before.isspace():
+            self.close_at(index)
+        elif token in ("_", "__") and before.isalnum() and after.isalnum():
+            self.out.append(token)  # snake_case: não é ênfase
+        elif not after.isspace():
+            self.open(token, MARKERS[token])
+        else:
+            self.out.append(token)
+
+    def _newline(self, start: int):
+        # Título vale até o fim da linha; ênfase Markdown até o fim do parágrafo
+        self.close_where(lambda entry: entry.key == "#")
+        if start > 0 and self.text[start - 1] == "\n":
+            self.close_where(lambda entry: entry.key in MARKERS)
+        self.out.append("\n")
+
+
+def render_html(text: str) -> str:
+    """Converte Markdown/HTML da resposta em HTML válido do Telegram (tags balanceadas)"""
+    if not text:
+        return ""
+    return _Renderer(text).render()
+
+
+def split_html(text: str, max_length: int = MAX_MESSAGE_LENGTH) -> List[str]:
+    """
+    Divide HTML válido em partes de até max_length caracteres
+
+    Corta preferindo quebras de linha e espaços, nunca dentro de tags ou
+    entidades; tags abertas são fechadas no fim da parte e reabertas na próxima.
+    """
+    if len(text) <= max_length:
+        return [text]
+
+    parts: List[str] = []
+    stack: List[tuple] = []  # (nome, tag de abertura)
+    current: List[str] = []
+    size = 0
+    closing = 0  # tamanho das tags de fechamento pendentes
+    has_content = False
+
+    def flush():
+        nonlocal current, size, has_content
+        if has_content:
+            # Parte só com espaços seria recusada pelo Telegram: descartada
+            closers = "".join(f"</{name}>" for name, _ in reversed(stack))
+            parts.append("".join(current).rstrip("\n") + closers)
+        current = [opener for _, opener in stack]
+        size = sum(len(opener) for opener in current)
+        has_content = False
+
+    for match in _HTML_TOKEN.finditer(text):
+        token = match.group(0)
+        name = match.group(2)
+
+        if name is not None:
+            name = name.lower()
+            if match.group(1):
+                if stack and stack[-1][0] == name:
+                    stack.pop()
+                    closing -= len(token)
+                current.append(token)
+                size += len(token)
+                continue
+            closer = len(name) + 3
+            if has_content and size + len(token) + closer + closing > max_length:
+                flush()
+            stack.append((name, token))
+            current.append(token)
+            size += len(token)
+            closing += closer
+            continue
+
+        if token[0] == "&" or len(token) == 1:
+            # Entidade ou caractere isolado: indivisível
+            if has_content and size + len(token) + closing > max_length:
+                flush()
+            current.append(token)
+            size += len(token)
+            has_content = has_content or not token.isspace()
+            continue
+
+        while token:
+            room = max_length - size - closing
+            if len(token) <= room:
+                current.append(token)
+                size += len(token)
+                has_content = has_content or not token.isspace()
+                break
+            cut = token.rfind("\n", 0, room + 1)
+            if cut <= 0:
+                cut = token.rfind(" ", 0, room + 1)
+            if cut <= 0:
+                if has_content:
+                    flush()
+                    continue
+                cut = max(room, 1)
+            current.append(token[:cut])
+            has_content = has_content or not token[:cut].isspace()
+            flush()
+            token = token[cut:].lstrip("\n")
+
+    flush()
+    return parts
+
+
+def benchmark(size_kb: int = 100, rounds: int = 20) -> Dict[str, float]:
+    """Mede renderização e divisão em uma resposta sintética de size_kb KB"""
+    paragraph = (
+        "## Seleção de **EPI** para _soldagem_ (NR-06)\n"
+        "- Máscara de solda com <b>filtro de luz</b> tonalidade 10 a 13 e `CA` válido.\n"
+        "- Luvas de raspa e avental de couro (consulte o [CA](https://caepi.mte.gov.br/?ca=12345&tipo=1)).\n"
+        "Ruído acima de 85 dB(A) exige protetor auricular: NPS < 85 & atenuação > 15 ~~opcional~~ obrigatório.\n\n"
+        "```text\nEPI: luva de vaqueta | CA 12345 | validade 12/2026 <conforme>\n```\n\n"
+    )
+    text = (paragraph * (size_kb * 1024 // len(paragraph) + 1))[: size_kb * 1024]
+
+    started = time.perf_counter()
+    for _ in range(rounds):
+        rendered = render_html(text)
+    render_seconds = (time.perf_counter() - started) / rounds
+
+    started = time.perf_counter()
+    for _ in range(rounds):
+        parts = split_html(rendered)
+    split_seconds = (time.perf_counter() - started) / rounds
+
+    return {
+        "input_kb": size_kb,
+        "parts": len(parts),
+        "render_ms": round(render_seconds * 1000, 2),
+        "split_ms": round(split_seconds * 1000, 2),
+        "mb_per_second": round(len(text) / (render_seconds + split_seconds) / 1e6, 2),
+    }
+
+
+if __name__ == "__main__":
+    for size in (10, 100, 1000):
+        result = benchmark(size, rounds=5 if size > 100 else 20)
+        print(
+            f"📏 {result['input_kb']} KB -> {result['parts']} partes | "
+            f"render {result['render_ms']} ms | split {result['split_ms']} ms | "
+            f"{result['mb_per_second']} MB/s"
+        )
@@ -0,0 +1,234 @@
+"""
+SafeBot Telegram - Agendador de mensagens por chat
+Uma fila FIFO por chat garante que as mensagens de um mesmo chat sejam
+respondidas em ordem, enquanto chats diferentes rodam em paralelo até um limite
+global de execuções de LLM. Planos/tenants recebem fatias ponderadas da
+capacidade e, acima de um limiar de fila, o usuário é avisado da sua posição.
+"""
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, Optional, Set
+
+from core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Cache de SAFEBOT_CHAT_PLANS (chat_id -> plano)
+_chat_plans: Optional[Dict[str, str]] = None
+
+metrics.describe("safebot_scheduler_queued", "Mensagens aguardando execução")
+metrics.describe("safebot_scheduler_in_flight", "Execuções de LLM em andamento")
+metrics.describe("safebot_scheduler_wait_seconds", "Tempo de espera na fila do chat")
+metrics.describe("safebot_scheduler_rejected_total", "Mensagens recusadas por fila cheia")
+
+
+class QueueFullError(Exception):
+    """Fila global atingiu o limite; a mensagem não foi aceita"""
+
+
+def parse_weights(value: str) -> Dict[str, float]:
+    """Converte 'free:1,pro:3' em {'free': 1.0, 'pro': 3.0} (pesos devem ser positivos)"""
+    weights = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        name, _, weight = item.partition(":")
+        weights[name.strip()] = float(weight or 1)
+    return check_weights(weights)
+
+
+def check_weights(weights: Dict[str, float]) -> Dict[str, float]:
+    """Peso zero ou negativo quebraria o tempo virtual (divisão por zero no despacho)"""
+    invalid = {name: weight for name, weight in weights.items() if not weight > 0}
+    if invalid:
+        raise ValueError(f"Pesos de plano devem ser positivos: {invalid}")
+    return weights
+
+
+@dataclass
+class _Job:
+    chat_id: Hashable
+    tenant: str
+    run: Callable[[], Awaitable[Any]]
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class ChatScheduler:
+    """FIFO por chat + limite global de execuções + fair share ponderado por tenant"""
+
+    def __init__(
+        self,
+        max_in_flight: Optional[int] = None,
+        notice_threshold: Optional[int] = None,
+        max_queued: Optional[int] = None,
+        weights: Optional[Dict[str, float]] = None,
+        tenant_resolver: Optional[Callable[[Hashable], str]] = None,
+    ):
+        self.max_in_flight = max_in_flight or int(os.getenv("SAFEBOT_TELEGRAM_CONCURRENCY", "8"))
+        self.notice_threshold = (
+            notice_threshold
+            if notice_threshold is not None
+            else int(os.getenv("SAFEBOT_QUEUE_NOTICE_THRESHOLD", "3"))
+        )
+        self.max_queued = max_queued or int(os.getenv("SAFEBOT_QUEUE_MAX", "500"))
+        self.weights = check_weights(weights) if weights is not None else parse_weights(os.getenv("SAFEBOT_PLAN_WEIGHTS", "default:1"))
+        self.tenant_resolver = tenant_resolver or plan_from_env
+
+        self._chats: Dict[Hashable, Deque[_Job]] = {}
+        self._busy: Set[Hashable] = set()
+        self._ready: Dict[str, Deque[Hashable]] = {}
+        # Tempo virtual por tenant: serviço recebido dividido pelo peso
+        self._virtual_time: Dict[str, float] = {}
+        self._queued = 0
+        self._in_flight = 0
+
+    @property
+    def queued(self) -> int:
+        return self._queued
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": self._queued,
+            "in_flight": self._in_flight,
+            "chats": len(self._chats),
+            "max_in_flight": self.max_in_flight,
+            "max_queued": self.max_queued,
+        }
+
+    async def submit(
+        self,
+        chat_id: Hashable,
+        run: Callable[[], Awaitable[Any]],
+        notify: Optional[Callable[[int], Awaitable[Any]]] = None,
+    ) -> Any:
+        """Enfileira run() na fila do chat e aguarda o resultado"""
+        if self._queued >= self.max_queued:
+            metrics.inc("safebot_scheduler_rejected_total")
+            raise QueueFullError(f"Fila cheia ({self._queued} mensagens)")
+
+        tenant = self.tenant_resolver(chat_id)
+        job = _Job(chat_id=chat_id, tenant=tenant, run=run, future=asyncio.get_running_loop().create_future())
+
+        chat_queue = self._chats.setdefault(chat_id, deque())
+        chat_queue.append(job)
+        self._queued += 1
+        if chat_id not in self._busy and len(chat_queue) == 1:
+            self._mark_ready(chat_id, tenant)
+        self._update_gauges()
+
+        self._dispatch()
+        position = self.position(job) if any(queued is job for queued in chat_queue) else 0
+
+        if notify is not None and not job.future.done() and position > self.notice_threshold:
+            try:
+                await notify(position)
+            except Exception as e:
+                logger.warning(f"Falha ao avisar posição na fila do chat {chat_id}: {e}")
+
+        return await job.future
+
+    def position(self, job: _Job) -> int:
+        """
+        Posição da mensagem na fila do seu tenant (1 = a próxima a executar)
+
+        Chats do tenant se revezam: cada um executa uma mensagem por rodada, na
+        ordem dos prontos e depois dos que estão executando agora. Uma mensagem
+        que é a k-ésima do seu chat espera k mensagens do próprio chat e até k
+        (ou k+1, para chats à frente na rodada) de cada outro chat do tenant.
+        """
+        order = list(self._ready.get(job.tenant, ()))
+        order += [c for c in self._busy if c not in order and self._chats.get(c) and self._chats[c][0].tenant == job.tenant]
+        index = next(i for i, queued in enumerate(self._chats[job.chat_id]) if queued is job)
+        own_rank = order.index(job.chat_id) if job.chat_id in order else len(order)
+
+        ahead = index
+        for rank, chat_id in enumerate(order):
+            if chat_id != job.chat_id:
+                ahead += min(len(self._chats[chat_id]), index + (1 if rank < own_rank else 0))
+        return ahead + 1
+
+    def _mark_ready(self, chat_id: Hashable, tenant: str):
+        ready = self._ready.setdefault(tenant, deque())
+        if not ready:
+            # Tenant que volta a ter trabalho não acumula crédito do período ocioso
+            active = [self._virtual_time[t] for t, q in self._ready.items() if q and t in self._virtual_time]
+            self._virtual_time[tenant] = max(self._virtual_time.get(tenant, 0.0), min(active, default=0.0))
+        ready.append(chat_id)
+
+    def _next_tenant(self) -> Optional[str]:
+        """Tenant com menor tempo virtual entre os que têm chats prontos"""
+        candidates = [tenant for tenant, ready in self._ready.items() if ready]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda t: self._virtual_time.get(t, 0.0))
+
+    def _dispatch(self):
+        while self._in_flight < self.max_in_flight:
+            tenant = self._next_tenant()
+            if tenant is None:
+                return
+            chat_id = self._ready[tenant].popleft()
+            job = self._chats[chat_id].popleft()
+
+            self._busy.add(chat_id)
+            self._queued -= 1
+            self._in_flight += 1
+            self._virtual_time[tenant] = self._virtual_time.get(tenant, 0.0) + 1.0 / self.weights.get(tenant, 1.0)
+            metrics.observe("safebot_scheduler_wait_seconds", time.monotonic() - job.enqueued_at, tenant=tenant)
+            self._update_gauges()
+
+            asyncio.get_running_loop().create_task(self._run(job))
+
+    async def _run(self, job: _Job):
+        try:
+            result = await job.run()
+            if not job.future.done():
+                job.future.set_result(result)
+        except BaseException as e:
+            if not job.future.done():
+                job.future.set_exception(e)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+        finally:
+            self._in_flight -= 1
+            self._busy.discard(job.chat_id)
+            chat_queue = self._chats.get(job.chat_id)
+            if chat_queue:
+                self._mark_ready(job.chat_id, chat_queue[0].tenant)
+            elif chat_queue is not None:
+                del self._chats[job.chat_id]
+            self._update_gauges()
+            self._dispatch()
+
+    def _update_gauges(self):
+        metrics.set_gauge("safebot_scheduler_queued", self._queued)
+        metrics.set_gauge("safebot_scheduler_in_flight", self._in_flight)
+
+
+def queue_notice(position: int) -> str:
+    """Texto HTML do aviso de posição na fila (do plano do chat, ver ChatScheduler.position)"""
+    return f"⏳ <i>fila: posição {position}</i>"
+
+
+def plan_from_env(chat_id: Hashable) -> str:
+    """Plano do chat via SAFEBOT_CHAT_PLANS='123:pro,456:enterprise' (padrão: default)"""
+    global _chat_plans
+    if _chat_plans is None:
+        _chat_plans = {str(k): v for k, v in parse_plans(os.getenv("SAFEBOT_CHAT_PLANS", "")).items()}
+    return _chat_plans.get(str(chat_id), "default")
+
+
+def parse_plans(value: str) -> Dict[str, str]:
+    plans = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        chat_id, _, plan = item.partition(":")
+        plans[chat_id.strip()] = plan.strip() or "default"
+    return plans
+
@@ -0,0 +1,194 @@
+"""
+SafeBot Telegram - Envio com controle de taxa
+Todas as mensagens de saída passam por uma fila por chat que respeita os
+limites do Telegram (por chat e global). Em caso de 429 (RetryAfter) ou falha
+de rede a mesma mensagem é reenviada: a resposta do LLM nunca é descartada
+nem gerada novamente.
+"""
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, Optional, Tuple
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+from core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+metrics.describe("safebot_telegram_send_total", "Mensagens de saída por resultado (delivered/failed)")
+metrics.describe("safebot_telegram_send_seconds", "Tempo da fila até a entrega da mensagem")
+metrics.describe("safebot_telegram_send_retries_total", "Reenvios por motivo (retry_after/network)")
+
+# Buckets de latência de envio (inclui espera por orçamento e RetryAfter)
+SEND_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0)
+
+SendCall = Callable[[], Awaitable[Any]]
+
+
+def retry_after_seconds(error: RetryAfter) -> float:
+    """Segundos de espera de um RetryAfter (int ou timedelta, conforme a versão)"""
+    value = error.retry_after
+    return value.total_seconds() if hasattr(value, "total_seconds") else float(value)
+
+
+class TokenBucket:
+    """Token bucket simples para uso no event loop"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+
+    def reserve(self) -> float:
+        """Consome um token e retorna quantos segundos esperar antes de usá-lo"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        self.tokens -= 1
+        wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        return max(wait, self.paused_until - now)
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def idle(self) -> bool:
+        """True se o bucket já recarregou por completo (estado descartável)"""
+        now = time.monotonic()
+        refilled = self.tokens + (now - self.updated_at) * self.rate
+        return refilled >= self.capacity and now >= self.paused_until
+
+
+@dataclass
+class _Delivery:
+    call: SendCall
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class OutboundSender:
+    """Fila de saída por chat com orçamento por chat e global e reenvio automático"""
+
+    def __init__(
+        self,
+        global_rate: Optional[float] = None,
+        chat_rate: Optional[float] = None,
+        group_rate: Optional[float] = None,
+        max_retries: Optional[int] = None,
+    ):
+        # Limites documentados do Telegram: ~30 msg/s no total, ~1 msg/s por chat, 20 msg/min por grupo
+        self.global_rate = global_rate or float(os.getenv("SAFEBOT_TELEGRAM_GLOBAL_RATE", "25"))
+        self.chat_rate = chat_rate or float(os.getenv("SAFEBOT_TELEGRAM_CHAT_RATE", "1"))
+        self.group_rate = group_rate or float(os.getenv("SAFEBOT_TELEGRAM_GROUP_RATE", "0.33"))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("SAFEBOT_TELEGRAM_SEND_RETRIES", "5"))
+
+        self._global = TokenBucket(self.global_rate, self.global_rate)
+        self._chats: Dict[Hashable, Tuple[TokenBucket, Deque[_Delivery]]] = {}
+        self._draining: set = set()
+
+    def _chat(self, chat_id: Hashable) -> Tuple[TokenBucket, Deque[_Delivery]]:
+        if chat_id not in self._chats:
+            # chat_id negativo = grupo/canal, com limite bem menor
+            rate = self.group_rate if isinstance(chat_id, int) and chat_id < 0 else self.chat_rate
+            self._chats[chat_id] = (TokenBucket(rate, 3), deque())
+        return self._chats[chat_id]
+
+    async def send(self, chat_id: Hashable, call: SendCall) -> Any:
+        """Enfileira call() na fila do chat e aguarda a entrega"""
+        return await self._enqueue(chat_id, call)
+
+    def submit(self, chat_id: Hashable, call: SendCall) -> asyncio.Future:
+        """Enfileira call() sem aguardar; a ordem por chat é preservada"""
+        future = self._enqueue(chat_id, call)
+        future.add_done_callback(_log_failure)
+        return future
+
+    def _enqueue(self, chat_id: Hashable, call: SendCall) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        if len(self._chats) > 1000:
+            self._prune()
+        future = loop.create_future()
+        self._chat(chat_id)[1].append(_Delivery(call=call, future=future))
+        if chat_id not in self._draining:
+            self._draining.add(chat_id)
+            loop.create_task(self._drain(chat_id))
+        return future
+
+    def _prune(self):
+        """Remove chats ociosos com bucket já recarregado"""
+        for chat_id, (bucket, queue) in list(self._chats.items()):
+            if not queue and chat_id not in self._draining and bucket.idle():
+                del self._chats[chat_id]
+
+    async def _drain(self, chat_id: Hashable):
+        bucket, queue = self._chat(chat_id)
+        try:
+            while queue:
+                delivery = queue.popleft()
+                try:
+                    result = await self._deliver(chat_id, bucket, delivery)
+                    delivery.future.set_result(result)
+                except Exception as e:
+                    delivery.future.set_exception(e)
+        finally:
+            self._draining.discard(chat_id)
+
+    async def _deliver(self, chat_id: Hashable, bucket: TokenBucket, delivery: _Delivery) -> Any:
+        attempt = 0
+        while True:
+            wait = max(bucket.reserve(), self._global.reserve())
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                result = await delivery.call()
+                metrics.inc("safebot_telegram_send_total", status="delivered")
+                metrics.observe("safebot_telegram_send_seconds", time.monotonic() - delivery.enqueued_at, buckets=SEND_BUCKETS)
+                return result
+            except RetryAfter as e:
+                # Flood control: pausa o chat e tenta a mesma mensagem de novo
+                seconds = retry_after_seconds(e)
+                bucket.pause(seconds)
+                metrics.inc("safebot_telegram_send_retries_total", reason="retry_after")
+                logger.warning(f"RetryAfter de {seconds:.0f}s no chat {chat_id}")
+            except BadRequest as e:
+                if "not modified" in str(e).lower():
+                    # Edição idêntica à atual: nada a entregar
+                    metrics.inc("safebot_telegram_send_total", status="delivered")
+                    return None
+                # HTML inválido, mensagem inexistente etc.: não adianta reenviar
+                metrics.inc("safebot_telegram_send_total", status="failed")
+                raise
+            except Forbidden:
+                # Bot bloqueado pelo usuário: não adianta reenviar
+                metrics.inc("safebot_telegram_send_total", status="failed")
+                raise
+            except NetworkError as e:
+                metrics.inc("safebot_telegram_send_retries_total", reason="network")
+                logger.warning(f"Falha de rede ao enviar para o chat {chat_id}: {e}")
+                bucket.pause(min(2 ** attempt, 30))
+
+            attempt += 1
+            if attempt > self.max_retries:
+                metrics.inc("safebot_telegram_send_total", status="failed")
+                raise RuntimeError(f"Mensagem para o chat {chat_id} não entregue após {attempt} tentativas")
+
+    def stats(self) -> Dict[str, Any]:
+        delivered = metrics.get_counter("safebot_telegram_send_total", status="delivered")
+        failed = metrics.get_counter("safebot_telegram_send_total", status="failed")
+        total = delivered + failed
+        return {
+            "delivered": int(delivered),
+            "failed": int(failed),
+            "success_rate": round(delivered / total, 4) if total else None,
+            "pending": sum(len(queue) for _, queue in self._chats.values()),
+        }
+
+
+def _log_failure(future: asyncio.Future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.error(f"Mensagem não entregue: {future.exception()}")
@@ -0,0 +1,237 @@
+"""
+SafeBot Telegram - Respostas em streaming
+Consome o stream de tokens do agente/team e publica o texto progressivamente:
+uma primeira mensagem sai imediatamente e é atualizada com edit_message_text em
+intervalos controlados (limite de edições do Telegram). Ao passar de 4000
+caracteres o texto continua em uma nova mensagem.
+"""
+import os
+import time
+import asyncio
+import logging
+import threading
+from typing import Any, Awaitable, Callable, List, Optional
+
+from telegram import Bot, Message
+from telegram.error import BadRequest, RetryAfter, TelegramError
+
+from core.deadline import check_deadline
+from core.metrics import metrics
+from telegram_bot.formatting import split_html
+from telegram_bot.sender import OutboundSender, retry_after_seconds
+
+logger = logging.getLogger(__name__)
+
+metrics.describe("safebot_telegram_first_text_seconds", "Tempo até o primeiro texto visível para o usuário")
+metrics.describe("safebot_telegram_stream_edits_total", "Edições de mensagem feitas durante o streaming")
+
+# Eventos de conteúdo (delta) do agno para agentes e teams
+AGENT_CONTENT_EVENT = "RunResponseContent"
+TEAM_CONTENT_EVENT = "TeamRunResponseContent"
+
+_DONE = object()
+
+
+def streaming_enabled() -> bool:
+    """Streaming ligado por padrão; SAFEBOT_TELEGRAM_STREAMING=false desativa"""
+    return os.getenv("SAFEBOT_TELEGRAM_STREAMING", "true").lower() == "true"
+
+
+def split_text(text: str, max_length: int) -> List[str]:
+    """Divide texto em partes de até max_length, preferindo quebras de linha"""
+    parts = []
+    while len(text) > max_length:
+        cut = text.rfind("\n", 0, max_length)
+        if cut <= 0:
+            cut = text.rfind(" ", 0, max_length)
+        if cut <= 0:
+            cut = max_length
+        parts.append(text[:cut])
+        text = text[cut:].lstrip("\n")
+    if text or not parts:
+        parts.append(text)
+    return parts
+
+
+class TelegramStreamWriter:
+    """Publica um texto crescente em uma ou mais mensagens do Telegram"""
+
+    def __init__(
+        self,
+        bot: Bot,
+        chat_id: int,
+        reply_to_message_id: Optional[int] = None,
+        edit_interval: Optional[float] = None,
+        max_length: int = 4000,
+        placeholder: str = "✍️ ...",
+        started_at: Optional[float] = None,
+        sender: Optional[OutboundSender] = None,
+    ):
+        self.bot = bot
+        self.sender = sender
+        self.chat_id = chat_id
+        self.reply_to_message_id = reply_to_message_id
+        self.edit_interval = edit_interval or float(os.getenv("SAFEBOT_STREAM_EDIT_INTERVAL", "1.2"))
+        self.max_length = max_length
+        self.placeholder = placeholder
+        self.started_at = started_at or time.monotonic()
+
+        self.messages: List[Message] = []
+        self._sent: List[str] = []  # Texto atualmente visível em cada mensagem
+        self._text = ""  # Texto completo recebido até agora
+        self._next_edit_at = 0.0
+        self.first_text_seconds: Optional[float] = None
+
+    @property
+    def text(self) -> str:
+        return self._text
+
+    async def start(self, message: Optional[Message] = None):
+        """Publica (ou reaproveita) a primeira mensagem imediatamente"""
+        if message is None:
+            message = await self._call(
+                self.bot.send_message,
+                chat_id=self.chat_id,
+                text=self.placeholder,
+                reply_to_message_id=self.reply_to_message_id,
+            )
+        self.messages = [message]
+        self._sent = [message.text or ""]
+
+    async def append(self, chunk: str):
+        """Acrescenta um delta e atualiza as mensagens respeitando o intervalo"""
+        self._text += chunk
+        # O primeiro texto sai sem esperar o intervalo: é o que o usuário percebe
+        if self.first_text_seconds is None and self._text.strip():
+            await self.flush(force=True)
+        elif time.monotonic() >= self._next_edit_at:
+            await self.flush()
+
+    async def flush(self, force: bool = False):
+        """Sincroniza as mensagens com o texto recebido (texto puro, sem parse)"""
+        if not force and time.monotonic() < self._next_edit_at:
+            return
+        await self._render(split_text(self._text, self.max_length), parse_mode=None)
+
+    async def finish(self, final_text: Optional[str] = None, split: Optional[Callable[[str, int], List[str]]] = None):
+        """Render final em HTML (com fallback para texto puro); final_text já deve ser HTML válido"""
+        text = final_text if final_text is not None else self._text
+        parts = (split or split_html)(text, self.max_length)
+        # A última edição não pode ser descartada pelo controle de intervalo
+        delay = self._next_edit_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        try:
+            await self._render(parts, parse_mode="HTML")
+        except BadRequest as e:
+            logger.warning(f"HTML inválido na resposta, enviando texto puro: {e}")
+            parts = split_text(text, self.max_length)
+            await self._render(parts, parse_mode=None)
+
+        # O render final pode ocupar menos mensagens que o streaming
+        while len(self.messages) > max(len(parts), 1):
+            message = self.messages.pop()
+            self._sent.pop()
+            try:
+                await self._call(message.delete)
+            except BadRequest as e:
+                logger.warning(f"Falha ao remover mensagem excedente: {e}")
+
+    async def discard(self):
+        """Remove as mensagens publicadas (resposta substituída por outra ou execução com erro)"""
+        while self.messages:
+            message = self.messages.pop()
+            self._sent.pop()
+            try:
+                await self._call(message.delete)
+            except TelegramError as e:
+                logger.warning(f"Falha ao remover mensagem: {e}")
+
+    async def _render(self, parts: List[str], parse_mode: Optional[str]):
+        for index, part in enumerate(parts):
+            if not part.strip():
+                continue
+            if index < len(self.messages):
+                if self._sent[index] != part or parse_mode:
+                    await self._edit(index, part, parse_mode)
+            else:
+                # Rollover: o texto passou do limite e continua em nova mensagem
+                message = await self._call(
+                    self.bot.send_message, chat_id=self.chat_id, text=part, parse_mode=parse_mode
+                )
+                self.messages.append(message)
+                self._sent.append(part)
+        if self.first_text_seconds is None and parts and parts[0].strip():
+            self.first_text_seconds = time.monotonic() - self.started_at
+            metrics.observe("safebot_telegram_first_text_seconds", self.first_text_seconds)
+
+    async def _edit(self, index: int, text: str, parse_mode: Optional[str]):
+        message = self.messages[index]
+        try:
+            await self._call(
+                self.bot.edit_message_text,
+                chat_id=self.chat_id,
+                message_id=message.message_id,
+                text=text,
+                parse_mode=parse_mode,
+            )
+        except BadRequest as e:
+            if "not modified" not in str(e).lower():
+                raise
+        self._sent[index] = text
+        self._next_edit_at = time.monotonic() + self.edit_interval
+        metrics.inc("safebot_telegram_stream_edits_total")
+
+    async def _call(self, method: Callable[..., Awaitable[Any]], **kwargs) -> Any:
+        """Chama a API pelo OutboundSender ou, sem ele, respeitando RetryAfter (uma nova tentativa)"""
+        if self.sender is not None:
+            return await self.sender.send(self.chat_id, lambda: method(**kwargs))
+        try:
+            return await method(**kwargs)
+        except RetryAfter as e:
+            retry_after = retry_after_seconds(e)
+            self._next_edit_at = time.monotonic() + retry_after + self.edit_interval
+            await asyncio.sleep(retry_after)
+            return await method(**kwargs)
+
+
+async def stream_run(
+    run_in_thread: Callable[..., Awaitable[Any]],
+    runner: Callable[..., Any],
+    message: str,
+    on_text: Callable[[str], Awaitable[Any]],
+    content_event: str = AGENT_CONTENT_EVENT,
+    cancel: Optional[threading.Event] = None,
+) -> str:
+    """Executa runner(message, stream=True) em thread e entrega cada delta a on_text"""
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+
+    def produce():
+        events = runner(message, stream=True)
+        try:
+            for event in events:
+                if cancel is not None and cancel.is_set():
+                    break
+                check_deadline()
+                if getattr(event, "event", None) == content_event and isinstance(event.content, str):
+                    loop.call_soon_threadsafe(queue.put_nowait, event.content)
+        finally:
+            # Fechar o gerador encerra o stream do modelo quando a execução é cancelada
+            close = getattr(events, "close", None)
+            if close is not None:
+                close()
+            loop.call_soon_threadsafe(queue.put_nowait, _DONE)
+
+    producer = asyncio.ensure_future(run_in_thread(produce))
+    text = ""
+    while True:
+        chunk = await queue.get()
+        if chunk is _DONE:
+            break
+        text += chunk
+        if cancel is None or not cancel.is_set():
+            await on_text(chunk)
+    # Propaga exceções do agente
+    await producer
+    return text
@@ -5,17 +5,31 @@ Bot do Telegram integrado com sistema de teams multi-agente
 """
 import os
 import sys
+import time
 import asyncio
+import functools
 import logging
 from pathlib import Path
 from typing import Dict, Optional
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, Message
 from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters, ContextTypes
+from agno.exceptions import ModelProviderError
 
 # Adicionar path para imports
 sys.path.append(str(Path(__file__).parent.parent))
 
-from core.teams import SafeBotTeamsFactory
+from core.teams import SafeBotTeamsFactory, TeamPool, team_session_id
+from core.selector import AUTO_TEAM, ComplexitySelector, override_bias, record_run
+from core.state import SessionStateStore, create_state_store
+from core.maintenance import start_scheduler_from_env
+from core.telemetry import start_metrics_server_from_env
+from core.deadline import DeadlineExceeded, deadline_scope
+from telegram_bot.executor import AgentExecutor
+from telegram_bot.formatting import MAX_MESSAGE_LENGTH, render_html, split_html
+from telegram_bot.sender import OutboundSender
+from telegram_bot.coalescer import CoalescedRun, MessageCoalescer
+from telegram_bot.scheduler import ChatScheduler, QueueFullError, queue_notice
+from telegram_bot.streaming import TEAM_CONTENT_EVENT, TelegramStreamWriter, stream_run, streaming_enabled
 
 # Configurar logging
 logging.basicConfig(
@@ -24,29 +38,70 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Sessão de um usuário novo
+DEFAULT_SESSION = {
+    'current_team': os.getenv("SAFEBOT_DEFAULT_TEAM", AUTO_TEAM),  # Team padrão
+    'conversation_count': 0,
+    'preferred_mode': os.getenv("SAFEBOT_DEFAULT_TEAM", AUTO_TEAM),
+    'last_auto_team': None,  # Último team escolhido pelo modo auto
+    'complexity_bias': 0.0  # Ajuste aprendido com as trocas manuais do usuário
+}
+
+TEAM_NAMES = {
+    'auto': 'Auto 🤖',
+    'quick': 'Quick Team ⚡',
+    'comprehensive': 'Comprehensive Team 🔬',
+    'research': 'Research Team 🧠'
+}
+
 class SafeBotTeamsBot:
     """Bot do Telegram com suporte a teams multi-agente"""
     
-    def __init__(self):
+    def __init__(
+        self,
+        concurrency: Optional[int] = None,
+        streaming: Optional[bool] = None,
+        state_store: Optional[SessionStateStore] = None,
+        global_rate: Optional[float] = None,
+    ):
         self.factory = SafeBotTeamsFactory()
-        self.user_sessions: Dict[int, Dict] = {}
+        self.streaming = streaming_enabled() if streaming is None else streaming  # Respostas progressivas
+        self.state = state_store or create_state_store()  # Sessões compartilhadas entre réplicas
+        self.executor = AgentExecutor(concurrency, name="telegram_teams")  # Execuções de LLM fora do event loop
+        self.scheduler = ChatScheduler(max_in_flight=self.executor.max_workers)  # Fila ordenada por chat
+        self.sender = OutboundSender(global_rate=global_rate)  # Envio com limites do Telegram e reenvio
+        self.coalescer = MessageCoalescer()  # Junta mensagens em rajada em uma execução
         
-        # Inicializar teams
+        # Inicializar teams (uma instância por execução simultânea)
+        pool_size = self.executor.max_workers
         self.teams = {
-            'comprehensive': self.factory.create_comprehensive_safety_team(),
-            'quick': self.factory.create_quick_consultation_team(),
-            'research': self.factory.create_collaborative_research_team()
+            'comprehensive': TeamPool(self.factory.create_comprehensive_safety_team, pool_size),
+            'quick': TeamPool(self.factory.create_quick_consultation_team, pool_size),
+            'research': TeamPool(self.factory.create_collaborative_research_team, pool_size)
         }
+        # Modo auto: nota de complexidade usando o pré-roteador do Quick Team
+        self.selector = ComplexitySelector(getattr(self.teams['quick'].template, 'pre_router', None))
     
     def get_user_session(self, user_id: int) -> Dict:
-        """Obtém ou cria sessão do usuário"""
-        if user_id not in self.user_sessions:
-            self.user_sessions[user_id] = {
-                'current_team': 'quick',  # Team padrão
-                'conversation_count': 0,
-                'preferred_mode': 'quick'
-            }
-        return self.user_sessions[user_id]
+        """Obtém a sessão do usuário (padrão se ainda não existir)"""
+        return {**DEFAULT_SESSION, **(self.state.get(f"teams:{user_id}") or {})}
+    
+    def update_user_session(self, user_id: int, **changes) -> Dict:
+        """Altera campos da sessão do usuário de forma atômica"""
+        return self.state.update(
+            f"teams:{user_id}", lambda session: {**DEFAULT_SESSION, **session, **changes}, DEFAULT_SESSION
+        )
+    
+    def count_conversation(self, user_id: int) -> Dict:
+        """Incrementa o contador de conversas e retorna a sessão atualizada"""
+        return self.state.update(
+            f"teams:{user_id}",
+            lambda session: {
+                **DEFAULT_SESSION, **session,
+                'conversation_count': session.get('conversation_count', 0) + 1
+            },
+            DEFAULT_SESSION
+        )
     
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Comando /start com apresentação dos teams"""
@@ -63,7 +118,11 @@ Agora trabalho com <b>teams de especialistas</b> para oferecer análises ainda m
 
 🤝 <b>MEUS TEAMS DISPONÍVEIS:</b>
 
-🎯 <b>Quick Team</b> (Padrão)
+🤖 <b>Auto</b> (Padrão)
+• Escolhe o team pela complexidade da pergunta
+• Perguntas diretas respondidas mais rápido
+
+🎯 <b>Quick Team</b>
 • Consultas rápidas e direcionadas
 • Roteamento inteligente por especialidade
 • Ideal para perguntas específicas
@@ -78,7 +137,7 @@ Agora trabalho com <b>teams de especialistas</b> para oferecer análises ainda m
 • Múltiplas perspectivas especializadas
 • Ideal para tópicos complexos
 
-<b>Team atual:</b> {session['current_team'].title()} Team
+<b>Team atual:</b> {TEAM_NAMES.get(session['current_team'], session['current_team'])}
 
 Use /teams para trocar de team ou /help para mais comandos.
 """
@@ -108,6 +167,7 @@ Selecione o team mais adequado para sua consulta:
 """
         
         keyboard = [
+            [InlineKeyboardButton("🤖 Auto (recomendado)", callback_data="team_auto")],
             [InlineKeyboardButton("⚡ Quick Team", callback_data="team_quick")],
             [InlineKeyboardButton("🔬 Comprehensive Team", callback_data="team_comprehensive")],
             [InlineKeyboardButton("🧠 Research Team", callback_data="team_research")],
@@ -130,10 +190,15 @@ Selecione o team mais adequado para sua consulta:
 /start - Iniciar bot e apresentação
 /teams - Trocar entre teams
 /status - Ver status atual e estatísticas
+/cancelar - Interromper a resposta em andamento
 /help - Esta mensagem de ajuda
 
 <b>🤝 TEAMS DISPONÍVEIS:</b>
 
+<b>🤖 Auto (Padrão)</b>
+• <i>Funcionamento:</i> Avalia a pergunta e usa o team mais leve adequado
+• <i>Ideal para:</i> Uso geral, sem precisar escolher
+
 <b>⚡ Quick Team (ROUTE)</b>
 • <i>Especialista em:</i> Consultas rápidas
 • <i>Ideal para:</i> Perguntas específicas sobre segurança
@@ -150,7 +215,7 @@ Selecione o team mais adequado para sua consulta:
 • <i>Tempo:</i> Pesquisa aprofundada
 
 <b>💬 COMO USAR:</b>
-1. Escolha o team adequado com /teams
+1. Use o modo Auto ou escolha o team com /teams
 2. Faça sua pergunta normalmente
 3. O team processará com seus especialistas
 4. Receba resposta otimizada para seu caso
@@ -172,7 +237,7 @@ Selecione o team mais adequado para sua consulta:
 📊 <b>STATUS SAFEBOT TEAMS</b>
 
 <b>👤 Usuário:</b> {update.effective_user.first_name}
-<b>🤝 Team Atual:</b> {session['current_team'].title()} Team
+<b>🤝 Team Atual:</b> {TEAM_NAMES.get(session['current_team'], session['current_team'])}
 <b>💬 Conversas:</b> {session['conversation_count']}
 <b>⚙️ Modo Preferido:</b> {session['preferred_mode'].title()}
 
@@ -205,19 +270,17 @@ Use /teams para trocar de team conforme sua necessidade.
         if query.data == "change_team":
             await self.teams_command(update, context)
             
-        elif query.data.startswith("team_"):
+        elif query.data.startswith("team_") and query.data != "team_details":
             team_name = query.data.replace("team_", "")
-            session['current_team'] = team_name
-            session['preferred_mode'] = team_name
-            
-            team_names = {
-                'quick': 'Quick Team ⚡',
-                'comprehensive': 'Comprehensive Team 🔬',
-                'research': 'Research Team 🧠'
-            }
+            # Troca manual depois de uma escolha do auto ajusta as próximas escolhas
+            changes = {}
+            bias = override_bias(session, team_name)
+            if bias is not None:
+                changes['complexity_bias'] = bias
+            session = self.update_user_session(user_id, current_team=team_name, preferred_mode=team_name, **changes)
             
             await query.edit_message_text(
-                f"✅ <b>Team alterado!</b>\n\nAgora você está usando: <b>{team_names[team_name]}</b>\n\n"
+                f"✅ <b>Team alterado!</b>\n\nAgora você está usando: <b>{TEAM_NAMES[team_name]}</b>\n\n"
                 "Faça sua pergunta e o team processará com os especialistas adequados.",
                 parse_mode='HTML'
             )
@@ -252,38 +315,102 @@ Use /teams para trocar de team conforme sua necessidade.
         elif query.data == "status":
             await self.status_command(update, context)
     
+    async def cancel_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Comando /cancelar: interrompe a resposta em andamento"""
+        if self.coalescer.cancel(update.effective_chat.id):
+            await self._reply(update, "🛑 Resposta cancelada.")
+        else:
+            await self._reply(update, "Nenhuma resposta em andamento.")
+    
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Handler principal para mensagens"""
+        """Handler principal: agrupa a rajada e enfileira na fila ordenada do chat"""
+        received_at = time.monotonic()
+        run = await self.coalescer.collect(update.effective_chat.id, update.message.text)
+        if run is None:
+            return  # Mensagem incorporada à execução da mensagem seguinte
+        try:
+            await self.scheduler.submit(
+                update.effective_chat.id,
+                lambda: self._process_message(update, context, received_at, run),
+                notify=lambda position: self._reply(update, queue_notice(position), parse_mode='HTML')
+            )
+        except QueueFullError as e:
+            logger.warning(f"Mensagem recusada: {e}")
+            self.coalescer.release(run)
+            self._reply(update, "⚠️ Muitas mensagens em processamento. Tente novamente em alguns instantes.")
+    
+    async def _process_message(
+        self, update: Update, context: ContextTypes.DEFAULT_TYPE, received_at: float, run: CoalescedRun
+    ):
+        """Processa uma mensagem (ou rajada de mensagens) com o team atual do usuário"""
+        if run.superseded:
+            return  # Substituída antes de começar
+        deadline = run.start_deadline()
         user_id = update.effective_user.id
-        session = self.get_user_session(user_id)
-        user_message = update.message.text
+        user_message = run.text
         
         # Incrementar contador de conversas
-        session['conversation_count'] += 1
+        session = self.count_conversation(user_id)
+        
+        # Modo auto: team mais barato adequado à complexidade da pergunta
+        auto = session['current_team'] == AUTO_TEAM
+        team_key = session['current_team']
+        if auto:
+            team_key = self.selector.select(user_message, session).team
+            session = self.update_user_session(user_id, last_auto_team=team_key)
         
         # Mostrar que está processando
-        processing_msg = await update.message.reply_text(
-            f"🤝 <b>{session['current_team'].title()} Team</b> está analisando...\n"
+        processing_msg = await self._reply(
+            update,
+            f"🤝 <b>{team_key.title()} Team</b> está analisando...{' <i>(auto)</i>' if auto else ''}\n"
             f"⏳ <i>Consultando especialistas...</i>",
             parse_mode='HTML'
         )
         
+        started = time.monotonic()
+        writer: Optional[TelegramStreamWriter] = None
         try:
-            # Obter team atual
-            current_team = self.teams[session['current_team']]
-            
-            # Processar com o team (simulação - na prática seria assíncrono)
-            response = current_team.run(user_message)
-            response_text = response.content if hasattr(response, 'content') else str(response)
-            
-            # Deletar mensagem de processamento
-            await processing_msg.delete()
-            
-            # Preparar resposta formatada para Telegram
-            formatted_response = self.format_for_telegram(response_text, session['current_team'])
+            # Obter team atual, com contexto explícito do usuário para esta execução
+            run_team = functools.partial(
+                self.teams[team_key].run,
+                user_id=str(user_id),
+                session_id=team_session_id("telegram", user_id, team_key)
+            )
             
-            # Enviar resposta (pode precisar dividir se muito longa)
-            await self.send_long_message(update, formatted_response)
+            if self.streaming:
+                # A mensagem de processamento vira a resposta, atualizada conforme os tokens chegam
+                writer = TelegramStreamWriter(
+                    context.bot, update.effective_chat.id, started_at=received_at, sender=self.sender
+                )
+                await writer.start(processing_msg)
+                with deadline_scope(deadline):
+                    response_text = await stream_run(
+                        self.executor.run, run_team, user_message, writer.append,
+                        content_event=TEAM_CONTENT_EVENT, cancel=run.cancel
+                    )
+                processing_msg = None
+                if not self.coalescer.deliverable(run):
+                    await writer.discard()
+                    return
+                record_run(team_key, time.monotonic() - started, auto)
+                await writer.finish(self.format_for_telegram(response_text, team_key))
+            else:
+                # Processar com o team em thread, sem bloquear outros chats
+                with deadline_scope(deadline):
+                    response = await self.executor.run(run_team, user_message)
+                record_run(team_key, time.monotonic() - started, auto)
+                response_text = response.content if hasattr(response, 'content') else str(response)
+                
+                # Deletar mensagem de processamento
+                self.sender.submit(update.effective_chat.id, processing_msg.delete)
+                if not self.coalescer.deliverable(run):
+                    return  # Nova mensagem chegou: a próxima execução responde a tudo
+                
+                # Preparar resposta formatada para Telegram
+                formatted_response = self.format_for_telegram(response_text, team_key)
+                
+                # Enviar resposta (pode precisar dividir se muito longa)
+                self.send_long_message(update, formatted_response)
             
             # Keyboard com ações pós-resposta
             keyboard = [
@@ -292,21 +419,77 @@ Use /teams para trocar de team conforme sua necessidade.
             ]
             reply_markup = InlineKeyboardMarkup(keyboard)
             
-            await update.message.reply_text(
+            self._reply(
+                update,
                 "💡 <i>Posso ajudar com mais alguma coisa?</i>",
                 parse_mode='HTML',
                 reply_markup=reply_markup
             )
             
+        except DeadlineExceeded as e:
+            self.coalescer.release(run)
+            await self._clear_progress(update, writer, processing_msg)
+            if e.reason == "deadline":  # Substituída ou cancelada: nada a enviar
+                self._reply(
+                    update,
+                    f"⏱️ O {team_key.title()} Team demorou mais que o esperado.\n"
+                    "Tente uma pergunta mais específica ou use /teams para um team mais rápido.",
+                    parse_mode='HTML'
+                )
+            
+        except ModelProviderError as e:
+            # Novas tentativas e modelo alternativo já esgotados (core/resilience.py)
+            self.coalescer.release(run)
+            await self._clear_progress(update, writer, processing_msg)
+            logger.error(f"Provedor de IA indisponível no {team_key} team: {e}")
+            self._reply(
+                update,
+                "🔌 O serviço de IA está instável no momento.\n"
+                "Tente novamente em alguns minutos ou use /teams para um team mais simples.",
+                parse_mode='HTML'
+            )
+            
         except Exception as e:
-            await processing_msg.delete()
-            await update.message.reply_text(
-                f"❌ <b>Erro no {session['current_team'].title()} Team:</b>\n"
-                f"<i>{str(e)}</i>\n\n"
+            self.coalescer.release(run)
+            await self._clear_progress(update, writer, processing_msg)
+            logger.error(f"Erro no {team_key} team: {e}")
+            self._reply(
+                update,
+                f"❌ <b>Erro no {team_key.title()} Team.</b>\n\n"
                 "Tente novamente ou use /teams para trocar de team.",
                 parse_mode='HTML'
             )
     
+    async def _clear_progress(
+        self, update: Update, writer: Optional[TelegramStreamWriter], processing_msg: Optional[Message]
+    ):
+        """Remove a mensagem de processamento e a resposta parcial antes do aviso de erro"""
+        if writer is not None:
+            await writer.discard()  # Inclui a mensagem de processamento, reaproveitada pelo writer
+        elif processing_msg is not None:
+            self.sender.submit(update.effective_chat.id, processing_msg.delete)
+    
+    def build_application(self, token: str) -> Application:
+        """Cria a aplicação do Telegram com todos os handlers (polling ou webhook)"""
+        application = (
+            Application.builder()
+            .token(token)
+            # Updates chegam todos ao agendador, que limita as execuções de LLM
+            .concurrent_updates(self.scheduler.max_queued + self.scheduler.max_in_flight)
+            .build()
+        )
+        
+        # Registrar handlers
+        application.add_handler(CommandHandler("start", self.start_command))
+        application.add_handler(CommandHandler("teams", self.teams_command))
+        application.add_handler(CommandHandler("help", self.help_command))
+        application.add_handler(CommandHandler("status", self.status_command))
+        application.add_handler(CommandHandler("cancelar", self.cancel_command))
+        application.add_handler(CallbackQueryHandler(self.button_callback))
+        application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_message))
+        
+        return application
+    
     def format_for_telegram(self, response: str, team_name: str) -> str:
         """Formata resposta para Telegram com HTML"""
         team_icons = {
@@ -317,53 +500,25 @@ Use /teams para trocar de team conforme sua necessidade.
         
         icon = team_icons.get(team_name, '🤖')
         
-        formatted = f"🛡️ <b>SafeBot {team_name.title()} Team</b> {icon}\n\n"
-        
-        # Converter markdown básico para HTML
-        response = response.replace('**', '<b>').replace('**', '</b>')
-        response = response.replace('*', '<i>').replace('*', '</i>')
-        response = response.replace('`', '<code>').replace('`', '</code>')
-        
-        # Adicionar quebras de linha para melhor formatação
-        response = response.replace('\n\n', '\n\n')
-        
-        formatted += response
-        
-        return formatted
+        # Markdown/HTML do team convertido em HTML válido (tags sempre fechadas)
+        return f"🛡️ <b>SafeBot {team_name.title()} Team</b> {icon}\n\n" + render_html(response)
+    
+    def _reply(self, update: Update, text: str, **kwargs) -> asyncio.Future:
+        """Enfileira uma resposta no chat respeitando os limites do Telegram"""
+        return self.sender.submit(update.effective_chat.id, lambda: update.message.reply_text(text, **kwargs))
     
-    async def send_long_message(self, update: Update, text: str, max_length: int = 4000):
+    def send_long_message(self, update: Update, text: str, max_length: int = MAX_MESSAGE_LENGTH):
         """Envia mensagem longa dividindo se necessário"""
-        if len(text) <= max_length:
-            await update.message.reply_text(text, parse_mode='HTML')
-        else:
-            # Dividir mensagem em partes
-            parts = []
-            current_part = ""
-            
-            for line in text.split('\n'):
-                if len(current_part + line + '\n') > max_length:
-                    if current_part:
-                        parts.append(current_part.strip())
-                        current_part = line + '\n'
-                    else:
-                        # Linha muito longa, dividir forçadamente
-                        parts.append(line[:max_length])
-                        current_part = line[max_length:] + '\n'
-                else:
-                    current_part += line + '\n'
-            
-            if current_part:
-                parts.append(current_part.strip())
-            
-            # Enviar partes
-            for i, part in enumerate(parts):
-                if i == 0:
-                    await update.message.reply_text(part, parse_mode='HTML')
-                else:
-                    await update.message.reply_text(
-                        f"<i>(continuação {i+1}/{len(parts)})</i>\n\n{part}",
-                        parse_mode='HTML'
-                    )
+        parts = split_html(text, max_length)
+        for i, part in enumerate(parts):
+            if i == 0:
+                self._reply(update, part, parse_mode='HTML')
+            else:
+                self._reply(
+                    update,
+                    f"<i>(continuação {i+1}/{len(parts)})</i>\n\n{part}",
+                    parse_mode='HTML'
+                )
 
 def main():
     """Função principal do bot"""
@@ -384,19 +539,14 @@ def main():
         print("🤖 Bot funcionará sem base de conhecimento completa.")
         input("⏸️ Pressione Enter para continuar...")
     
-    # Criar bot
-    bot = SafeBotTeamsBot()
+    # Manutenção periódica opcional (SAFEBOT_MAINTENANCE_INTERVAL_HOURS)
+    start_scheduler_from_env()
+    # /metrics em porta lateral (SAFEBOT_METRICS_PORT; 0 desativa)
+    start_metrics_server_from_env()
     
-    # Criar aplicação
-    application = Application.builder().token(token).build()
-    
-    # Registrar handlers
-    application.add_handler(CommandHandler("start", bot.start_command))
-    application.add_handler(CommandHandler("teams", bot.teams_command))
-    application.add_handler(CommandHandler("help", bot.help_command))
-    application.add_handler(CommandHandler("status", bot.status_command))
-    application.add_handler(CallbackQueryHandler(bot.button_callback))
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, bot.handle_message))
+    # Criar bot e aplicação
+    bot = SafeBotTeamsBot()
+    application = bot.build_application(token)
     
     print("✅ SafeBot Teams Bot iniciado!")
     print("🤝 Teams disponíveis: Quick, Comprehensive, Research")
@@ -0,0 +1,181 @@
+"""
+SafeBot Telegram - Modo webhook
+Recebe updates do Telegram via HTTP em vez de long polling. O receptor pode ser
+montado no FastAPI das aplicações web (apenas com um processo, atrás do nginx)
+ou rodar sozinho. O secret token é validado em cada requisição e os updates são
+processados em paralelo pela aplicação do python-telegram-bot.
+
+Deve existir um único receptor por bot: a fila ordenada por chat e o
+agrupamento de rajadas vivem na memória do processo, e cada receptor chama
+setWebhook. Com vários workers web, use o receptor dedicado
+(python safebot.py telegram --webhook).
+"""
+import os
+import sys
+import hmac
+import logging
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from fastapi import FastAPI, Request, Response
+from telegram import Update
+from telegram.ext import Application
+
+from core.metrics import metrics
+from core.telemetry import instrument_app
+from telegram_bot.workers import build_bot_application
+
+logger = logging.getLogger(__name__)
+
+metrics.describe("safebot_telegram_webhook_updates_total", "Updates recebidos via webhook")
+
+# Cabeçalho enviado pelo Telegram com o secret_token configurado no setWebhook
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class TelegramWebhook:
+    """Receptor de webhook para uma aplicação do python-telegram-bot"""
+
+    def __init__(
+        self,
+        application: Application,
+        path: str,
+        secret_token: str,
+        public_url: Optional[str] = None,
+        max_connections: Optional[int] = None,
+    ):
+        if not secret_token:
+            raise ValueError("TELEGRAM_WEBHOOK_SECRET é obrigatório no modo webhook")
+        self.application = application
+        self.path = path
+        self.secret_token = secret_token
+        self.public_url = public_url.rstrip("/") if public_url else None
+        self.max_connections = max_connections or int(os.getenv("TELEGRAM_WEBHOOK_MAX_CONNECTIONS", "40"))
+
+    @property
+    def webhook_url(self) -> Optional[str]:
+        return f"{self.public_url}{self.path}" if self.public_url else None
+
+    async def start(self):
+        """Inicializa a aplicação e registra o webhook no Telegram"""
+        await self.application.initialize()
+        await self.application.start()
+        if self.webhook_url:
+            await self.application.bot.set_webhook(
+                url=self.webhook_url,
+                secret_token=self.secret_token,
+                max_connections=self.max_connections,
+                allowed_updates=Update.ALL_TYPES,
+            )
+            logger.info(f"Webhook registrado em {self.webhook_url}")
+        else:
+            logger.warning("TELEGRAM_WEBHOOK_URL não definido: setWebhook deve ser feito externamente")
+
+    async def stop(self):
+        await self.application.stop()
+        await self.application.shutdown()
+
+    async def handle(self, request: Request) -> Response:
+        """Valida o secret token e entrega o update à fila da aplicação"""
+        received = request.headers.get(SECRET_HEADER, "")
+        if not hmac.compare_digest(received, self.secret_token):
+            metrics.inc("safebot_telegram_webhook_updates_total", status="forbidden")
+            return Response(status_code=403)
+
+        try:
+            update = Update.de_json(await request.json(), self.application.bot)
+        except Exception as e:
+            logger.warning(f"Update inválido recebido no webhook: {e}")
+            metrics.inc("safebot_telegram_webhook_updates_total", status="invalid")
+            return Response(status_code=400)
+
+        # Resposta imediata; o processamento segue em paralelo (concurrent_updates)
+        await self.application.update_queue.put(update)
+        metrics.inc("safebot_telegram_webhook_updates_total", status="accepted")
+        return Response(status_code=200)
+
+    def mount(self, app: FastAPI):
+        """Adiciona a rota e acopla start/stop ao lifespan do FastAPI"""
+        app.add_api_route(self.path, self.handle, methods=["POST"], include_in_schema=False)
+
+        previous_lifespan = app.router.lifespan_context
+
+        @asynccontextmanager
+        async def lifespan(app_: FastAPI):
+            await self.start()
+            try:
+                async with previous_lifespan(app_) as state:
+                    yield state
+            finally:
+                await self.stop()
+
+        app.router.lifespan_context = lifespan
+
+
+def create_bot_webhook(kind: str) -> TelegramWebhook:
+    """Cria o bot ('agent' ou 'teams') e seu receptor de webhook a partir do ambiente"""
+    token = os.getenv("TELEGRAM_TOKEN") or os.getenv("TELEGRAM_BOT_TOKEN")
+    if not token:
+        raise ValueError("TELEGRAM_TOKEN não configurado")
+
+    application = build_bot_application(kind, token)
+
+    return TelegramWebhook(
+        application,
+        path=f"/telegram/{kind}",
+        secret_token=os.getenv("TELEGRAM_WEBHOOK_SECRET", ""),
+        public_url=os.getenv("TELEGRAM_WEBHOOK_URL"),
+    )
+
+
+def web_worker_count() -> int:
+    """Processos do servidor web: WEB_CONCURRENCY (gunicorn/uvicorn) ou --workers/-w na linha de comando"""
+    args = sys.argv[1:]
+    for flag in ("--workers", "-w"):
+        if flag in args and args.index(flag) + 1 < len(args):
+            return int(args[args.index(flag) + 1])
+        for arg in args:
+            if arg.startswith(f"{flag}="):
+                return int(arg.split("=", 1)[1])
+    return int(os.getenv("WEB_CONCURRENCY", "1"))
+
+
+def mount_from_env(app: FastAPI, kind: str) -> Optional[TelegramWebhook]:
+    """Monta o webhook do bot no app se SAFEBOT_TELEGRAM_WEBHOOK incluir o tipo (só com um processo web)"""
+    enabled = [k.strip() for k in os.getenv("SAFEBOT_TELEGRAM_WEBHOOK", "").split(",") if k.strip()]
+    if kind not in enabled:
+        return None
+    workers = web_worker_count()
+    if workers > 1:
+        # Cada worker teria sua fila por chat e chamaria setWebhook: ordem e agrupamento se perdem
+        raise ValueError(
+            f"SAFEBOT_TELEGRAM_WEBHOOK={kind} exige um único processo web ({workers} workers). "
+            f"Use o receptor dedicado: python safebot.py telegram{'-teams' if kind == 'teams' else ''} --webhook"
+        )
+    webhook = create_bot_webhook(kind)
+    webhook.mount(app)
+    print(f"📨 Webhook do Telegram ({kind}) montado em {webhook.path}")
+    return webhook
+
+
+def serve(kind: str, host: Optional[str] = None, port: Optional[int] = None):
+    """Executa o receptor de webhook sozinho (sem a aplicação web)"""
+    import uvicorn
+    from core.maintenance import start_scheduler_from_env
+
+    # Manutenção periódica opcional (SAFEBOT_MAINTENANCE_INTERVAL_HOURS)
+    start_scheduler_from_env()
+
+    webhook = create_bot_webhook(kind)
+    app = FastAPI(title=f"SafeBot Telegram Webhook ({kind})", docs_url=None, redoc_url=None)
+    webhook.mount(app)
+    instrument_app(app, f"telegram-{kind}-webhook")
+
+    @app.get("/health")
+    async def health_check():
+        return {"status": "healthy", "service": f"safebot-telegram-{kind}-webhook"}
+
+    host = host or os.getenv("TELEGRAM_WEBHOOK_HOST", "0.0.0.0")
+    port = port or int(os.getenv("TELEGRAM_WEBHOOK_PORT", "8081"))
+    print(f"📨 Webhook do Telegram ({kind}) em http://{host}:{port}{webhook.path}")
+    uvicorn.run(app, host=host, port=port)
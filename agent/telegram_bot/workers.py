@@ -0,0 +1,199 @@
+"""
+SafeBot Telegram - Bot em múltiplos processos
+Um processo receptor faz o polling do Telegram e distribui cada update para um
+de N processos worker por hash consistente do chat_id. Assim o mesmo chat cai
+sempre no mesmo worker (ordem preservada e agente do usuário em cache local),
+e formatação, serialização e retrieval usam todos os núcleos da máquina. Os
+limites globais (envio ao Telegram e execuções de LLM) são divididos entre os
+workers.
+"""
+import os
+import bisect
+import signal
+import asyncio
+import hashlib
+import logging
+import multiprocessing as mp
+from typing import Dict, List, Optional
+
+from telegram import Update
+from telegram.ext import Application, ContextTypes, TypeHandler
+
+from core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+metrics.describe("safebot_telegram_routed_updates_total", "Updates encaminhados pelo receptor por worker")
+metrics.describe("safebot_telegram_worker_restarts_total", "Workers reiniciados pelo receptor")
+
+
+class HashRing:
+    """Hash consistente com nós virtuais"""
+
+    def __init__(self, nodes: List[int], replicas: int = 256):
+        self._ring: List[int] = []
+        self._nodes: Dict[int, int] = {}
+        for node in nodes:
+            for replica in range(replicas):
+                point = self._hash(f"{node}:{replica}")
+                self._nodes[point] = node
+                bisect.insort(self._ring, point)
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+    def node_for(self, key: object) -> int:
+        index = bisect.bisect(self._ring, self._hash(str(key))) % len(self._ring)
+        return self._nodes[self._ring[index]]
+
+
+def routing_key(update: Update) -> object:
+    """Chave de roteamento: chat, senão usuário, senão o próprio update"""
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    if update.effective_user is not None:
+        return update.effective_user.id
+    return update.update_id
+
+
+def worker_limits(workers: int) -> Dict[str, float]:
+    """
+    Fatia de cada worker nos limites globais do bot: orçamento de envio ao
+    Telegram (SAFEBOT_TELEGRAM_GLOBAL_RATE) e execuções de LLM simultâneas
+    (SAFEBOT_TELEGRAM_CONCURRENCY), para que N workers somados não passem deles
+    """
+    from telegram_bot.executor import default_concurrency
+
+    return {
+        "global_rate": float(os.getenv("SAFEBOT_TELEGRAM_GLOBAL_RATE", "25")) / workers,
+        "concurrency": max(1, default_concurrency() // workers),
+    }
+
+
+def build_bot_application(kind: str, token: str, workers: int = 1) -> Application:
+    """Cria a aplicação completa do bot ('agent' ou 'teams') com a fatia dos limites de um de N workers"""
+    limits = worker_limits(workers)
+    if kind == "agent":
+        from telegram_bot.bot import SafeBotTelegram
+
+        return SafeBotTelegram(token, concurrency=int(limits["concurrency"]), global_rate=limits["global_rate"]).build_application()
+    if kind == "teams":
+        from telegram_bot.teams_bot import SafeBotTeamsBot
+
+        return SafeBotTeamsBot(concurrency=int(limits["concurrency"]), global_rate=limits["global_rate"]).build_application(token)
+    raise ValueError(f"Bot desconhecido: {kind}")
+
+
+async def _consume(application: Application, updates: mp.Queue):
+    await application.initialize()
+    await application.start()
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            data = await loop.run_in_executor(None, updates.get)
+            if data is None:
+                break
+            await application.update_queue.put(Update.de_json(data, application.bot))
+    finally:
+        await application.stop()
+        await application.shutdown()
+
+
+def _worker_main(kind: str, index: int, workers: int, token: str, updates: mp.Queue):
+    """Processo worker: aplicação completa do bot alimentada pela fila do receptor"""
+    logging.basicConfig(
+        format=f"%(asctime)s - worker-{index} - %(name)s - %(levelname)s - %(message)s",
+        level=logging.INFO,
+    )
+    # Ctrl+C é tratado pelo receptor, que envia o sinal de parada pela fila
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    from core.telemetry import start_metrics_server_from_env
+
+    # Métricas de cada worker na porta seguinte à do receptor (SAFEBOT_METRICS_PORT + 1 + índice)
+    start_metrics_server_from_env(offset=index + 1)
+    application = build_bot_application(kind, token, workers)
+    asyncio.run(_consume(application, updates))
+
+
+class ShardedBotRunner:
+    """Receptor que distribui updates entre processos worker por chat_id"""
+
+    def __init__(self, kind: str, token: str, workers: int):
+        if workers < 1:
+            raise ValueError("--workers deve ser >= 1")
+        self.kind = kind
+        self.token = token
+        self.workers = workers
+        self.ring = HashRing(list(range(workers)))
+        self._context = mp.get_context("spawn")
+        self.queues = [self._context.Queue() for _ in range(workers)]
+        self.processes: List[Optional[mp.Process]] = [None] * workers
+
+    def _spawn(self, index: int):
+        process = self._context.Process(
+            target=_worker_main,
+            args=(self.kind, index, self.workers, self.token, self.queues[index]),
+            name=f"safebot-{self.kind}-worker-{index}",
+            daemon=True,
+        )
+        process.start()
+        self.processes[index] = process
+
+    async def _route(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        index = self.ring.node_for(routing_key(update))
+        process = self.processes[index]
+        if process is None or not process.is_alive():
+            # Worker caiu: sobe outro na mesma fila, sem perder os updates pendentes
+            logger.warning(f"Worker {index} inativo, reiniciando")
+            metrics.inc("safebot_telegram_worker_restarts_total", worker=index)
+            self._spawn(index)
+        self.queues[index].put(update.to_dict())
+        metrics.inc("safebot_telegram_routed_updates_total", worker=index)
+
+    def run(self):
+        """Sobe os workers e faz o polling no processo atual"""
+        for index in range(self.workers):
+            self._spawn(index)
+
+        receiver = Application.builder().token(self.token).build()
+        receiver.add_handler(TypeHandler(Update, self._route))
+        try:
+            receiver.run_polling(allowed_updates=Update.ALL_TYPES)
+        finally:
+            self.stop()
+
+    def stop(self, timeout: float = 30):
+        for updates in self.queues:
+            updates.put(None)
+        for process in self.processes:
+            if process is not None:
+                process.join(timeout)
+                if process.is_alive():
+                    process.terminate()
+
+
+def main(kind: str, workers: int):
+    """Ponto de entrada de 'safebot.py telegram[-teams] --workers N'"""
+    from core.maintenance import start_scheduler_from_env
+    from core.telemetry import start_metrics_server_from_env
+
+    token = os.getenv("TELEGRAM_TOKEN") or os.getenv("TELEGRAM_BOT_TOKEN")
+    if not token:
+        print("❌ TELEGRAM_TOKEN não configurado!")
+        return
+    if not os.getenv("OPENAI_API_KEY"):
+        print("❌ OPENAI_API_KEY não configurado!")
+        return
+
+    print(f"🤖 SAFEBOT TELEGRAM ({kind}) - {workers} workers")
+    print("=" * 60)
+    print("🔀 Updates distribuídos por hash consistente do chat_id")
+    print("⏹️ Pressione Ctrl+C para parar")
+
+    # Manutenção periódica apenas no receptor (SAFEBOT_MAINTENANCE_INTERVAL_HOURS)
+    start_scheduler_from_env()
+    # Receptor em SAFEBOT_METRICS_PORT; workers nas portas seguintes
+    start_metrics_server_from_env()
+
+    ShardedBotRunner(kind, token, workers).run()
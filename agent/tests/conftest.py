@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Os módulos do projeto são importados a partir da pasta agent/ (core, telegram_bot)
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
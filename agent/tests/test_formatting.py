@@ -0,0 +1,123 @@
+"""
+Renderização das respostas em HTML do Telegram e divisão em partes com as
+tags balanceadas.
+"""
+import re
+from html import unescape
+
+import pytest
+
+from telegram_bot.formatting import render_html, split_html
+
+_TAG = re.compile(r"<(/?)([a-zA-Z][\w-]*)[^>]*>")
+
+
+def assert_balanced(html):
+    stack = []
+    for closing, name in _TAG.findall(html):
+        if closing:
+            assert stack and stack[-1] == name, html
+            stack.pop()
+        else:
+            stack.append(name)
+    assert not stack, html
+
+
+def visible_text(html):
+    return unescape(_TAG.sub("", html))
+
+
+@pytest.mark.parametrize("source, expected", [
+    ("**negrito** e _itálico_", "<b>negrito</b> e <i>itálico</i>"),
+    ("## Título\ntexto", "<b>Título</b>\ntexto"),
+    ("- item", "• item"),
+    ("use `CA` válido", "use <code>CA</code> válido"),
+    ("nome_do_arquivo", "nome_do_arquivo"),
+    ("ruído < 85 & atenuação > 15", "ruído &lt; 85 &amp; atenuação &gt; 15"),
+    ("<strong>forte</strong> <em>ênfase</em>", "<b>forte</b> <i>ênfase</i>"),
+    ("<b>aberto", "<b>aberto</b>"),
+    ("fechado</b>", "fechado"),
+    ("<p>um</p><p>dois</p>", "um\ndois\n"),
+    ("<ul><li>luva</li></ul>", "• luva"),
+    ('<span class="tg-spoiler">oculto</span>', "<tg-spoiler>oculto</tg-spoiler>"),
+])
+def test_render_markdown_and_html(source, expected):
+    assert render_html(source) == expected
+
+
+def test_render_fenced_code_block():
+    rendered = render_html("```python\nif a < b:\n    print('**x**')\n```")
+    assert rendered.startswith('<pre><code class="language-python">if a &lt; b:')
+    assert "**x**" in rendered
+    assert_balanced(rendered)
+
+
+@pytest.mark.parametrize("source, expected", [
+    ('<pre><code class="language-python">print(1)</code></pre>', '<pre><code class="language-python">print(1)</code></pre>'),
+    ("<pre><code>x < 1</code></pre>", "<pre><code>x &lt; 1</code></pre>"),
+    ("<pre>\n<code>y</code></pre>", "<pre><code>y</code></pre>"),
+    ("<pre><code>sem fechar</pre> depois", "<pre><code>sem fechar</code></pre> depois"),
+    ("<pre>a <code>b</code></pre>", "<pre>a &lt;code&gt;b&lt;/code&gt;</pre>"),
+    ("<code>a <b>b</b></code>", "<code>a &lt;b&gt;b&lt;/b&gt;</code>"),
+])
+def test_render_html_code_blocks(source, expected):
+    assert render_html(source) == expected
+
+
+@pytest.mark.parametrize("source, expected", [
+    ("[CA](https://caepi.mte.gov.br/?ca=1&t=2)", '<a href="https://caepi.mte.gov.br/?ca=1&amp;t=2">CA</a>'),
+    ('<a href="https://www.gov.br/nr-06">NR-06</a>', '<a href="https://www.gov.br/nr-06">NR-06</a>'),
+    ('<a href="javascript:alert(1)">clique</a>', "clique"),
+    ('<a href="data:text/html,x">clique</a>', "clique"),
+    ("<a>sem href</a>", "sem href"),
+    ("[x](javascript:alert(1))", "[x](javascript:alert(1))"),
+])
+def test_render_links_allow_only_safe_schemes(source, expected):
+    assert render_html(source) == expected
+
+
+def test_render_overlapping_tags_stay_balanced():
+    rendered = render_html("<b>um <i>dois</b> três</i> **quatro _cinco** seis_")
+    assert_balanced(rendered)
+    assert visible_text(rendered) == "um dois três quatro cinco seis"
+
+
+def test_split_short_text_is_one_part():
+    assert split_html("<b>curto</b>") == ["<b>curto</b>"]
+
+
+def test_split_keeps_parts_under_limit_and_balanced():
+    paragraph = "## EPI para **soldagem**\n- Máscara com <i>filtro</i> e `CA` válido &amp; luvas.\n\n"
+    rendered = render_html(paragraph * 200)
+    parts = split_html(rendered, max_length=500)
+
+    assert len(parts) > 1
+    for part in parts:
+        assert len(part) <= 500
+        assert_balanced(part)
+    assert "".join(visible_text(part) for part in parts).replace("\n", "") == visible_text(rendered).replace("\n", "")
+
+
+def test_split_reopens_tags_in_next_part():
+    rendered = render_html("<b>" + "palavra " * 100 + "</b>")
+    parts = split_html(rendered, max_length=120)
+
+    assert len(parts) > 1
+    assert all(part.startswith("<b>") and part.endswith("</b>") for part in parts)
+
+
+def test_split_reopens_code_block_with_language():
+    rendered = render_html('<pre><code class="language-python">' + "x = 1\n" * 100 + "</code></pre>")
+    parts = split_html(rendered, max_length=200)
+
+    assert len(parts) > 1
+    for part in parts:
+        assert part.startswith('<pre><code class="language-python">')
+        assert part.endswith("</code></pre>")
+
+
+def test_split_never_cuts_entities():
+    rendered = render_html("a & b < c > d " * 300)
+    for part in split_html(rendered, max_length=100):
+        assert not re.search(r"&[a-z]*$", part)
+        assert len(part) <= 100
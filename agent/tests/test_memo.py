@@ -0,0 +1,52 @@
+"""
+Cache de respostas dos especialistas: TTL em processo e no backend compartilhado.
+"""
+import sqlite3
+import time
+
+from core.memo import SubAnswerCache, create_sub_answer_cache
+from core.state import SqliteStateStore
+
+
+def test_shared_store_expires_entries(tmp_path):
+    db_file = str(tmp_path / "memo.db")
+    store = SqliteStateStore(db_file, table="bot_memo", ttl_seconds=1)
+    writer = SubAnswerCache(version="v1", ttl_seconds=1, store=store)
+    key = writer.key("EPI Specialist", "Quais EPIs para trabalho em altura?")
+    writer.set(key, "Cinturão tipo paraquedista e talabarte")
+
+    # Outra réplica lê pelo backend compartilhado
+    assert SubAnswerCache(version="v1", ttl_seconds=1, store=store).get(key) == "Cinturão tipo paraquedista e talabarte"
+
+    time.sleep(2.1)
+    assert SubAnswerCache(version="v1", ttl_seconds=1, store=store).get(key) is None
+    with sqlite3.connect(db_file) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM bot_memo").fetchone()[0] == 0
+
+
+def test_unread_expired_entries_are_purged(tmp_path):
+    db_file = str(tmp_path / "memo.db")
+    store = SqliteStateStore(db_file, table="bot_memo", ttl_seconds=1)
+    store.set("memo:antiga", {"output": "x", "expires_at": 0})
+    time.sleep(2.1)
+    store._purged_at = 0.0  # Limpeza periódica vencida
+    store.set("memo:nova", {"output": "y", "expires_at": time.time() + 1})
+
+    with sqlite3.connect(db_file) as conn:
+        assert [row[0] for row in conn.execute("SELECT key FROM bot_memo")] == ["memo:nova"]
+
+
+def test_factory_passes_ttl_to_backend(tmp_path, monkeypatch):
+    monkeypatch.setenv("SAFEBOT_MEMO_ENABLED", "true")
+    monkeypatch.setenv("SAFEBOT_MEMO_URL", f"sqlite:///{tmp_path / 'memo.db'}")
+    monkeypatch.setenv("SAFEBOT_MEMO_TTL_SECONDS", "120")
+    cache = create_sub_answer_cache("v1")
+
+    assert cache.ttl_seconds == 120
+    assert cache.store.ttl_seconds == 120
+    assert cache.store.table == "bot_memo"
+
+
+def test_personal_tasks_are_not_cached():
+    cache = SubAnswerCache(version="v1")
+    assert cache.key("EPI Specialist", "Quais EPIs eu preciso na minha obra?") is None
@@ -0,0 +1,223 @@
+"""
+Resiliência das chamadas aos modelos: circuit breaker (meio-aberto e release),
+novas tentativas com Retry-After e prazo, failover e hedging, com chamadas falsas.
+"""
+import time
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from agno.exceptions import ModelProviderError
+
+from core import resilience
+from core.deadline import Deadline, deadline_scope
+from core.metrics import metrics
+from core.resilience import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, ResilientModel, RetryPolicy
+
+LABELS = {"provider": "test", "model": "fake"}
+
+
+@pytest.fixture(autouse=True)
+def fresh_breakers(monkeypatch):
+    monkeypatch.setattr(resilience, "_breakers", {})
+    monkeypatch.setenv("SAFEBOT_LLM_RETRIES", "2")
+    monkeypatch.setenv("SAFEBOT_LLM_BACKOFF_SECONDS", "0.001")
+    monkeypatch.setenv("SAFEBOT_CIRCUIT_FAILURES", "3")
+    monkeypatch.setenv("SAFEBOT_CIRCUIT_OPEN_SECONDS", "30")
+
+
+def provider_error(status, retry_after=None):
+    error = ModelProviderError(f"erro {status}", status_code=status)
+    if retry_after is not None:
+        error.response = SimpleNamespace(headers={"retry-after": str(retry_after)})
+    return error
+
+
+class FakeCall:
+    """Chamada de teste: falha com os erros dados, em ordem, e depois responde"""
+
+    def __init__(self, errors=(), result="ok"):
+        self.errors = list(errors)
+        self.result = result
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return self.result
+
+
+class FakeModel(ResilientModel):
+    resilience_provider = "test"
+
+    def __init__(self, failover=None):
+        self.id = "fake"
+        self.failover = failover
+
+
+def hedges(outcome):
+    return metrics.get_counter("safebot_llm_hedges_total", outcome=outcome, **LABELS)
+
+
+def test_half_open_allows_a_single_probe():
+    breaker = CircuitBreaker("test", "fake", failures=2, open_seconds=0.05)
+    breaker.failure()
+    breaker.failure()
+    assert breaker.state == OPEN and not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()  # Só uma chamada de teste por vez
+
+    breaker.failure()  # Teste falhou: abre de novo
+    assert breaker.state == OPEN and not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.success()
+    assert breaker.state == CLOSED
+    assert breaker.allow() and breaker.allow()
+
+
+def test_non_transient_error_releases_the_probe():
+    model = FakeModel()
+    breaker = resilience.circuit_breaker("test", "fake")
+    breaker.state, breaker.opened_at = OPEN, time.monotonic() - 60
+    call = FakeCall([provider_error(400)])
+
+    with pytest.raises(ModelProviderError):
+        model._resilient(call, FakeCall())
+
+    assert call.calls == 1  # 400 não é repetido
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()  # Sem release o circuito ficaria preso no meio-aberto
+
+
+def test_transient_errors_are_retried_until_success():
+    model = FakeModel()
+    call = FakeCall([provider_error(503), provider_error(429)])
+
+    assert model._resilient(call, FakeCall(result="alternativo")) == "ok"
+    assert call.calls == 3
+    assert resilience.circuit_breaker("test", "fake").failures == 0
+
+
+def test_failover_after_retries_are_exhausted():
+    model = FakeModel(failover=SimpleNamespace(id="fake-mini"))
+    call = FakeCall([provider_error(503)] * 3)
+    failover = FakeCall(result="alternativo")
+
+    assert model._resilient(call, failover) == "alternativo"
+    assert call.calls == 3 and failover.calls == 1
+
+
+def test_failover_when_circuit_is_open():
+    model = FakeModel(failover=SimpleNamespace(id="fake-mini"))
+    breaker = resilience.circuit_breaker("test", "fake")
+    breaker.state, breaker.opened_at = OPEN, time.monotonic()
+    call = FakeCall()
+
+    assert model._resilient(call, FakeCall(result="alternativo")) == "alternativo"
+    assert call.calls == 0
+
+
+def test_open_circuit_without_failover_raises():
+    breaker = resilience.circuit_breaker("test", "fake")
+    breaker.state, breaker.opened_at = OPEN, time.monotonic()
+
+    with pytest.raises(CircuitOpenError):
+        FakeModel()._resilient(FakeCall(), FakeCall())
+
+
+def test_retry_after_is_honoured_and_capped():
+    policy = RetryPolicy(retries=2, base=0.001, cap=8)
+    assert 3 <= policy.delay(0, provider_error(429, retry_after=3)) <= 8
+    assert policy.delay(0, provider_error(429, retry_after=60)) == 8
+
+
+def test_retry_after_beyond_the_deadline_gives_up():
+    policy = RetryPolicy(retries=2, base=0.001, cap=8)
+    with deadline_scope(Deadline(1.0)):
+        assert policy.delay(0, provider_error(429, retry_after=3)) is None
+        assert policy.delay(0, provider_error(503)) is not None
+
+    model = FakeModel()
+    call = FakeCall([provider_error(429, retry_after=5)])
+    with deadline_scope(Deadline(1.0)), pytest.raises(ModelProviderError):
+        model._resilient(call, FakeCall())
+    assert call.calls == 1
+
+
+def sleeper(delays, result=lambda index: index):
+    """Chamada cuja n-ésima execução demora delays[n] e devolve n"""
+    counter = iter(range(len(delays)))
+
+    def call():
+        index = next(counter)
+        time.sleep(delays[index])
+        return result(index)
+
+    return call
+
+
+def test_hedge_not_fired_when_primary_is_fast():
+    fired = hedges("fired")
+    assert resilience._hedged(sleeper([0.0]), 0.2, LABELS) == 0
+    assert hedges("fired") == fired
+
+
+def test_hedge_won_by_backup():
+    fired, won = hedges("fired"), hedges("won")
+    assert resilience._hedged(sleeper([0.5, 0.0]), 0.05, LABELS) == 1
+    assert hedges("fired") == fired + 1
+    assert hedges("won") == won + 1
+
+
+def test_hedge_lost_to_primary():
+    lost = hedges("lost")
+    assert resilience._hedged(sleeper([0.1, 0.5]), 0.05, LABELS) == 0
+    assert hedges("lost") == lost + 1
+
+
+def test_hedge_raises_when_both_fail():
+    def call():
+        time.sleep(0.1)
+        raise provider_error(503)
+
+    with pytest.raises(ModelProviderError):
+        resilience._hedged(call, 0.01, LABELS)
+
+
+def test_async_hedge_won_cancels_primary():
+    async def scenario():
+        calls = []
+
+        async def call():
+            index = len(calls)
+            calls.append(asyncio.current_task())
+            await asyncio.sleep(0.5 if index == 0 else 0.0)
+            return index
+
+        won = hedges("won")
+        result = await resilience._ahedged(call, 0.05, LABELS)
+        await asyncio.sleep(0)
+        return result, hedges("won") - won, calls[0].cancelled()
+
+    assert asyncio.run(scenario()) == (1, 1, True)
+
+
+def test_async_hedge_lost_to_primary():
+    async def scenario():
+        delays = iter([0.1, 0.5])
+
+        async def call():
+            delay = next(delays)
+            await asyncio.sleep(delay)
+            return delay
+
+        lost = hedges("lost")
+        return await resilience._ahedged(call, 0.05, LABELS), hedges("lost") - lost
+
+    assert asyncio.run(scenario()) == (0.1, 1)
@@ -0,0 +1,85 @@
+"""
+Agendador do Telegram: fair share ponderado por plano e validação dos pesos.
+"""
+import asyncio
+
+import pytest
+
+from telegram_bot.scheduler import ChatScheduler, parse_weights
+
+MESSAGES_PER_CHAT = 4
+
+
+def plan_of(chat_id):
+    return "pro" if chat_id >= 100 else "free"
+
+
+def test_parse_weights():
+    assert parse_weights("free:1, pro:3,enterprise") == {"free": 1.0, "pro": 3.0, "enterprise": 1.0}
+
+
+@pytest.mark.parametrize("value", ["free:0,pro:3", "free:-1", "free:nan"])
+def test_parse_weights_rejects_non_positive(value):
+    with pytest.raises(ValueError):
+        parse_weights(value)
+
+
+def test_scheduler_rejects_non_positive_weights():
+    with pytest.raises(ValueError):
+        ChatScheduler(max_in_flight=1, weights={"free": 0.0})
+
+
+def test_weighted_fair_share():
+    """Com um slot e as filas cheias, o plano com peso 3 executa 3 mensagens para cada 1 do peso 1"""
+    order = []
+
+    async def scenario():
+        scheduler = ChatScheduler(
+            max_in_flight=1, notice_threshold=10_000, weights={"free": 1.0, "pro": 3.0}, tenant_resolver=plan_of
+        )
+
+        def job(chat_id):
+            async def run():
+                order.append(plan_of(chat_id))
+                await asyncio.sleep(0)
+                return chat_id
+
+            return run
+
+        chats = [1, 2, 3, 4, 101, 102, 103, 104]
+        submissions = [
+            asyncio.ensure_future(scheduler.submit(chat_id, job(chat_id)))
+            for _ in range(MESSAGES_PER_CHAT)
+            for chat_id in chats
+        ]
+        results = await asyncio.gather(*submissions)
+        assert results == [chat_id for _ in range(MESSAGES_PER_CHAT) for chat_id in chats]
+        assert scheduler.in_flight == 0 and scheduler.queued == 0
+
+    asyncio.run(scenario())
+
+    # A primeira mensagem executa sozinha; depois, enquanto os dois planos têm fila, 3:1
+    contended = order[1:13]
+    assert contended.count("pro") == 9
+    assert contended.count("free") == 3
+    assert len(order) == MESSAGES_PER_CHAT * 8
+
+
+def test_each_chat_keeps_fifo_order():
+    seen = []
+
+    async def scenario():
+        scheduler = ChatScheduler(max_in_flight=4, notice_threshold=10_000, weights={"free": 1.0}, tenant_resolver=plan_of)
+
+        def job(chat_id, n):
+            async def run():
+                seen.append((chat_id, n))
+                await asyncio.sleep(0.001 * (5 - n))
+            return run
+
+        await asyncio.gather(*(scheduler.submit(chat_id, job(chat_id, n)) for n in range(5) for chat_id in (1, 2)))
+
+    asyncio.run(scenario())
+
+    for chat_id in (1, 2):
+        assert [n for c, n in seen if c == chat_id] == list(range(5))
@@ -0,0 +1,94 @@
+"""
+Pesquisa web com cache e prazo (CachedSearch) sobre o StubSearchBackend.
+"""
+import time
+
+from core.search import CachedSearch, StubSearchBackend, query_class
+from core.state import MemoryStateStore
+
+
+class FailingBackend(StubSearchBackend):
+    def text(self, query, max_results):
+        raise RuntimeError("backend fora do ar")
+
+
+class CountingBackend(StubSearchBackend):
+    def __init__(self, delay=0.0):
+        super().__init__(delay=delay)
+        self.calls = 0
+
+    def text(self, query, max_results):
+        self.calls += 1
+        return super().text(query, max_results)
+
+
+def make_search(backend, deadline=2.0):
+    return CachedSearch(backend, MemoryStateStore(), deadline=deadline, ttls={"general": 60, "reference": 60, "recent": 60, "news": 60})
+
+
+def test_miss_then_hit():
+    backend = CountingBackend()
+    search = make_search(backend)
+
+    first = search.search_many(["luvas de vaqueta"], max_results=2)
+    second = search.search_many(["  Luvas   de vaqueta "], max_results=2)
+
+    assert first["luvas de vaqueta"]["status"] == "miss"
+    assert len(first["luvas de vaqueta"]["results"]) == 2
+    assert second["Luvas   de vaqueta"]["status"] == "hit"
+    assert second["Luvas   de vaqueta"]["results"] == first["luvas de vaqueta"]["results"]
+    assert backend.calls == 1
+
+
+def test_queries_run_in_parallel_and_repeated_ones_once():
+    backend = CountingBackend(delay=0.3)
+    search = make_search(backend)
+
+    started = time.monotonic()
+    outcome = search.search_many(["capacete", "botina", "óculos", "capacete"])
+    elapsed = time.monotonic() - started
+
+    assert set(outcome) == {"capacete", "botina", "óculos"}
+    assert all(entry["status"] == "miss" for entry in outcome.values())
+    assert backend.calls == 3
+    assert elapsed < 0.6  # Em série seriam ~0,9s
+
+
+def test_timeout_returns_empty_and_late_result_is_cached():
+    backend = CountingBackend(delay=0.4)
+    search = make_search(backend, deadline=0.1)
+
+    outcome = search.search_many(["protetor auricular"])
+    assert outcome["protetor auricular"] == {"status": "timeout", "results": []}
+
+    time.sleep(0.5)  # O resultado atrasado entra no cache
+    assert search.search_many(["protetor auricular"])["protetor auricular"]["status"] == "hit"
+    assert backend.calls == 1
+
+
+def test_stale_entry_is_used_when_backend_is_slow():
+    search = make_search(CountingBackend(delay=0.4), deadline=0.1)
+    key = search._key("text", "respirador pff2", 5)
+    search.store.set(key, {"query": "respirador pff2", "results": [{"title": "antigo"}], "expires_at": time.time() - 1})
+
+    outcome = search.search_many(["respirador pff2"])
+
+    assert outcome["respirador pff2"] == {"status": "stale", "results": [{"title": "antigo"}]}
+
+
+def test_stale_entry_is_used_when_backend_fails():
+    search = make_search(FailingBackend())
+    key = search._key("text", "cinto paraquedista", 5)
+    search.store.set(key, {"query": "cinto paraquedista", "results": [{"title": "antigo"}], "expires_at": time.time() - 1})
+
+    outcome = search.search_many(["cinto paraquedista", "avental de raspa"])
+
+    assert outcome["cinto paraquedista"]["status"] == "stale"
+    assert outcome["avental de raspa"] == {"status": "error", "results": []}
+
+
+def test_query_class():
+    assert query_class("NR-06 item 6.3") == "reference"
+    assert query_class("novidades em EPI 2025") == "recent"
+    assert query_class("luvas", kind="news") == "news"
+    assert query_class("como limpar capacete") == "general"
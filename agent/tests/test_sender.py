@@ -0,0 +1,155 @@
+"""
+Envio ao Telegram: orçamento por chat e global, reenvio após RetryAfter e
+falha de rede, e nenhum reenvio em BadRequest/Forbidden.
+"""
+import time
+import asyncio
+
+import pytest
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+from telegram_bot.sender import OutboundSender, TokenBucket
+
+
+class FakeSend:
+    """Envio de teste: falha com os erros dados, em ordem, e depois entrega"""
+
+    def __init__(self, log, chat_id, text, errors=()):
+        self.log = log
+        self.chat_id = chat_id
+        self.text = text
+        self.errors = list(errors)
+        self.attempts = 0
+
+    async def __call__(self):
+        self.attempts += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        self.log.append((self.chat_id, self.text, time.monotonic()))
+        return self.text
+
+
+def make_sender(**kwargs):
+    options = {"global_rate": 1000, "chat_rate": 1000, "group_rate": 1000, "max_retries": 3}
+    options.update(kwargs)
+    return OutboundSender(**options)
+
+
+def test_token_bucket_waits_after_burst():
+    bucket = TokenBucket(rate=10, capacity=2)
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == pytest.approx(0.1, abs=0.02)
+
+
+def test_chat_budget_spaces_messages_in_order():
+    log = []
+
+    async def scenario():
+        sender = make_sender(chat_rate=10)  # Rajada de 3, depois 1 a cada 0,1s
+        started = time.monotonic()
+        await asyncio.gather(*(sender.send(1, FakeSend(log, 1, n)) for n in range(5)))
+        return started
+
+    started = asyncio.run(scenario())
+
+    assert [text for _, text, _ in log] == list(range(5))
+    assert log[2][2] - started < 0.05
+    assert log[4][2] - started == pytest.approx(0.2, abs=0.08)
+
+
+def test_group_uses_group_rate():
+    log = []
+
+    async def scenario():
+        sender = make_sender(chat_rate=1000, group_rate=10)
+        started = time.monotonic()
+        await asyncio.gather(*(sender.send(-100, FakeSend(log, -100, n)) for n in range(4)))
+        return time.monotonic() - started
+
+    assert asyncio.run(scenario()) == pytest.approx(0.1, abs=0.06)
+
+
+def test_global_budget_is_shared_by_all_chats():
+    log = []
+
+    async def scenario():
+        sender = make_sender(global_rate=10)  # Rajada de 10 no total, depois 10 msg/s
+        started = time.monotonic()
+        await asyncio.gather(*(sender.send(chat_id, FakeSend(log, chat_id, chat_id)) for chat_id in range(15)))
+        return time.monotonic() - started
+
+    elapsed = asyncio.run(scenario())
+
+    assert len(log) == 15
+    assert elapsed == pytest.approx(0.5, abs=0.15)
+
+
+def test_retry_after_resends_the_same_message():
+    log = []
+    send = FakeSend(log, 1, "resposta", errors=[RetryAfter(0.2)])
+
+    async def scenario():
+        sender = make_sender()
+        started = time.monotonic()
+        result = await sender.send(1, send)
+        return result, time.monotonic() - started
+
+    result, elapsed = asyncio.run(scenario())
+
+    assert result == "resposta"
+    assert send.attempts == 2
+    assert elapsed >= 0.2
+
+
+def test_retry_after_keeps_chat_order():
+    log = []
+
+    async def scenario():
+        sender = make_sender()
+        first = FakeSend(log, 1, "primeira", errors=[RetryAfter(0.1)])
+        await asyncio.gather(sender.send(1, first), sender.send(1, FakeSend(log, 1, "segunda")))
+
+    asyncio.run(scenario())
+
+    assert [text for _, text, _ in log] == ["primeira", "segunda"]
+
+
+def test_network_error_retries_until_limit():
+    log = []
+    recovering = FakeSend(log, 1, "ok", errors=[NetworkError("reset")])
+    failing = FakeSend(log, 2, "perdida", errors=[NetworkError("reset")] * 10)
+
+    async def scenario():
+        sender = make_sender(max_retries=1)
+        assert await sender.send(1, recovering) == "ok"
+        with pytest.raises(RuntimeError):
+            await sender.send(2, failing)
+
+    asyncio.run(scenario())
+
+    assert recovering.attempts == 2
+    assert failing.attempts == 2
+
+
+@pytest.mark.parametrize("error", [BadRequest("Can't parse entities"), Forbidden("bot was blocked by the user")])
+def test_permanent_errors_are_not_retried(error):
+    send = FakeSend([], 1, "x", errors=[error])
+
+    async def scenario():
+        with pytest.raises(type(error)):
+            await make_sender().send(1, send)
+
+    asyncio.run(scenario())
+
+    assert send.attempts == 1
+
+
+def test_not_modified_edit_counts_as_delivered():
+    send = FakeSend([], 1, "x", errors=[BadRequest("Message is not modified")])
+
+    async def scenario():
+        return await make_sender().send(1, send)
+
+    assert asyncio.run(scenario()) is None
+    assert send.attempts == 1
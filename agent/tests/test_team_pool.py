@@ -0,0 +1,63 @@
+"""
+TeamPool: execuções concorrentes de usuários diferentes não compartilham
+sessão, usuário nem histórico, e as instâncias voltam ao pool.
+"""
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+from core.teams import TeamPool, team_session_id
+
+USERS = 6
+TURNS = 3
+
+# Histórico por sessão, como o storage do agno (compartilhado entre instâncias)
+storage = {}
+storage_lock = threading.Lock()
+
+
+class StubTeam:
+    """Team de teste: guarda o contexto da execução no objeto, como o Team do agno"""
+
+    name = "Stub Team"
+    mode = "route"
+
+    def __init__(self):
+        self.session_id = None
+        self.user_id = None
+        self.history = []
+
+    def run(self, message, *, user_id, session_id, **kwargs):
+        self.user_id, self.session_id = user_id, session_id
+        with storage_lock:
+            self.history = list(storage.get(session_id, []))
+        time.sleep(0.05)  # Outras execuções rodam enquanto esta espera o "LLM"
+        seen = SimpleNamespace(user_id=self.user_id, session_id=self.session_id, history=list(self.history))
+        with storage_lock:
+            storage.setdefault(session_id, []).append(message)
+        return seen
+
+
+def test_concurrent_runs_do_not_leak_context():
+    pool = TeamPool(StubTeam, max_size=4)
+
+    def conversation(user):
+        session_id = team_session_id("test", user, "stub")
+        results = []
+        for turn in range(TURNS):
+            results.append((turn, pool.run(f"{user}:{turn}", user_id=str(user), session_id=session_id)))
+        return user, session_id, results
+
+    with ThreadPoolExecutor(max_workers=USERS) as executor:
+        conversations = list(executor.map(conversation, range(USERS)))
+
+    for user, session_id, results in conversations:
+        for turn, seen in results:
+            assert seen.user_id == str(user)
+            assert seen.session_id == session_id
+            assert seen.history == [f"{user}:{previous}" for previous in range(turn)]
+
+    stats = pool.stats()
+    assert stats["created"] <= pool.max_size
+    assert stats["idle"] == stats["created"]
@@ -0,0 +1,105 @@
+"""
+Execuções simultâneas no bot do Telegram: chats diferentes não esperam uns
+pelos outros (AgentExecutor + ChatScheduler), mas o agente de um usuário roda
+uma execução por vez.
+"""
+import time
+import asyncio
+import threading
+from types import SimpleNamespace
+
+from core.state import MemoryStateStore
+from telegram_bot.bot import SafeBotTelegram
+from telegram_bot.coalescer import MessageCoalescer
+
+RUN_SECONDS = 0.5
+CHATS = 6
+
+
+class SlowAgent:
+    """Agente de teste: run síncrono e lento, como uma chamada ao LLM"""
+
+    def run(self, message):
+        time.sleep(RUN_SECONDS)
+        return SimpleNamespace(content=f"resposta: {message}")
+
+
+class CountingAgent(SlowAgent):
+    """Agente de teste que registra quantas execuções rodaram ao mesmo tempo"""
+
+    def __init__(self):
+        self.running = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def run(self, message):
+        with self._lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        try:
+            return super().run(message)
+        finally:
+            with self._lock:
+                self.running -= 1
+
+
+def make_update(chat_id, replies, user_id=None):
+    async def reply_text(text, **kwargs):
+        replies.append((chat_id, text))
+
+    user_id = chat_id if user_id is None else user_id
+    return SimpleNamespace(
+        effective_chat=SimpleNamespace(id=chat_id),
+        effective_user=SimpleNamespace(id=user_id, first_name=f"user{user_id}"),
+        message=SimpleNamespace(text=f"pergunta {chat_id}", message_id=1, reply_text=reply_text),
+    )
+
+
+def make_bot(agent_for):
+    bot = SafeBotTelegram("token", concurrency=CHATS, streaming=False, state_store=MemoryStateStore())
+    bot.coalescer = MessageCoalescer(window=0)
+    bot.get_user_agent = agent_for
+
+    async def send_chat_action(**kwargs):
+        pass
+
+    return bot, SimpleNamespace(bot=SimpleNamespace(send_chat_action=send_chat_action))
+
+
+def test_simultaneous_chats_take_about_one_run():
+    async def scenario():
+        bot, context = make_bot(lambda user_id: SlowAgent())
+        replies = []
+
+        started = time.monotonic()
+        await asyncio.gather(*(bot.handle_message(make_update(chat_id, replies), context) for chat_id in range(CHATS)))
+        elapsed = time.monotonic() - started
+
+        await asyncio.sleep(0.1)  # Entrega das respostas pelo OutboundSender
+        bot.executor.shutdown()
+        return elapsed, replies
+
+    elapsed, replies = asyncio.run(scenario())
+
+    assert sorted(chat_id for chat_id, _ in replies) == list(range(CHATS))
+    assert all(text == f"resposta: pergunta {chat_id}" for chat_id, text in replies)
+    # Em série seriam CHATS * RUN_SECONDS (3s); em paralelo, perto de uma execução
+    assert elapsed < RUN_SECONDS * 2
+
+
+def test_same_user_in_two_chats_runs_one_at_a_time():
+    agent = CountingAgent()
+
+    async def scenario():
+        bot, context = make_bot(lambda user_id: agent)
+        replies = []
+        # Privado (chat 1) e grupo (chat -100) do mesmo usuário
+        await asyncio.gather(*(bot.handle_message(make_update(chat_id, replies, user_id=1), context) for chat_id in (1, -100)))
+        await asyncio.sleep(0.1)
+        bot.executor.shutdown()
+        return replies
+
+    replies = asyncio.run(scenario())
+
+    assert sorted(chat_id for chat_id, _ in replies) == [-100, 1]
+    assert agent.peak == 1
@@ -13,6 +13,15 @@ from dotenv import load_dotenv
 # Importar factory do core
 sys.path.append('..')
 from core.agent import create_web_agent, safebot_factory
+from core.cascade import cascade_stats
+from core.models import http_stats
+from core.resilience import resilience_stats
+from core.prompt import prompt_cache_stats
+from core.deadline import DeadlineMiddleware
+from core.telemetry import instrument_app
+from core.maintenance import start_scheduler_from_env
+from telegram_bot.webhook import mount_from_env
+from core.memory import get_memory_extraction_queue
 
 # Carregar variáveis de ambiente
 load_dotenv()
@@ -24,7 +33,13 @@ class SafeBotWebApp:
         self.agents = self._create_specialized_agents()
         self.playground = Playground(agents=self.agents)
         self.app = self.playground.get_app()
+        # Prazo por requisição abaixo do proxy_read_timeout do nginx; cancela ao desconectar
+        self.app.add_middleware(DeadlineMiddleware)
+        # /metrics no formato do Prometheus e medição das requisições
+        instrument_app(self.app, "web")
         self._setup_endpoints()
+        # Webhook do bot Telegram no mesmo processo (SAFEBOT_TELEGRAM_WEBHOOK=agent)
+        self.telegram_webhook = mount_from_env(self.app, "agent")
     
     def _create_specialized_agents(self) -> List[Agent]:
         """Cria todos os agentes especializados para a interface web"""
@@ -99,7 +114,8 @@ class SafeBotWebApp:
                 "CONTROLES: Inclua indicadores e formas de monitoramento"
             ],
             table_name="procedure_web",
-            tools=[PythonTools()]  # Para cálculos e formatação
+            tools=[PythonTools()],  # Para cálculos e formatação
+            cascade_target="web.procedure",
         )
         agents.append(procedure)
         
@@ -117,6 +133,11 @@ class SafeBotWebApp:
                 "agents_count": len(self.agents),
                 "knowledge_base": "loaded",
                 "memory_enabled": True,
+                "memory_queue": get_memory_extraction_queue().stats(),
+                "model_cascade": cascade_stats(),
+                "prompt_cache": prompt_cache_stats(),
+                "http_pool": http_stats(),
+                "llm": resilience_stats(),
                 "version": "2.0.0"
             }
         
@@ -181,6 +202,9 @@ def main():
         print("⚠️ Arquivo da NR-06 não encontrado!")
         print("A aplicação funcionará, mas sem a base de conhecimento completa.")
     
+    # Manutenção periódica opcional (SAFEBOT_MAINTENANCE_INTERVAL_HOURS)
+    start_scheduler_from_env()
+    
     try:
         # Criar aplicação
         web_app = create_app()
@@ -14,6 +14,14 @@ from dotenv import load_dotenv
 # Importar factory do core
 sys.path.append('..')
 from core.teams import SafeBotTeamsFactory
+from core.cascade import cascade_stats
+from core.models import http_stats
+from core.resilience import resilience_stats
+from core.prompt import prompt_cache_stats
+from core.deadline import DeadlineMiddleware
+from core.telemetry import instrument_app
+from core.maintenance import start_scheduler_from_env
+from telegram_bot.webhook import mount_from_env
 
 # Carregar variáveis de ambiente
 load_dotenv()
@@ -31,7 +39,13 @@ class SafeBotTeamsWebApp:
             app_id="safebot-nr06-playground"
         )
         self.app = self.playground.get_app()
+        # Prazo por requisição abaixo do proxy_read_timeout do nginx; cancela ao desconectar
+        self.app.add_middleware(DeadlineMiddleware)
+        # /metrics no formato do Prometheus e medição das requisições
+        instrument_app(self.app, "web-teams")
         self._setup_endpoints()
+        # Webhook do bot Telegram no mesmo processo (SAFEBOT_TELEGRAM_WEBHOOK=teams)
+        self.telegram_webhook = mount_from_env(self.app, "teams")
     
     def _create_teams(self) -> List[Team]:
         """Cria team único que roteia para agentes especializados"""
@@ -56,6 +70,10 @@ class SafeBotTeamsWebApp:
                 "teams_count": len(self.teams),
                 "knowledge_base": "loaded",
                 "memory_enabled": True,
+                "model_cascade": cascade_stats(),
+                "prompt_cache": prompt_cache_stats(),
+                "http_pool": http_stats(),
+                "llm": resilience_stats(),
                 "version": "2.0.0-teams"
             }
         
@@ -132,6 +150,9 @@ def main():
         print("⚠️ Arquivo da NR-06 não encontrado!")
         print("A aplicação funcionará, mas sem a base de conhecimento completa.")
     
+    # Manutenção periódica opcional (SAFEBOT_MAINTENANCE_INTERVAL_HOURS)
+    start_scheduler_from_env()
+    
     try:
         # Criar aplicação
         web_app = create_app()